@@ -0,0 +1,219 @@
+import gzip
+import os
+import shutil
+import sqlite3
+import threading
+import time
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional
+from config import (
+    DATABASE_PATH, DB_BUSY_TIMEOUT_MS, BACKUP_DIR, BACKUP_INTERVAL_HOURS, BACKUP_KEEP, BACKUP_MAX_AGE_DAYS,
+    BACKUP_PAGES_PER_STEP, BACKUP_STEP_SLEEP_MS, BACKUP_COMPRESSION
+)
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+BACKUP_PREFIX = "baby_bottle_tracker_backup_"
+# Older backups were plain .db copies; keep them in the rotation
+BACKUP_SUFFIXES = (".db", ".db.gz", ".db.zst")
+
+# A write from another connection makes a stepped backup start over; after this
+# many restarts the copy is finished in one step (a WAL read snapshot, writers are not blocked)
+MAX_BACKUP_RESTARTS = 5
+
+class _TooManyRestarts(Exception):
+    pass
+
+# Result of the last run (see get_last_backup_stats)
+_last_stats: Optional[Dict] = None
+
+_scheduler: Optional[threading.Thread] = None
+_stop_event = threading.Event()
+
+def _compression() -> str:
+    """Resolve BACKUP_COMPRESSION to zstd, gzip or none"""
+    mode = BACKUP_COMPRESSION.lower()
+    if mode == "auto":
+        return "zstd" if zstandard is not None else "gzip"
+    if mode == "zstd" and zstandard is None:
+        print("zstandard is not installed, falling back to gzip backups")
+        return "gzip"
+    if mode not in ("zstd", "gzip", "none"):
+        print(f"Unknown BACKUP_COMPRESSION={BACKUP_COMPRESSION}, using gzip")
+        return "gzip"
+    return mode
+
+def _compress(source_path: str, compression: str) -> str:
+    """Compress a backup file in place and return the new path"""
+    if compression == "zstd":
+        target_path = source_path + ".zst"
+        with open(source_path, "rb") as src, open(target_path, "wb") as dst:
+            zstandard.ZstdCompressor(level=10).copy_stream(src, dst)
+    elif compression == "gzip":
+        target_path = source_path + ".gz"
+        with open(source_path, "rb") as src, gzip.open(target_path, "wb", compresslevel=6) as dst:
+            shutil.copyfileobj(src, dst)
+    else:
+        return source_path
+    os.remove(source_path)
+    return target_path
+
+def list_backups() -> List[str]:
+    """Backup file names, newest first"""
+    if not os.path.isdir(BACKUP_DIR):
+        return []
+    files = [f for f in os.listdir(BACKUP_DIR) if f.startswith(BACKUP_PREFIX) and f.endswith(BACKUP_SUFFIXES)]
+    # Names embed the timestamp, so sorting by name sorts by date
+    return sorted(files, reverse=True)
+
+def prune_backups() -> int:
+    """Apply retention: keep BACKUP_KEEP files and drop those older than BACKUP_MAX_AGE_DAYS"""
+    removed = 0
+    cutoff = time.time() - BACKUP_MAX_AGE_DAYS * 86400 if BACKUP_MAX_AGE_DAYS > 0 else None
+    for index, name in enumerate(list_backups()):
+        path = os.path.join(BACKUP_DIR, name)
+        too_many = index >= max(1, BACKUP_KEEP)
+        too_old = cutoff is not None and index > 0 and os.path.getmtime(path) < cutoff
+        if too_many or too_old:
+            try:
+                os.remove(path)
+                removed += 1
+                print(f"Removed old backup: {name}")
+            except Exception as e:
+                print(f"Failed to remove old backup {name}: {e}")
+    return removed
+
+def create_backup() -> Optional[Dict]:
+    """Take a consistent online backup with the SQLite backup API, compress it and apply retention.
+
+    The copy is made from a dedicated read-only connection, BACKUP_PAGES_PER_STEP
+    pages at a time with BACKUP_STEP_SLEEP_MS between steps, so writers on the
+    pool keep going while it runs. Returns the run metrics, or None on failure.
+    """
+    global _last_stats
+    if not os.path.exists(DATABASE_PATH):
+        print("Database file not found, skipping backup")
+        return None
+
+    os.makedirs(BACKUP_DIR, exist_ok=True)
+    timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+    raw_path = os.path.join(BACKUP_DIR, f"{BACKUP_PREFIX}{timestamp}.db")
+    partial_path = raw_path + ".partial"
+    steps = 0
+    restarts = 0
+    last_remaining = None
+
+    def progress(status, remaining, total):
+        nonlocal steps, restarts, last_remaining
+        steps += 1
+        if last_remaining is not None and remaining > last_remaining:
+            restarts += 1
+            if restarts > MAX_BACKUP_RESTARTS:
+                raise _TooManyRestarts()
+        last_remaining = remaining
+
+    started = time.perf_counter()
+    try:
+        source = sqlite3.connect(f"file:{DATABASE_PATH}?mode=ro", uri=True, timeout=DB_BUSY_TIMEOUT_MS / 1000)
+        target = sqlite3.connect(partial_path)
+        try:
+            try:
+                source.backup(target, pages=BACKUP_PAGES_PER_STEP, progress=progress,
+                              sleep=BACKUP_STEP_SLEEP_MS / 1000)
+            except _TooManyRestarts:
+                source.backup(target, pages=-1)
+            integrity = target.execute("PRAGMA quick_check").fetchone()[0]
+            page_count = target.execute("PRAGMA page_count").fetchone()[0]
+        finally:
+            target.close()
+            source.close()
+
+        if integrity != "ok":
+            raise RuntimeError(f"backup failed quick_check: {integrity}")
+
+        os.replace(partial_path, raw_path)
+        db_bytes = os.path.getsize(raw_path)
+        copied = time.perf_counter()
+
+        compression = _compression()
+        backup_path = _compress(raw_path, compression)
+        finished = time.perf_counter()
+
+        stats = {
+            'path': backup_path,
+            'compression': compression,
+            'pages': page_count,
+            'steps': steps,
+            'restarts': restarts,
+            'db_bytes': db_bytes,
+            'backup_bytes': os.path.getsize(backup_path),
+            'copy_seconds': round(copied - started, 3),
+            'compress_seconds': round(finished - copied, 3),
+            'duration_seconds': round(finished - started, 3),
+            'finished_at': datetime.now().isoformat(),
+        }
+        stats['removed'] = prune_backups()
+        _last_stats = stats
+
+        ratio = stats['backup_bytes'] / db_bytes if db_bytes else 0
+        print(f"Database backup created: {backup_path} ({db_bytes / 1024:.0f} KiB -> "
+              f"{stats['backup_bytes'] / 1024:.0f} KiB, {ratio:.0%}, {page_count} pages in {steps} steps/{restarts} restarts, "
+              f"copy {stats['copy_seconds']}s + {compression} {stats['compress_seconds']}s)")
+        return stats
+    except Exception as e:
+        print(f"Error creating database backup: {e}")
+        for path in (partial_path, raw_path):
+            if os.path.exists(path):
+                os.remove(path)
+        return None
+
+def get_last_backup_stats() -> Optional[Dict]:
+    """Metrics of the last backup taken by this process"""
+    return _last_stats
+
+def _seconds_until_next_backup() -> float:
+    """Time left before the newest backup is BACKUP_INTERVAL_HOURS old"""
+    backups = list_backups()
+    if not backups:
+        return 0
+    newest = os.path.getmtime(os.path.join(BACKUP_DIR, backups[0]))
+    due = newest + timedelta(hours=BACKUP_INTERVAL_HOURS).total_seconds()
+    return max(0, due - time.time())
+
+def _backup_loop(initial_delay: float):
+    if _stop_event.wait(initial_delay):
+        return
+    while True:
+        wait = _seconds_until_next_backup()
+        if wait > 0:
+            if _stop_event.wait(wait):
+                return
+            continue
+        create_backup()
+        # Even if the backup failed, do not retry in a tight loop
+        if _stop_event.wait(min(3600, timedelta(hours=BACKUP_INTERVAL_HOURS).total_seconds())):
+            return
+
+def start_backup_scheduler(initial_delay: float = 60):
+    """Start the background backup thread (no-op if it is already running or disabled)"""
+    global _scheduler
+    if BACKUP_INTERVAL_HOURS <= 0:
+        print("Scheduled backups disabled (BACKUP_INTERVAL_HOURS <= 0)")
+        return
+    if _scheduler is not None and _scheduler.is_alive():
+        return
+    _stop_event.clear()
+    _scheduler = threading.Thread(target=_backup_loop, args=(initial_delay,), name="backup", daemon=True)
+    _scheduler.start()
+    print(f"Backup scheduler started: every {BACKUP_INTERVAL_HOURS}h into {BACKUP_DIR}, keeping {BACKUP_KEEP}")
+
+def stop_backup_scheduler(timeout: float = 30):
+    """Stop the background backup thread, letting a running backup finish"""
+    global _scheduler
+    _stop_event.set()
+    if _scheduler is not None:
+        _scheduler.join(timeout)
+        _scheduler = None
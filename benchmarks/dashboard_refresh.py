@@ -0,0 +1,121 @@
+"""Per-refresh latency of the main dashboard: legacy multi-query path vs single statement vs cached snapshot.
+
+Usage: python benchmarks/dashboard_refresh.py [--groups 500] [--entries 300] [--refreshes 5000]
+
+The legacy path is what get_main_message_content_for_user used to run on every
+refresh, without any cache: the membership, group row, entries, poop and
+user_messages queries plus the language query. The single path reads the same
+data in one statement (the fallback of get_dashboard_snapshot). The cached path
+is get_dashboard_snapshot in steady state: group and language caches, no
+writes in between. All must render the same message (checked first); the
+timed part is the data fetch, since building the keyboard costs the same either way.
+"""
+import argparse
+import os
+import random
+import statistics
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# Point the bot at a throwaway database before config is imported
+_tmpdir = tempfile.mkdtemp(prefix="bench_")
+os.environ["DATABASE_PATH"] = os.path.join(_tmpdir, "bench.db")
+
+import database  # noqa: E402
+from migrations import run_migrations  # noqa: E402
+from handlers.queries import get_main_message_content  # noqa: E402
+
+
+def seed(groups: int, entries: int):
+    run_migrations()
+    now = datetime.now(database.UTC)
+    with database._writer() as conn:
+        for g in range(1, groups + 1):
+            conn.execute("INSERT INTO groups (id, name, users) VALUES (?, ?, ?)", (g, f"group_{g}", f"[{g}]"))
+            conn.execute("INSERT INTO group_members (user_id, group_id) VALUES (?, ?)", (g, g))
+            conn.execute("INSERT INTO languages (user_id, language) VALUES (?, 'fr')", (g,))
+            conn.execute("INSERT INTO user_messages (group_id, user_id, main_message_id, main_chat_id) VALUES (?, ?, ?, ?)",
+                         (g, g, 1000 + g, g))
+            times = [now - timedelta(hours=3 * i) for i in range(entries)]
+            conn.executemany(
+                "INSERT INTO entries (group_id, amount, time, ts) VALUES (?, ?, ?, ?)",
+                [(g, 120, moment.isoformat(), int(moment.timestamp())) for moment in times],
+            )
+            conn.executemany(
+                "INSERT INTO poop (group_id, time, ts, info) VALUES (?, ?, ?, ?)",
+                [(g, moment.isoformat(), int(moment.timestamp()), None) for moment in times[::8]],
+            )
+
+
+def legacy_fetch(user_id: int):
+    # Bypass the caches added since: every refresh went to SQLite
+    database._user_group_cache.pop(user_id)
+    group_data = database._load_group_snapshot(database.get_user_group_id(user_id))
+    return database._copy_group_snapshot(group_data, user_id), database._load_language(user_id)
+
+
+def single_fetch(user_id: int):
+    return database._load_dashboard_snapshot(user_id)
+
+
+def snapshot_fetch(user_id: int):
+    return database.get_dashboard_snapshot(user_id)
+
+
+def legacy_render(user_id: int) -> str:
+    group_data, language = legacy_fetch(user_id)
+    return get_main_message_content({str(group_data['id']): group_data}, str(group_data['id']), language)[0]
+
+
+def snapshot_render(user_id: int, fetch=snapshot_fetch) -> str:
+    snapshot = fetch(user_id)
+    return get_main_message_content(snapshot.as_group_data(), str(snapshot.group_id), snapshot.language)[0]
+
+
+def bench(users: list, paths: dict):
+    # Interleave the paths so cache and GC effects hit both equally
+    samples = {label: [] for label in paths}
+    for user_id in users:
+        for label, fetch in paths.items():
+            started = time.perf_counter()
+            fetch(user_id)
+            samples[label].append((time.perf_counter() - started) * 1000)
+    means = {}
+    for label, values in samples.items():
+        values.sort()
+        p95 = values[int(len(values) * 0.95) - 1]
+        means[label] = statistics.mean(values)
+        print(f"{label:<10} mean {means[label]:7.3f} ms  p50 {statistics.median(values):7.3f} ms  "
+              f"p95 {p95:7.3f} ms  max {values[-1]:7.3f} ms")
+    return means
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--groups", type=int, default=500)
+    parser.add_argument("--entries", type=int, default=300)
+    parser.add_argument("--refreshes", type=int, default=5000)
+    args = parser.parse_args()
+
+    print(f"Seeding {args.groups} groups x {args.entries} entries into {os.environ['DATABASE_PATH']}")
+    seed(args.groups, args.entries)
+
+    rng = random.Random(42)
+    users = [rng.randint(1, args.groups) for _ in range(args.refreshes)]
+    # Same rendered dashboard; this also warms the page cache for both paths
+    for user_id in users[:200]:
+        assert legacy_render(user_id) == snapshot_render(user_id, single_fetch) == snapshot_render(user_id), user_id
+
+    print(f"{args.refreshes} dashboard data fetches")
+    means = bench(users, {"legacy": legacy_fetch, "single": single_fetch, "cached": snapshot_fetch})
+    print(f"speedup vs legacy: single x{means['legacy'] / means['single']:.2f}, "
+          f"cached x{means['legacy'] / means['cached']:.2f}")
+    database.close_db_connection()
+
+
+if __name__ == "__main__":
+    main()
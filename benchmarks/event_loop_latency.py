@@ -0,0 +1,119 @@
+"""Event-loop latency under concurrent updates: direct sqlite calls vs database_async.
+
+Usage: python benchmarks/event_loop_latency.py [--groups 200] [--entries 300] [--updates 400]
+
+A heartbeat coroutine sleeps for a fixed tick and records how late it wakes up
+while simulated updates hammer the database. With the synchronous functions every
+query runs on the event loop, so the heartbeat (i.e. every other chat) stalls;
+with the async facade the queries run on the database executor instead.
+"""
+import argparse
+import asyncio
+import os
+import random
+import statistics
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# Point the bot at a throwaway database before config is imported
+_tmpdir = tempfile.mkdtemp(prefix="bench_")
+os.environ["DATABASE_PATH"] = os.path.join(_tmpdir, "bench.db")
+
+import database  # noqa: E402
+import database_async  # noqa: E402
+from migrations import run_migrations  # noqa: E402
+
+TICK = 0.005
+
+
+def seed(groups: int, entries: int):
+    run_migrations()
+    now = datetime.now(database.UTC)
+    with database._writer() as conn:
+        for g in range(1, groups + 1):
+            conn.execute("INSERT INTO groups (id, name, users) VALUES (?, ?, ?)", (g, f"group_{g}", f"[{g}]"))
+            conn.execute("INSERT INTO group_members (user_id, group_id) VALUES (?, ?)", (g, g))
+            times = [now - timedelta(hours=3 * i) for i in range(entries)]
+            conn.executemany(
+                "INSERT INTO entries (group_id, amount, time, ts) VALUES (?, ?, ?, ?)",
+                [(g, 120, moment.isoformat(), int(moment.timestamp())) for moment in times],
+            )
+
+
+async def heartbeat(samples: list, stop: asyncio.Event):
+    while not stop.is_set():
+        start = time.perf_counter()
+        await asyncio.sleep(TICK)
+        samples.append((time.perf_counter() - start - TICK) * 1000)
+
+
+async def simulated_update(user_id: int, use_async: bool):
+    """Roughly what a bottle button press does: lookup, write, refresh, occasional admin scan"""
+    if use_async:
+        await database_async.get_language(user_id)
+        group_id = await database_async.get_user_group_id(user_id)
+        await database_async.add_entry_to_group(group_id, 90, datetime.now())
+        await database_async.get_group_data_for_user(user_id)
+        if user_id % 50 == 0:
+            await database_async.get_all_groups()
+    else:
+        database.get_language(user_id)
+        group_id = database.get_user_group_id(user_id)
+        database.add_entry_to_group(group_id, 90, datetime.now())
+        database.get_group_data_for_user(user_id)
+        if user_id % 50 == 0:
+            database.get_all_groups()
+        await asyncio.sleep(0)
+
+
+async def run(use_async: bool, groups: int, updates: int, concurrency: int):
+    samples = []
+    stop = asyncio.Event()
+    beat = asyncio.create_task(heartbeat(samples, stop))
+    sem = asyncio.Semaphore(concurrency)
+    rng = random.Random(42)
+
+    async def one(user_id):
+        async with sem:
+            await simulated_update(user_id, use_async)
+
+    started = time.perf_counter()
+    await asyncio.gather(*(one(rng.randint(1, groups)) for _ in range(updates)))
+    elapsed = time.perf_counter() - started
+    stop.set()
+    await beat
+    return samples, elapsed
+
+
+def report(label: str, samples: list, elapsed: float, updates: int):
+    samples = sorted(samples) or [0.0]
+    p95 = samples[min(len(samples) - 1, int(len(samples) * 0.95))]
+    print(f"{label:<7} loop lag p50={statistics.median(samples):7.2f}ms p95={p95:7.2f}ms "
+          f"max={samples[-1]:8.2f}ms  heartbeats={len(samples):5d}  "
+          f"{updates / elapsed:7.1f} updates/s")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--groups", type=int, default=200)
+    parser.add_argument("--entries", type=int, default=100, help="entries per group")
+    parser.add_argument("--updates", type=int, default=400)
+    parser.add_argument("--concurrency", type=int, default=20)
+    args = parser.parse_args()
+
+    seed(args.groups, args.entries)
+    print(f"Database: {os.environ['DATABASE_PATH']} ({args.groups} groups x {args.entries} entries)")
+    for label, use_async in (("before", False), ("after", True)):
+        samples, elapsed = asyncio.run(run(use_async, args.groups, args.updates, args.concurrency))
+        report(label, samples, elapsed, args.updates)
+
+    database_async.shutdown_executor()
+    database.close_db_connection()
+
+
+if __name__ == "__main__":
+    main()
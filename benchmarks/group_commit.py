@@ -0,0 +1,92 @@
+"""Burst write throughput: one commit per write vs the group-commit queue.
+
+Usage: python benchmarks/group_commit.py [--handlers 200] [--poops 4] [--synchronous FULL]
+
+Simulates a burst of concurrent handlers, each adding a bottle and the poops of
+its members (what the Shabbat catch-up does), all awaiting durability. Runs once with the plain executor mirrors (every write
+commits on its own) and once through database_async's group commit, and counts
+the transactions each needed. With synchronous=FULL every commit is an fsync.
+"""
+import argparse
+import asyncio
+import os
+import sys
+import tempfile
+import time
+from contextlib import contextmanager
+from datetime import datetime
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+parser.add_argument("--handlers", type=int, default=200)
+parser.add_argument("--poops", type=int, default=4)
+parser.add_argument("--synchronous", default="FULL", help="PRAGMA synchronous for the run (FULL: fsync per commit)")
+args = parser.parse_args()
+
+# Point the bot at a throwaway database before config is imported
+_tmpdir = tempfile.mkdtemp(prefix="bench_")
+os.environ["DATABASE_PATH"] = os.path.join(_tmpdir, "bench.db")
+os.environ["DB_SYNCHRONOUS"] = args.synchronous
+os.environ["DB_QUERY_STATS"] = "false"
+
+import database  # noqa: E402
+import database_async  # noqa: E402
+from migrations import run_migrations  # noqa: E402
+
+commits = 0
+_writer = database.ConnectionPool.writer
+
+
+@contextmanager
+def count_commits(pool):
+    """Count outermost writer blocks: each one is a transaction, hence a commit"""
+    global commits
+    with _writer(pool) as conn:
+        if pool._writer_depth == 1:
+            commits += 1
+        yield conn
+
+
+database.ConnectionPool.writer = count_commits
+
+
+def seed(groups: int):
+    with database._writer() as conn:
+        for g in range(1, groups + 1):
+            conn.execute("INSERT INTO groups (id, name, users) VALUES (?, ?, '[]')", (g, f"family {g}"))
+
+
+async def handler(group_id: int, poops: int, add_entry, add_poop):
+    # Bottle first, then the poops written together
+    await add_entry(group_id, 120, datetime.now(database.UTC))
+    await asyncio.gather(*[add_poop(group_id, datetime.now(database.UTC)) for _ in range(poops)])
+
+
+async def burst(label: str, add_entry, add_poop):
+    global commits
+    commits = 0
+    started = time.perf_counter()
+    await asyncio.gather(*[handler(g, args.poops, add_entry, add_poop) for g in range(1, args.handlers + 1)])
+    elapsed = time.perf_counter() - started
+    writes = args.handlers * (1 + args.poops)
+    print(f"{label:<13} {writes} writes in {elapsed * 1000:8.1f} ms  ({writes / elapsed:8.0f} writes/s)  "
+          f"{commits:5d} transactions")
+    return elapsed, commits
+
+
+async def main():
+    run_migrations()
+    seed(args.handlers)
+    print(f"{args.handlers} concurrent handlers x (1 bottle + {args.poops} poops), "
+          f"synchronous={args.synchronous}")
+    direct = await burst("per-write", database_async._async(database.add_entry_to_group),
+                         database_async._async(database.add_poop_to_group))
+    grouped = await burst("group commit", database_async.add_entry_to_group, database_async.add_poop_to_group)
+    await database_async.close_write_queue()
+    print(f"x{direct[0] / grouped[0]:.1f} faster, x{direct[1] / max(1, grouped[1]):.0f} fewer commits")
+    database.close_db_connection()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,100 @@
+"""Dashboard fan-out after a change: sequential edits vs the bounded concurrent fan-out.
+
+Usage: python benchmarks/group_fanout.py [--members 1,5,20,50] [--edit-ms 60] [--concurrency 8]
+
+Each member of a group has a dashboard; a fake bot answers edit_message_text after
+--edit-ms (a Telegram round trip). For each group size, times how long the
+handler that made the change waits (caller) and how long until every dashboard is
+edited (done), with GROUP_FANOUT_CONCURRENCY=1 (one edit at a time, the old
+behaviour) and with --concurrency.
+"""
+import argparse
+import asyncio
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+parser.add_argument("--members", default="1,5,20,50", help="comma-separated group sizes")
+parser.add_argument("--edit-ms", type=float, default=60)
+parser.add_argument("--concurrency", type=int, default=8)
+args = parser.parse_args()
+
+# Point the bot at a throwaway database before config is imported
+_tmpdir = tempfile.mkdtemp(prefix="bench_")
+os.environ["DATABASE_PATH"] = os.path.join(_tmpdir, "bench.db")
+os.environ["DB_QUERY_STATS"] = "false"
+
+import database  # noqa: E402
+import utils  # noqa: E402
+from migrations import run_migrations  # noqa: E402
+
+
+class FakeBot:
+    async def edit_message_text(self, **kwargs):
+        await asyncio.sleep(args.edit_ms / 1000)
+
+
+class FakeApplication:
+    def __init__(self):
+        self.tasks = []
+
+    def create_task(self, coroutine, name=None):
+        task = asyncio.get_running_loop().create_task(coroutine, name=name)
+        self.tasks.append(task)
+        return task
+
+
+class FakeContext:
+    def __init__(self):
+        self.bot = FakeBot()
+        self.application = FakeApplication()
+
+
+def seed(sizes):
+    with database._writer() as conn:
+        for group_id, members in enumerate(sizes, start=1):
+            conn.execute("INSERT INTO groups (id, name, users) VALUES (?, ?, '[]')", (group_id, f"family {group_id}"))
+            for m in range(members):
+                user_id = group_id * 1000 + m
+                conn.execute("INSERT INTO group_members (user_id, group_id) VALUES (?, ?)", (user_id, group_id))
+                database.set_user_message_info(group_id, user_id, 10 + m, user_id)
+    database.flush_message_locations()
+
+
+async def fan_out(group_id: int, concurrency: int):
+    utils.GROUP_FANOUT_CONCURRENCY = concurrency
+    utils._fanout_semaphore = None
+    # One change per run: time the fan-out itself, not the debounce window
+    utils.GROUP_REFRESH_DEBOUNCE_MS = 0
+    context = FakeContext()
+    started = time.perf_counter()
+    # The caller itself is not a recipient: pass a user outside the group
+    await utils.update_all_group_messages(context, group_id, "dashboard", None, caller_user_id=-1)
+    caller = time.perf_counter() - started
+    await asyncio.gather(*context.application.tasks)
+    return caller * 1000, (time.perf_counter() - started) * 1000
+
+
+async def main():
+    sizes = [int(size) for size in args.members.split(",")]
+    run_migrations()
+    seed(sizes)
+    # The per-recipient lines would drown the table
+    utils.print = lambda *a, **k: None
+    print(f"edit_message_text = {args.edit_ms:.0f} ms")
+    print(f"{'members':>8} {'sequential done':>16} {f'x{args.concurrency} caller':>12} {f'x{args.concurrency} done':>10}")
+    for group_id, members in enumerate(sizes, start=1):
+        _, sequential = await fan_out(group_id, 1)
+        caller, done = await fan_out(group_id, args.concurrency)
+        print(f"{members:>8} {sequential:>13.0f} ms {caller:>9.1f} ms {done:>7.0f} ms")
+    del utils.print
+    print(utils.get_fanout_stats())
+    database.close_db_connection()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,93 @@
+"""Cost of the query instrumentation, and what its summary shows for get_all_groups.
+
+Usage: python benchmarks/query_stats_overhead.py [--groups 200] [--entries 30] [--fetches 5000]
+
+Times get_dashboard_snapshot and get_user_group_id with plain pooled connections
+and with query_stats.InstrumentedConnection, interleaved in rounds, then prints the
+per-statement summary of one get_all_groups call: the per-group queries show up
+as fingerprints called once per group.
+"""
+import argparse
+import os
+import random
+import statistics
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# Point the bot at a throwaway database before config is imported; never log slow queries here
+_tmpdir = tempfile.mkdtemp(prefix="bench_")
+os.environ["DATABASE_PATH"] = os.path.join(_tmpdir, "bench.db")
+os.environ["DB_SLOW_QUERY_MS"] = "1e9"
+
+import database  # noqa: E402
+import query_stats  # noqa: E402
+from migrations import run_migrations  # noqa: E402
+
+
+def seed(groups: int, entries: int):
+    now = datetime.now(database.UTC)
+    times = [now - timedelta(hours=3 * i) for i in range(entries)]
+    with database._writer() as conn:
+        for g in range(1, groups + 1):
+            conn.execute("INSERT INTO groups (id, name, users) VALUES (?, ?, ?)", (g, f"family {g}", f"[{g}]"))
+            conn.execute("INSERT INTO group_members (user_id, group_id) VALUES (?, ?)", (g, g))
+            conn.executemany(
+                "INSERT INTO entries (group_id, amount, time, ts) VALUES (?, ?, ?, ?)",
+                [(g, 120, moment.isoformat(), int(moment.timestamp())) for moment in times],
+            )
+
+
+def use_instrumentation(enabled: bool):
+    """Reopen the pool with or without the instrumented connection class"""
+    database.close_db_connection()
+    database.DB_QUERY_STATS = enabled
+
+
+def fetch(users: list):
+    for user_id in users:
+        database.get_dashboard_snapshot(user_id)
+        database._user_group_cache.clear()  # time the query, not the cache
+        database.get_user_group_id(user_id)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--groups", type=int, default=200)
+    parser.add_argument("--entries", type=int, default=30)
+    parser.add_argument("--fetches", type=int, default=5000)
+    parser.add_argument("--rounds", type=int, default=10)
+    args = parser.parse_args()
+
+    run_migrations()
+    seed(args.groups, args.entries)
+    rng = random.Random(42)
+    users = [rng.randint(1, args.groups) for _ in range(args.fetches)]
+    per_round = max(1, args.fetches // args.rounds)
+
+    samples = {False: [], True: []}
+    for start in range(0, len(users), per_round):
+        chunk = users[start:start + per_round]
+        for enabled in (False, True):
+            use_instrumentation(enabled)
+            fetch(chunk[:10])  # open the connections outside the timed part
+            started = time.perf_counter()
+            fetch(chunk)
+            samples[enabled].append((time.perf_counter() - started) * 1e6 / (2 * len(chunk)))
+    plain, instrumented = statistics.median(samples[False]), statistics.median(samples[True])
+    print(f"{args.fetches} x (get_dashboard_snapshot + get_user_group_id), median of {len(samples[True])} rounds")
+    print(f"  plain        {plain:8.1f} us/query")
+    print(f"  instrumented {instrumented:8.1f} us/query  (+{instrumented - plain:.1f} us, x{instrumented / plain:.2f})")
+
+    query_stats.reset_query_stats()
+    database.get_all_groups()
+    print(f"\nOne get_all_groups() call over {args.groups} groups:")
+    print(query_stats.format_query_stats(limit=8, sort_by="calls"))
+    database.close_db_connection()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,110 @@
+"""Dashboard refreshes during a burst of changes: one fan-out per change vs the debounced refresh.
+
+Usage: python benchmarks/refresh_coalescing.py [--members 10] [--changes 8] [--gap-ms 100] [--edit-ms 60] [--debounce-ms 500]
+
+Members of one group log --changes events, --gap-ms apart (each from another
+member, as when parents log back to back). A fake bot answers edit_message_text
+after --edit-ms. Counts the dashboard edits sent, and times from the first change
+until every dashboard shows the last one, with GROUP_REFRESH_DEBOUNCE_MS=0 (a
+fan-out per change, the old behaviour) and with --debounce-ms.
+"""
+import argparse
+import asyncio
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+parser.add_argument("--members", type=int, default=10)
+parser.add_argument("--changes", type=int, default=8)
+parser.add_argument("--gap-ms", type=float, default=100)
+parser.add_argument("--edit-ms", type=float, default=60)
+parser.add_argument("--debounce-ms", type=float, default=500)
+args = parser.parse_args()
+
+# Point the bot at a throwaway database before config is imported
+_tmpdir = tempfile.mkdtemp(prefix="bench_")
+os.environ["DATABASE_PATH"] = os.path.join(_tmpdir, "bench.db")
+os.environ["DB_QUERY_STATS"] = "false"
+
+import database  # noqa: E402
+import utils  # noqa: E402
+from migrations import run_migrations  # noqa: E402
+
+GROUP_ID = 1
+
+
+class FakeBot:
+    def __init__(self):
+        self.edits = 0
+        self.shown = {}
+
+    async def edit_message_text(self, text, chat_id, **kwargs):
+        await asyncio.sleep(args.edit_ms / 1000)
+        self.edits += 1
+        self.shown[chat_id] = text
+
+
+class FakeApplication:
+    def __init__(self):
+        self.tasks = []
+
+    def create_task(self, coroutine, name=None):
+        task = asyncio.get_running_loop().create_task(coroutine, name=name)
+        self.tasks.append(task)
+        return task
+
+
+class FakeContext:
+    def __init__(self):
+        self.bot = FakeBot()
+        self.application = FakeApplication()
+
+
+def seed():
+    with database._writer() as conn:
+        conn.execute("INSERT INTO groups (id, name, users) VALUES (?, 'family', '[]')", (GROUP_ID,))
+        for m in range(args.members):
+            conn.execute("INSERT INTO group_members (user_id, group_id) VALUES (?, ?)", (100 + m, GROUP_ID))
+            database.set_user_message_info(GROUP_ID, 100 + m, 10 + m, 100 + m)
+    database.flush_message_locations()
+
+
+async def burst(debounce_ms: float):
+    utils.GROUP_REFRESH_DEBOUNCE_MS = debounce_ms
+    context = FakeContext()
+    started = time.perf_counter()
+    for change in range(args.changes):
+        caller = 100 + change % args.members
+        await utils.update_all_group_messages(context, GROUP_ID, f"dashboard {change}", None, caller_user_id=caller)
+        if change < args.changes - 1:
+            await asyncio.sleep(args.gap_ms / 1000)
+    while not all(task.done() for task in context.application.tasks):
+        await asyncio.gather(*context.application.tasks, return_exceptions=True)
+    done = (time.perf_counter() - started) * 1000
+    last = f"dashboard {args.changes - 1}"
+    # The last caller's own message is edited by its handler, not by the fan-out
+    stale = sum(1 for m in range(args.members) if 100 + m != caller and context.bot.shown.get(100 + m) != last)
+    return context.bot.edits, done, stale
+
+
+async def main():
+    run_migrations()
+    seed()
+    # The per-recipient lines would drown the table
+    utils.print = lambda *a, **k: None
+    print(f"{args.members} members, {args.changes} changes {args.gap_ms:.0f} ms apart, edit_message_text = {args.edit_ms:.0f} ms")
+    print(f"{'debounce':>10} {'edits':>6} {'settled':>10} {'stale':>6}")
+    for debounce_ms in (0, args.debounce_ms):
+        edits, done, stale = await burst(debounce_ms)
+        print(f"{debounce_ms:>7.0f} ms {edits:>6} {done:>7.0f} ms {stale:>6}")
+    del utils.print
+    print(utils.get_refresh_stats())
+    database.close_db_connection()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,104 @@
+"""Request-path latency vs total database size: get_all_groups vs the targeted lookups.
+
+Usage: python benchmarks/request_latency.py [--sizes 1000,10000] [--entries 30] [--requests 500]
+
+For each database size (number of groups, each with --entries bottles), times the
+group lookups a settings/groups/update-all action used to do through
+utils.load_data() (get_all_groups + scanning the dict), against what those call
+sites do now: get_user_group_id, get_group_settings, get_group_members and
+find_group_id_by_name. The legacy path grows with the whole database, the targeted
+one stays flat.
+"""
+import argparse
+import os
+import random
+import statistics
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# Point the bot at a throwaway database before config is imported
+_tmpdir = tempfile.mkdtemp(prefix="bench_")
+os.environ["DATABASE_PATH"] = os.path.join(_tmpdir, "bench.db")
+
+import database  # noqa: E402
+from migrations import run_migrations  # noqa: E402
+
+
+def seed(first: int, last: int, entries: int):
+    """Add groups first..last (one member each) with `entries` bottles apiece"""
+    now = datetime.now(database.UTC)
+    times = [now - timedelta(hours=3 * i) for i in range(entries)]
+    with database._writer() as conn:
+        for g in range(first, last + 1):
+            conn.execute("INSERT INTO groups (id, name, users) VALUES (?, ?, ?)", (g, f"family {g}", f"[{g}]"))
+            conn.execute("INSERT INTO group_members (user_id, group_id) VALUES (?, ?)", (g, g))
+            conn.executemany(
+                "INSERT INTO entries (group_id, amount, time, ts) VALUES (?, ?, ?, ?)",
+                [(g, 120, moment.isoformat(), int(moment.timestamp())) for moment in times],
+            )
+
+
+def legacy_request(user_id: int):
+    data = database.get_all_groups()
+    group_id = next(gid for gid, group in data.items() if user_id in group['users'])
+    group = data[group_id]
+    target = next((gid for gid, g in data.items() if g['name'] == f"family {user_id}"), None)
+    return group['name'], group['bottles_to_show'], list(group['users']), target
+
+
+def targeted_request(user_id: int):
+    group_id = database.get_user_group_id(user_id)
+    settings = database.get_group_settings(group_id)
+    members = database.get_group_members(group_id)
+    target = database.find_group_id_by_name(f"family {user_id}")
+    return settings['name'], settings['bottles_to_show'], members, target
+
+
+def bench(label: str, request, users: list) -> float:
+    samples = []
+    for user_id in users:
+        started = time.perf_counter()
+        request(user_id)
+        samples.append((time.perf_counter() - started) * 1000)
+    mean = statistics.mean(samples)
+    print(f"  {label:<9} {len(samples):5d} requests  mean {mean:10.3f} ms  p50 {statistics.median(samples):10.3f} ms  "
+          f"max {max(samples):10.3f} ms")
+    return mean
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sizes", default="1000,10000", help="comma-separated group counts, ascending")
+    parser.add_argument("--entries", type=int, default=30)
+    parser.add_argument("--requests", type=int, default=500)
+    parser.add_argument("--legacy-requests", type=int, default=5, help="get_all_groups is slow, time fewer of them")
+    args = parser.parse_args()
+
+    run_migrations()
+    rng = random.Random(42)
+    seeded = 0
+    for size in sorted(int(s) for s in args.sizes.split(",")):
+        seed(seeded + 1, size, args.entries)
+        seeded = size
+        print(f"{size} groups x {args.entries} entries")
+
+        users = [rng.randint(1, size) for _ in range(args.requests)]
+        for user_id in users[:args.legacy_requests]:
+            legacy = legacy_request(user_id)
+            targeted = targeted_request(user_id)
+            assert (legacy[0], legacy[1], legacy[2]) == targeted[:3] and int(legacy[3]) == targeted[3], user_id
+
+        # Cold caches on both sides: this measures the queries, not the group cache
+        database.invalidate_group_cache()
+        legacy_mean = bench("legacy", legacy_request, users[:args.legacy_requests])
+        targeted_mean = bench("targeted", targeted_request, users)
+        print(f"  speedup x{legacy_mean / targeted_mean:,.0f}")
+    database.close_db_connection()
+
+
+if __name__ == "__main__":
+    main()
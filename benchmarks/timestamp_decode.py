@@ -0,0 +1,76 @@
+"""Row decode throughput for entries: ISO strings vs integer epoch seconds.
+
+Usage: python benchmarks/timestamp_decode.py [--rows 100000]
+
+Builds an in-memory entries table with both the legacy ISO `time` column and
+the integer `ts` column, then times fetching and decoding every row with:
+  - dateutil.parser.parse on `time` (the old parse_time)
+  - database.parse_time on `time` (datetime.fromisoformat fast path)
+  - database._row_time (datetime.fromtimestamp on `ts`)
+"""
+import argparse
+import os
+import sqlite3
+import sys
+import time
+from datetime import datetime, timedelta, timezone
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from dateutil import parser as date_parser  # noqa: E402
+
+import database  # noqa: E402
+
+
+def build(rows: int) -> sqlite3.Connection:
+    conn = sqlite3.connect(":memory:")
+    conn.row_factory = sqlite3.Row
+    conn.execute("""
+        CREATE TABLE entries (
+            id INTEGER PRIMARY KEY AUTOINCREMENT, group_id INTEGER NOT NULL,
+            amount INTEGER NOT NULL, time TIMESTAMP NOT NULL, ts INTEGER)
+    """)
+    start = datetime.now(timezone.utc)
+    values = []
+    for i in range(rows):
+        moment = start - timedelta(minutes=17 * i, microseconds=i)
+        values.append((i % 50, 120, moment.isoformat(), int(moment.timestamp())))
+    conn.executemany("INSERT INTO entries (group_id, amount, time, ts) VALUES (?, ?, ?, ?)", values)
+    conn.execute("CREATE INDEX idx_entries_group_ts ON entries(group_id, ts)")
+    return conn
+
+
+def legacy_parse(row):
+    parsed = date_parser.parse(row['time'])
+    if parsed.tzinfo is None:
+        return parsed.replace(tzinfo=database.UTC)
+    return parsed.astimezone(database.UTC)
+
+
+def bench(conn, label: str, decode, rows: int):
+    started = time.perf_counter()
+    decoded = [decode(row) for row in conn.execute("SELECT * FROM entries ORDER BY ts DESC")]
+    elapsed = time.perf_counter() - started
+    assert len(decoded) == rows and decoded[0] is not None
+    print(f"{label:<34} {elapsed * 1000:9.1f} ms  {rows / elapsed:12,.0f} rows/s")
+    return decoded
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--rows", type=int, default=100_000)
+    args = parser.parse_args()
+
+    conn = build(args.rows)
+    print(f"Decoding {args.rows:,} rows")
+    legacy = bench(conn, "dateutil.parse(time)", legacy_parse, args.rows)
+    fast = bench(conn, "parse_time(time) / fromisoformat", lambda row: database.parse_time(row['time']), args.rows)
+    epoch = bench(conn, "_row_time(ts) / fromtimestamp", database._row_time, args.rows)
+
+    # Same instants, modulo the sub-second part dropped by epoch seconds
+    assert legacy == fast
+    assert all(abs((a - b).total_seconds()) < 1 for a, b in zip(fast, epoch))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,166 @@
+"""EXPLAIN QUERY PLAN regression check for the hot database queries.
+
+Usage: python check_query_plans.py [--verbose]
+
+Builds the schema with the migrations in a throwaway database, seeds synthetic
+groups, then calls every function listed in HOT_QUERIES. The SQL they actually
+run is captured (trace callback, parameters inlined) and each statement is
+explained: a full SCAN of a table is a failure unless that query explicitly
+allows it. Exits 1 on any regression, so the Docker build stops there.
+"""
+import argparse
+import os
+import re
+import shutil
+import sqlite3
+import sys
+import tempfile
+from datetime import datetime, timedelta
+
+# Throwaway database, and a single reader so one trace callback sees every read
+_tmpdir = tempfile.mkdtemp(prefix="plans_")
+os.environ["DATABASE_PATH"] = os.path.join(_tmpdir, "plans.db")
+os.environ["ARCHIVE_DATABASE_PATH"] = os.path.join(_tmpdir, "plans_archive.db")
+os.environ["DB_READER_POOL_SIZE"] = "1"
+os.environ["DB_QUERY_STATS"] = "false"
+os.environ["HOT_RETENTION_DAYS"] = "32"
+
+import database  # noqa: E402
+from config import DATABASE_PATH, ARCHIVE_DATABASE_PATH, ARCHIVE_SCHEMA  # noqa: E402
+from migrations import run_migrations  # noqa: E402
+
+GROUPS = 50
+ENTRIES_PER_GROUP = 200
+# Group 1 is shared by users 1 and 2; every other group g is the personal group of user g + 1
+USER = 1
+GROUP = 1
+
+# name -> (call, tables/CTEs that may be scanned in full)
+HOT_QUERIES = {
+    "get_user_group_id": (lambda: database.get_user_group_id(USER), set()),
+    "get_group_data_for_user": (lambda: database.get_group_data_for_user(USER), set()),
+    # Loads the group into the cache; grp and m (membership) of the single statement are one-row CTEs
+    "get_dashboard_snapshot": (lambda: database.get_dashboard_snapshot(USER), set()),
+    "_load_dashboard_snapshot": (lambda: database._load_dashboard_snapshot(USER), {"grp", "m"}),
+    "get_group_stats_for_user": (lambda: database.get_group_stats_for_user(USER, days=5), set()),
+    "get_daily_rollups_for_user": (lambda: database.get_daily_rollups_for_user(USER, days=5), set()),
+    # Lists the archive partitions from the (tiny) archive schema table
+    "get_group_history": (lambda: database.get_group_history(GROUP, datetime.now(database.UTC) - timedelta(days=60)),
+                          {"sqlite_master"}),
+    "find_group_id_by_name": (lambda: database.find_group_id_by_name("Family 7"), set()),
+    "get_group_members": (lambda: database.get_group_members(GROUP), set()),
+    "get_group_settings": (lambda: database.get_group_settings(GROUP), set()),
+    "get_language": (lambda: database._load_language(USER), set()),
+    "update_language": (lambda: database.update_language(USER, "en"), set()),
+    "get_user_message_info": (lambda: database.get_user_message_info(GROUP, USER), set()),
+    # set/clear only touch memory; the flush writes them
+    "flush_message_locations": (lambda: (database.set_user_message_info(GROUP, USER, 1234, USER),
+                                         database.clear_user_message_info(GROUP, 2),
+                                         database.flush_message_locations()), set()),
+    "add_entry_to_group": (lambda: database.add_entry_to_group(GROUP, 120, datetime.now(database.UTC), idempotency_key="bottle:1"), set()),
+    "add_poop_to_group": (lambda: database.add_poop_to_group(GROUP, datetime.now(database.UTC), idempotency_key="poop:1"), set()),
+    "remove_last_entry_from_group": (lambda: database.remove_last_entry_from_group(GROUP), set()),
+    "restore_last_deleted_entry": (lambda: database.restore_last_deleted_entry(GROUP), set()),
+    "purge_tombstones": (lambda: (database.remove_last_entry_from_group(GROUP),
+                                  database.purge_tombstones(retention_days=0)), set()),
+    # The outbox worker polls for due edits every OUTBOX_POLL_SECONDS
+    "enqueue_outbox_edit": (lambda: database.enqueue_outbox_edit(GROUP, USER, USER, 1001, "dashboard", None, "Markdown",
+                                                                 "Timed out", 0), set()),
+    "get_due_outbox_edits": (lambda: database.get_due_outbox_edits(50), set()),
+    "retry_outbox_edit": (lambda: database.retry_outbox_edit(USER, 1001, 2, 4, "Timed out"), set()),
+    "remove_outbox_edit": (lambda: database.remove_outbox_edit(USER, 1001), set()),
+    "update_group_settings": (lambda: database.update_group_settings(GROUP, bottles_to_show=6), set()),
+    "update_group_members": (lambda: database.update_group_members(GROUP, add=[GROUPS + 10]), set()),
+    # Not per request, but each batch of the nightly job would scan the whole table
+    "archive_old_data": (lambda: database.archive_old_data(), set()),
+}
+
+# Statements with no plan worth checking
+_SKIP_RE = re.compile(r"^\s*(--|BEGIN|COMMIT|ROLLBACK|SAVEPOINT|RELEASE|PRAGMA|ATTACH|CREATE|DROP)", re.I)
+# Full pass over a table or a whole index; derived tables (subquery-N) are already limited
+_SCAN_RE = re.compile(r"^SCAN (?!\(subquery-)(?:\w+\.)?(\S+)")
+
+
+def seed():
+    """Synthetic groups with recent and archived history, rollups, languages and message ids"""
+    now = datetime.now(database.UTC)
+    with database._writer() as conn:
+        for g in range(1, GROUPS + 1):
+            name = "Family 7" if g == 7 else f"group_{g + 1}"
+            conn.execute("INSERT INTO groups (id, name, users) VALUES (?, ?, '[]')", (g, name))
+            members = [1, 2] if g == GROUP else [g + 1]
+            for user_id in members:
+                conn.execute("INSERT INTO group_members (user_id, group_id) VALUES (?, ?)", (user_id, g))
+                conn.execute("INSERT INTO languages (user_id, language) VALUES (?, 'fr') ON CONFLICT DO NOTHING", (user_id,))
+                conn.execute("INSERT INTO user_messages (group_id, user_id, main_message_id, main_chat_id) "
+                             "VALUES (?, ?, ?, ?)", (g, user_id, 1000 + user_id, user_id))
+            # Every 8 hours over ~67 days: some of it gets archived below
+            times = [now - timedelta(hours=8 * i) for i in range(ENTRIES_PER_GROUP)]
+            conn.executemany("INSERT INTO entries (group_id, amount, time, ts) VALUES (?, 120, ?, ?)",
+                             [(g, moment.isoformat(), int(moment.timestamp())) for moment in times])
+            conn.executemany("INSERT INTO poop (group_id, time, ts) VALUES (?, ?, ?)",
+                             [(g, moment.isoformat(), int(moment.timestamp())) for moment in times[::4]])
+    database.rebuild_daily_rollups()
+    database.archive_old_data()
+
+
+def explain(conn: sqlite3.Connection, sql: str) -> list:
+    return [row[3] for row in conn.execute("EXPLAIN QUERY PLAN " + sql)]
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--verbose", action="store_true", help="print every statement with its plan")
+    args = parser.parse_args()
+
+    if not run_migrations():
+        return 1
+    seed()
+
+    statements = []
+    for conn_context in (database._writer, database._reader):
+        with conn_context() as conn:
+            conn.set_trace_callback(statements.append)
+
+    plan_conn = sqlite3.connect(DATABASE_PATH)
+    plan_conn.execute(f"ATTACH DATABASE ? AS {ARCHIVE_SCHEMA}", (ARCHIVE_DATABASE_PATH,))
+
+    failures = 0
+    for name, (call, allowed_scans) in HOT_QUERIES.items():
+        # Caches would hide the queries
+        database.invalidate_group_cache()
+        database._language_cache.clear()
+        database._message_locations.clear()
+        statements.clear()
+        call()
+        checked = [sql for sql in statements if not _SKIP_RE.match(sql)]
+        if not checked:
+            print(f"FAIL {name}: ran no query")
+            failures += 1
+            continue
+        for sql in checked:
+            plan = explain(plan_conn, sql)
+            scans = [step for step in plan
+                     if (match := _SCAN_RE.match(step)) and match.group(1) not in allowed_scans | {"CONSTANT"}]
+            if scans:
+                failures += 1
+                print(f"FAIL {name}: {'; '.join(scans)}\n    {' '.join(sql.split())}")
+            elif args.verbose:
+                print(f"ok   {name}: {' '.join(sql.split())[:100]}\n       " + "\n       ".join(plan))
+    plan_conn.close()
+    database.close_db_connection()
+
+    if failures:
+        print(f"❌ {failures} hot query plan(s) scan a table")
+        return 1
+    print(f"✅ {len(HOT_QUERIES)} hot queries use their indexes")
+    return 0
+
+
+if __name__ == "__main__":
+    try:
+        status = main()
+    finally:
+        database.close_db_connection()
+        shutil.rmtree(_tmpdir, ignore_errors=True)
+    sys.exit(status)
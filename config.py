@@ -8,9 +8,83 @@ TEST_MODE = False
 # SQLite Database Configuration
 DATABASE_PATH = os.getenv("DATABASE_PATH", "data/baby_bottle_tracker.db")
 
+# SQLite connection tuning (applied to every pooled connection)
+DB_JOURNAL_MODE = os.getenv("DB_JOURNAL_MODE", "WAL")
+DB_SYNCHRONOUS = os.getenv("DB_SYNCHRONOUS", "NORMAL")
+DB_BUSY_TIMEOUT_MS = int(os.getenv("DB_BUSY_TIMEOUT_MS", "5000"))
+DB_CACHE_SIZE_KIB = int(os.getenv("DB_CACHE_SIZE_KIB", "16384"))
+DB_MMAP_SIZE = int(os.getenv("DB_MMAP_SIZE", str(64 * 1024 * 1024)))
+DB_READER_POOL_SIZE = int(os.getenv("DB_READER_POOL_SIZE", "4"))
+# Per-statement latency/row counters on every pooled connection, and the slow-query log (with EXPLAIN QUERY PLAN)
+DB_QUERY_STATS = os.getenv("DB_QUERY_STATS", "true").lower() in ("1", "true", "yes")
+DB_SLOW_QUERY_MS = float(os.getenv("DB_SLOW_QUERY_MS", "100"))
+DB_QUERY_STATS_LOG_MINUTES = float(os.getenv("DB_QUERY_STATS_LOG_MINUTES", "60"))  # 0 = only at shutdown
+# Threads running queries for the async facade; one per reader so a slow read never waits on the pool
+DB_EXECUTOR_WORKERS = int(os.getenv("DB_EXECUTOR_WORKERS", str(DB_READER_POOL_SIZE)))
+
+# Main-message locations are kept in memory and written (only when changed) this often
+MESSAGE_LOCATION_FLUSH_SECONDS = float(os.getenv("MESSAGE_LOCATION_FLUSH_SECONDS", "5"))
+
+# Group commit: queued writes (entries, poop) share one transaction per batch
+WRITE_BATCH_MAX_OPS = int(os.getenv("WRITE_BATCH_MAX_OPS", "100"))  # 1 = commit every write on its own
+WRITE_BATCH_MAX_DELAY_MS = float(os.getenv("WRITE_BATCH_MAX_DELAY_MS", "5"))
+
+# Cold-storage archive: rows older than HOT_RETENTION_DAYS move to this attached database
+ARCHIVE_DATABASE_PATH = os.getenv("ARCHIVE_DATABASE_PATH", os.path.join(os.path.dirname(DATABASE_PATH), "baby_bottle_tracker_archive.db"))
+HOT_RETENTION_DAYS = int(os.getenv("HOT_RETENTION_DAYS", "32"))
+ARCHIVE_BATCH_SIZE = int(os.getenv("ARCHIVE_BATCH_SIZE", "500"))
+ARCHIVE_INTERVAL_HOURS = float(os.getenv("ARCHIVE_INTERVAL_HOURS", "24"))  # background archive pass; 0 = never
+
+# Deleted bottles are tombstoned (undoable) and purged by a background compactor after this long
+TOMBSTONE_RETENTION_DAYS = float(os.getenv("TOMBSTONE_RETENTION_DAYS", "7"))
+TOMBSTONE_COMPACT_MINUTES = float(os.getenv("TOMBSTONE_COMPACT_MINUTES", "60"))  # 0 = never purge
+TOMBSTONE_PURGE_BATCH_SIZE = int(os.getenv("TOMBSTONE_PURGE_BATCH_SIZE", "500"))
+
+# Online backups (SQLite backup API, run on a background thread)
+BACKUP_DIR = os.getenv("BACKUP_DIR", os.path.join(os.path.dirname(DATABASE_PATH), "backups"))
+BACKUP_INTERVAL_HOURS = float(os.getenv("BACKUP_INTERVAL_HOURS", "24"))
+BACKUP_KEEP = int(os.getenv("BACKUP_KEEP", "7"))
+BACKUP_MAX_AGE_DAYS = int(os.getenv("BACKUP_MAX_AGE_DAYS", "0"))  # 0 = no age limit
+BACKUP_PAGES_PER_STEP = int(os.getenv("BACKUP_PAGES_PER_STEP", "256"))
+BACKUP_STEP_SLEEP_MS = int(os.getenv("BACKUP_STEP_SLEEP_MS", "50"))
+BACKUP_COMPRESSION = os.getenv("BACKUP_COMPRESSION", "auto")  # auto (zstd if installed, else gzip), zstd, gzip or none
+
+# In-process caches
+LANGUAGE_CACHE_SIZE = int(os.getenv("LANGUAGE_CACHE_SIZE", "10000"))
+LANGUAGE_CACHE_WARMUP = os.getenv("LANGUAGE_CACHE_WARMUP", "true").lower() in ("1", "true", "yes")
+# Group snapshots behind load_user_data; writes invalidate them, the TTL bounds staleness from other processes
+GROUP_CACHE_SIZE = int(os.getenv("GROUP_CACHE_SIZE", "2000"))
+GROUP_CACHE_TTL_SECONDS = float(os.getenv("GROUP_CACHE_TTL_SECONDS", "300"))
+
+# Group dashboards edited at once after a change (shared by all groups' fan-outs)
+GROUP_FANOUT_CONCURRENCY = int(os.getenv("GROUP_FANOUT_CONCURRENCY", "8"))
+# Changes to a group within this window share one dashboard refresh (0 = refresh on every change)
+GROUP_REFRESH_DEBOUNCE_MS = float(os.getenv("GROUP_REFRESH_DEBOUNCE_MS", "500"))
+GROUP_REFRESH_MAX_DELAY_MS = float(os.getenv("GROUP_REFRESH_MAX_DELAY_MS", "2000"))  # a steady stream of changes still refreshes this often
+
+# Outbound Bot API limits (rate_limiter.py): token buckets per call, and retries after a 429
+TELEGRAM_GLOBAL_PER_SECOND = float(os.getenv("TELEGRAM_GLOBAL_PER_SECOND", "30"))
+TELEGRAM_CHAT_PER_SECOND = float(os.getenv("TELEGRAM_CHAT_PER_SECOND", "1"))
+TELEGRAM_CHAT_BURST = float(os.getenv("TELEGRAM_CHAT_BURST", "3"))  # calls a chat may get back to back
+TELEGRAM_GROUP_CHAT_PER_MINUTE = float(os.getenv("TELEGRAM_GROUP_CHAT_PER_MINUTE", "20"))
+TELEGRAM_MAX_RETRIES = int(os.getenv("TELEGRAM_MAX_RETRIES", "3"))
+
+# Outbox of dashboard edits that failed on a transient error, retried by a background worker
+OUTBOX_POLL_SECONDS = float(os.getenv("OUTBOX_POLL_SECONDS", "2"))
+OUTBOX_BASE_DELAY_SECONDS = float(os.getenv("OUTBOX_BASE_DELAY_SECONDS", "2"))  # doubled after each failed attempt, with jitter
+OUTBOX_MAX_DELAY_SECONDS = float(os.getenv("OUTBOX_MAX_DELAY_SECONDS", "300"))
+OUTBOX_MAX_ATTEMPTS = int(os.getenv("OUTBOX_MAX_ATTEMPTS", "10"))
+OUTBOX_BATCH_SIZE = int(os.getenv("OUTBOX_BATCH_SIZE", "50"))
+
 # Database table names
 GROUPS_TABLE = "groups"
 ENTRIES_TABLE = "entries"
 POOP_TABLE = "poop"
 USER_MESSAGES_TABLE = "user_messages"
-LANGUAGES_TABLE = "languages"
\ No newline at end of file
+LANGUAGES_TABLE = "languages"
+GROUP_MEMBERS_TABLE = "group_members"
+SCHEMA_VERSION_TABLE = "schema_version"
+DAILY_ROLLUPS_TABLE = "daily_rollups"
+OUTBOX_TABLE = "edit_outbox"
+# Schema name of the attached archive database (tables are per month: entries_YYYYMM, poop_YYYYMM)
+ARCHIVE_SCHEMA = "archive"
\ No newline at end of file
@@ -0,0 +1,153 @@
+import os
+import queue
+import sqlite3
+import threading
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, List, Optional, Type
+
+
+class ConnectionPool:
+    """Bounded pool of SQLite reader connections plus a single writer connection.
+
+    Every connection is opened with the same PRAGMAs (WAL journal, synchronous,
+    busy_timeout, cache_size, mmap_size) and the same attached databases. Readers are handed out from a bounded
+    queue and run with query_only enabled; all writes are serialized through the
+    one writer connection, which commits when the outermost writer block exits.
+    """
+
+    def __init__(self, path: str, readers: int = 4, journal_mode: str = "WAL",
+                 synchronous: str = "NORMAL", busy_timeout_ms: int = 5000,
+                 cache_size_kib: int = 16384, mmap_size: int = 0,
+                 attachments: Optional[Dict[str, str]] = None,
+                 factory: Type[sqlite3.Connection] = sqlite3.Connection):
+        self.path = path
+        self.max_readers = max(1, readers)
+        self.journal_mode = journal_mode
+        self.synchronous = synchronous
+        self.busy_timeout_ms = busy_timeout_ms
+        self.cache_size_kib = cache_size_kib
+        self.mmap_size = mmap_size
+        # schema name -> database path, attached on every connection
+        self.attachments = dict(attachments or {})
+        # Connection class, e.g. query_stats.InstrumentedConnection
+        self.factory = factory
+
+        self._readers = queue.LifoQueue(maxsize=self.max_readers)
+        self._reader_count = 0
+        self._reader_lock = threading.Lock()
+
+        self._writer_conn: Optional[sqlite3.Connection] = None
+        self._writer_lock = threading.RLock()
+        self._writer_depth = 0
+        # Thread inside a writer block, and what to run once its outermost block exits
+        self._writer_owner: Optional[int] = None
+        self._after_transaction: List[Callable[[], None]] = []
+
+        for db_path in [path, *self.attachments.values()]:
+            directory = os.path.dirname(db_path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+
+    def _connect(self, read_only: bool = False) -> sqlite3.Connection:
+        conn = sqlite3.connect(self.path, check_same_thread=False, timeout=self.busy_timeout_ms / 1000,
+                               factory=self.factory)
+        conn.row_factory = sqlite3.Row  # Enable dict-like access
+        conn.execute(f"PRAGMA journal_mode={self.journal_mode}")
+        conn.execute(f"PRAGMA synchronous={self.synchronous}")
+        conn.execute(f"PRAGMA busy_timeout={int(self.busy_timeout_ms)}")
+        # Negative cache_size is expressed in KiB rather than pages
+        conn.execute(f"PRAGMA cache_size=-{int(self.cache_size_kib)}")
+        conn.execute(f"PRAGMA mmap_size={int(self.mmap_size)}")
+        for schema, db_path in self.attachments.items():
+            conn.execute("ATTACH DATABASE ? AS " + schema, (db_path,))
+            conn.execute(f"PRAGMA {schema}.journal_mode={self.journal_mode}")
+            conn.execute(f"PRAGMA {schema}.synchronous={self.synchronous}")
+        if read_only:
+            conn.execute("PRAGMA query_only=ON")
+        return conn
+
+    @contextmanager
+    def reader(self):
+        """Borrow a reader connection, blocking while all of them are in use"""
+        conn = None
+        try:
+            conn = self._readers.get_nowait()
+        except queue.Empty:
+            with self._reader_lock:
+                if self._reader_count < self.max_readers:
+                    self._reader_count += 1
+                    try:
+                        conn = self._connect(read_only=True)
+                    except Exception:
+                        self._reader_count -= 1
+                        raise
+            if conn is None:
+                conn = self._readers.get(timeout=self.busy_timeout_ms / 1000)
+        try:
+            yield conn
+        finally:
+            if conn.in_transaction:
+                conn.rollback()
+            self._readers.put(conn)
+
+    @contextmanager
+    def writer(self):
+        """Hold the writer connection; commit on success, roll back on error.
+
+        Nested writer blocks on the same thread share the outer transaction.
+        """
+        callbacks = []
+        try:
+            with self._writer_lock:
+                if self._writer_conn is None:
+                    self._writer_conn = self._connect()
+                conn = self._writer_conn
+                self._writer_depth += 1
+                self._writer_owner = threading.get_ident()
+                try:
+                    yield conn
+                    if self._writer_depth == 1:
+                        conn.commit()
+                except BaseException:
+                    if self._writer_depth == 1:
+                        conn.rollback()
+                    raise
+                finally:
+                    self._writer_depth -= 1
+                    if self._writer_depth == 0:
+                        self._writer_owner = None
+                        callbacks, self._after_transaction = self._after_transaction, []
+        finally:
+            for callback in callbacks:
+                callback()
+
+    def after_transaction(self, callback: Callable[[], None]):
+        """Run callback once the calling thread's outermost writer block has committed or
+        rolled back (right away when the thread is not inside a writer block)"""
+        if self._writer_owner == threading.get_ident():
+            self._after_transaction.append(callback)
+        else:
+            callback()
+
+    def effective_settings(self) -> Dict[str, Any]:
+        """Read back the PRAGMAs actually in effect on the writer connection"""
+        with self.writer() as conn:
+            settings = {}
+            for pragma in ("journal_mode", "synchronous", "busy_timeout", "cache_size", "mmap_size"):
+                settings[pragma] = conn.execute(f"PRAGMA {pragma}").fetchone()[0]
+        settings["max_readers"] = self.max_readers
+        return settings
+
+    def close(self):
+        """Close every pooled connection"""
+        with self._writer_lock:
+            if self._writer_conn is not None:
+                self._writer_conn.close()
+                self._writer_conn = None
+        with self._reader_lock:
+            while True:
+                try:
+                    self._readers.get_nowait().close()
+                except queue.Empty:
+                    break
+            self._reader_count = 0
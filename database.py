@@ -1,31 +1,99 @@
-import os
+import re
 import json
 import sqlite3
-import shutil
 from datetime import datetime, date
-from typing import Dict, List, Optional, Any
-from config import DATABASE_PATH, GROUPS_TABLE, ENTRIES_TABLE, POOP_TABLE, USER_MESSAGES_TABLE, LANGUAGES_TABLE
-from dateutil import parser as date_parser
+from typing import Callable, Dict, List, Optional, Any, Tuple
+from dataclasses import dataclass
+from config import (
+    DATABASE_PATH, GROUPS_TABLE, ENTRIES_TABLE, POOP_TABLE, USER_MESSAGES_TABLE, LANGUAGES_TABLE, GROUP_MEMBERS_TABLE, DAILY_ROLLUPS_TABLE,
+    DB_JOURNAL_MODE, DB_SYNCHRONOUS, DB_BUSY_TIMEOUT_MS, DB_CACHE_SIZE_KIB, DB_MMAP_SIZE, DB_READER_POOL_SIZE,
+    ARCHIVE_DATABASE_PATH, ARCHIVE_SCHEMA, HOT_RETENTION_DAYS, ARCHIVE_BATCH_SIZE, ARCHIVE_INTERVAL_HOURS, LANGUAGE_CACHE_SIZE,
+    GROUP_CACHE_SIZE, GROUP_CACHE_TTL_SECONDS, DB_QUERY_STATS, MESSAGE_LOCATION_FLUSH_SECONDS,
+    TOMBSTONE_RETENTION_DAYS, TOMBSTONE_COMPACT_MINUTES, TOMBSTONE_PURGE_BATCH_SIZE, OUTBOX_TABLE
+)
+from connection_pool import ConnectionPool
+from cache import LRUCache, MISSING
+from query_stats import InstrumentedConnection
+import functools
 import threading
 from zoneinfo import ZoneInfo
 
-# Thread-local storage for database connections
-_local = threading.local()
+UTC = ZoneInfo('UTC')
 
-def get_db_connection():
-    """Get a database connection for the current thread"""
-    if not hasattr(_local, 'connection'):
-        # Ensure data directory exists
-        os.makedirs(os.path.dirname(DATABASE_PATH), exist_ok=True)
-        _local.connection = sqlite3.connect(DATABASE_PATH, check_same_thread=False)
-        _local.connection.row_factory = sqlite3.Row  # Enable dict-like access
-    return _local.connection
+# Shared connection pool (one writer + bounded readers), created on first use
+_pool = None
+_pool_lock = threading.Lock()
+
+def get_pool() -> ConnectionPool:
+    """Get the process-wide SQLite connection pool"""
+    global _pool
+    if _pool is None:
+        with _pool_lock:
+            if _pool is None:
+                _pool = ConnectionPool(
+                    DATABASE_PATH,
+                    readers=DB_READER_POOL_SIZE,
+                    journal_mode=DB_JOURNAL_MODE,
+                    synchronous=DB_SYNCHRONOUS,
+                    busy_timeout_ms=DB_BUSY_TIMEOUT_MS,
+                    cache_size_kib=DB_CACHE_SIZE_KIB,
+                    mmap_size=DB_MMAP_SIZE,
+                    attachments={ARCHIVE_SCHEMA: ARCHIVE_DATABASE_PATH},
+                    factory=InstrumentedConnection if DB_QUERY_STATS else sqlite3.Connection
+                )
+    return _pool
+
+def _reader():
+    return get_pool().reader()
+
+def _writer():
+    return get_pool().writer()
+
+def run_write_batch(operations: List[Tuple[Callable, tuple, dict]]) -> List[Tuple[bool, Any]]:
+    """Run several write functions in a single transaction, so they share one commit.
+
+    Each operation runs inside its own SAVEPOINT: one that raises, or returns False
+    like the write functions do on error, is rolled back alone. Returns
+    (True, result) or (False, exception) per operation, in order.
+    """
+    results = []
+    with _writer() as conn:
+        if not conn.in_transaction:
+            conn.execute("BEGIN")
+        for func, args, kwargs in operations:
+            conn.execute("SAVEPOINT write_op")
+            try:
+                result = func(*args, **kwargs)
+            except Exception as e:
+                conn.execute("ROLLBACK TO write_op")
+                conn.execute("RELEASE write_op")
+                results.append((False, e))
+                continue
+            if result is False:
+                conn.execute("ROLLBACK TO write_op")
+            conn.execute("RELEASE write_op")
+            results.append((True, result))
+    return results
 
 def close_db_connection():
-    """Close the database connection for the current thread"""
-    if hasattr(_local, 'connection'):
-        _local.connection.close()
-        delattr(_local, 'connection')
+    """Close every pooled database connection"""
+    global _pool
+    with _pool_lock:
+        if _pool is not None:
+            _pool.close()
+            _pool = None
+
+def log_connection_settings() -> Dict[str, Any]:
+    """Log the effective SQLite settings at startup and warn when they differ from config"""
+    try:
+        settings = get_pool().effective_settings()
+        print(f"SQLite settings for {DATABASE_PATH}: {settings}")
+        if str(settings.get("journal_mode", "")).lower() != DB_JOURNAL_MODE.lower():
+            print(f"⚠️ Requested journal_mode={DB_JOURNAL_MODE} but SQLite is using {settings.get('journal_mode')}")
+        return settings
+    except Exception as e:
+        print(f"Error reading SQLite settings: {e}")
+        return {}
 
 # Helper to parse timestamp from SQLite
 def parse_time(ts):
@@ -40,7 +108,13 @@ def parse_time(ts):
             # Si a une timezone, convertir à UTC
             return ts.astimezone(ZoneInfo('UTC'))
     try:
-        parsed_time = date_parser.parse(ts)
+        try:
+            # Fast path: everything this bot writes is ISO 8601
+            parsed_time = datetime.fromisoformat(ts)
+        except ValueError:
+            # Slow path for legacy free-form strings
+            from dateutil import parser as date_parser
+            parsed_time = date_parser.parse(ts)
         # S'assurer que le datetime parsé a une timezone
         if parsed_time.tzinfo is None:
             # Si pas de timezone, supposer UTC
@@ -51,131 +125,396 @@ def parse_time(ts):
     except Exception:
         return None
 
+def to_epoch(value) -> Optional[int]:
+    """Convert a datetime (naive means UTC) or ISO string to integer epoch seconds"""
+    if isinstance(value, datetime) and value.tzinfo is None:
+        value = value.replace(tzinfo=UTC)
+    elif not isinstance(value, datetime):
+        value = parse_time(value)
+        if value is None:
+            return None
+    return int(value.timestamp())
+
+def _row_time(row) -> Optional[datetime]:
+    """Decode the time of an entries/poop row, preferring the integer ts column"""
+    if row['ts'] is not None:
+        return datetime.fromtimestamp(row['ts'], UTC)
+    return parse_time(row['time'])
+
+def _parse_users(users_json) -> List[int]:
+    """Parse the users JSON column into a list of integer user IDs"""
+    if not users_json:
+        return []
+    try:
+        return _to_int_users(json.loads(users_json))
+    except Exception:
+        return []
+
+def _to_int_users(users: List) -> List[int]:
+    """Convert a list of user IDs (int or str) to integers, skipping invalid values"""
+    int_users = []
+    for user in users:
+        try:
+            int_users.append(int(user))
+        except (ValueError, TypeError):
+            continue
+    return int_users
+
+# Read-through caches for get_group_data_for_user: user_id -> group_id, then
+# group_id -> group snapshot. Writers bump a per-group version once their
+# transaction has committed (see _invalidates_group); a reader only stores what
+# it loaded if the version it saw before the query is still current, so a
+# snapshot read concurrently with a write can never be cached after it.
+# Membership or name changes bump _membership_version and drop the user map.
+_group_cache = LRUCache(GROUP_CACHE_SIZE, ttl=GROUP_CACHE_TTL_SECONDS)
+# Families usually have a few members, so allow more users than groups
+_user_group_cache = LRUCache(GROUP_CACHE_SIZE * 4, ttl=GROUP_CACHE_TTL_SECONDS)
+_group_versions: Dict[int, int] = {}
+_membership_version = 0
+_cache_lock = threading.Lock()
+
+def _group_version(group_id: int) -> int:
+    with _cache_lock:
+        return _group_versions.get(group_id, 0)
+
+def invalidate_group_cache(group_id: Optional[int] = None, membership: bool = False):
+    """Drop the cached snapshot of a group (of every group if group_id is None)"""
+    global _membership_version
+    with _cache_lock:
+        if group_id is None:
+            for cached_id in list(_group_versions):
+                _group_versions[cached_id] += 1
+            _group_cache.clear()
+        else:
+            group_id = int(group_id)
+            _group_versions[group_id] = _group_versions.get(group_id, 0) + 1
+            _group_cache.pop(group_id)
+        if membership or group_id is None:
+            _membership_version += 1
+            _user_group_cache.clear()
+
+def _invalidates_group(membership=False):
+    """Invalidate the cache of the group passed as first argument once the write has committed.
+
+    membership: True, or a predicate called with the function's arguments, when the
+    write can change which group a user resolves to.
+
+    That is when the function returns, or at the end of the enclosing transaction when it
+    runs inside one (run_write_batch): before that, readers would still cache the old rows.
+    """
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(group_id, *args, **kwargs):
+            changes_membership = membership(group_id, *args, **kwargs) if callable(membership) else membership
+            try:
+                return func(group_id, *args, **kwargs)
+            finally:
+                get_pool().after_transaction(
+                    functools.partial(invalidate_group_cache, group_id, membership=changes_membership))
+        return wrapper
+    return decorator
+
+def get_group_cache_stats() -> Dict[str, Dict[str, Any]]:
+    """Size and hit/miss counters of the group snapshot and user -> group caches"""
+    return {'groups': _group_cache.stats(), 'users': _user_group_cache.stats()}
+
+def _copy_group_snapshot(snapshot: Dict, user_id: int) -> Dict:
+    """Copy a cached snapshot for one caller, keeping only that user's message info"""
+    data = dict(snapshot)
+    data['users'] = list(snapshot['users'])
+    data['entries'] = [dict(entry) for entry in snapshot['entries']]
+    data['poop'] = [dict(poop_entry) for poop_entry in snapshot['poop']]
+    key = str(user_id)
+    location = _known_location(snapshot['id'], user_id)
+    if location is MISSING:
+        user_messages = snapshot['user_messages']
+        data['user_messages'] = {key: dict(user_messages[key])} if key in user_messages else {}
+    else:
+        # The in-memory location may not be flushed to the cached rows yet
+        data['user_messages'] = {key: {'main_message_id': location[0], 'main_chat_id': location[1]}} if location else {}
+    return data
+
 # Performance optimization: Add targeted query functions
 def get_user_group_id(user_id: int) -> Optional[int]:
-    """Get group ID for a specific user - robust version (no JSON1 dependency)"""
+    """Get group ID for a specific user - shared groups take precedence over the personal one"""
+    cached = _user_group_cache.get(int(user_id))
+    if cached is not MISSING:
+        return cached
+    
+    with _cache_lock:
+        version = _membership_version
     try:
-        conn = get_db_connection()
-        cursor = conn.cursor()
-        # 1. Chercher d'abord un groupe partagé
-        cursor.execute(f"SELECT id, users, name FROM {GROUPS_TABLE} WHERE name NOT LIKE 'group_%' ORDER BY id ASC")
-        for row in cursor.fetchall():
-            try:
-                users = row['users']
-                if users:
-                    users_list = json.loads(users)
-                    if int(user_id) in users_list:
-                        return row['id']
-            except Exception as e:
-                continue
-        # 2. Sinon, chercher un groupe perso
-        cursor.execute(f"SELECT id, users, name FROM {GROUPS_TABLE} WHERE name LIKE 'group_%' ORDER BY id ASC")
-        for row in cursor.fetchall():
-            try:
-                users = row['users']
-                if users:
-                    users_list = json.loads(users)
-                    if int(user_id) in users_list:
-                        return row['id']
-            except Exception as e:
-                continue
-        return None
+        with _reader() as conn:
+            cursor = conn.cursor()
+            # Single indexed lookup on group_members.user_id
+            cursor.execute(f"""
+                SELECT gm.group_id FROM {GROUP_MEMBERS_TABLE} gm
+                JOIN {GROUPS_TABLE} g ON g.id = gm.group_id
+                WHERE gm.user_id = ?
+                ORDER BY g.name LIKE 'group_%', g.id ASC
+                LIMIT 1
+            """, (int(user_id),))
+            row = cursor.fetchone()
+        if not row:
+            # Not cached: the user is about to create or join a group
+            return None
+        with _cache_lock:
+            if version == _membership_version:
+                _user_group_cache.set(int(user_id), row['group_id'])
+        return row['group_id']
     except Exception as e:
         print(f"Error getting group for user {user_id}: {e}")
         return None
 
 def get_group_data_for_user(user_id: int) -> Optional[Dict]:
-    """Get only the data needed for a specific user's group"""
-    try:
-        group_id = get_user_group_id(user_id)
-        if not group_id:
-            return None
-        
-        conn = get_db_connection()
-        cursor = conn.cursor()
-        
-        # Get group basic info
-        cursor.execute(f"""
-            SELECT * FROM {GROUPS_TABLE} WHERE id = ?
-        """, (group_id,))
-        group_row = cursor.fetchone()
-        
-        if not group_row:
+    """Get only the data needed for a specific user's group (served from the group cache when fresh)"""
+    group_id = get_user_group_id(user_id)
+    if not group_id:
+        return None
+    
+    snapshot = _group_cache.get(group_id)
+    if snapshot is MISSING:
+        version = _group_version(group_id)
+        snapshot = _load_group_snapshot(group_id)
+        if snapshot is None:
             return None
-        
-        # Get only recent entries (last 10) instead of all
-        cursor.execute(f"""
-            SELECT * FROM {ENTRIES_TABLE} 
-            WHERE group_id = ? 
-            ORDER BY time DESC 
-            LIMIT 10
-        """, (group_id,))
-        entries_data = cursor.fetchall()
-        
-        # Get only recent poop (last 5) instead of all
-        cursor.execute(f"""
-            SELECT * FROM {POOP_TABLE} 
-            WHERE group_id = ? 
-            ORDER BY time DESC 
-            LIMIT 5
-        """, (group_id,))
-        poop_data = cursor.fetchall()
-        
-        # Get user message info
-        cursor.execute(f"""
-            SELECT * FROM {USER_MESSAGES_TABLE} 
-            WHERE group_id = ? AND user_id = ?
-        """, (group_id, user_id))
-        messages_data = cursor.fetchall()
-        
-        # Format entries
-        entries = []
-        for entry in entries_data:
-            entries.append({
-                'amount': entry['amount'],
-                'time': parse_time(entry['time'])
-            })
-        
-        # Format poop
-        poop = []
-        for poop_entry in poop_data:
-            poop.append({
-                'time': parse_time(poop_entry['time']),
-                'info': poop_entry['info']
-            })
-        
-        # Format user messages
+        with _cache_lock:
+            if _group_versions.get(group_id, 0) == version:
+                _group_cache.set(group_id, snapshot)
+    return _copy_group_snapshot(snapshot, user_id)
+
+# Rows kept per cached group: the most the settings let a dashboard show
+SNAPSHOT_ENTRIES = 10
+SNAPSHOT_POOPS = 5
+
+def _load_group_snapshot(group_id: int) -> Optional[Dict]:
+    """Read a group with its recent entries/poop and every member's message info"""
+    try:
+        with _reader() as conn:
+            cursor = conn.cursor()
+            
+            # Get group basic info
+            cursor.execute(f"""
+                SELECT * FROM {GROUPS_TABLE} WHERE id = ?
+            """, (group_id,))
+            group_row = cursor.fetchone()
+            
+            if not group_row:
+                return None
+            
+            # Get only recent entries (last 10) instead of all
+            cursor.execute(f"""
+                SELECT * FROM {ENTRIES_TABLE} 
+                WHERE group_id = ? AND deleted_at IS NULL
+                ORDER BY ts DESC, id DESC 
+                LIMIT {SNAPSHOT_ENTRIES}
+            """, (group_id,))
+            entries_data = cursor.fetchall()
+            
+            # Get only recent poop (last 5) instead of all
+            cursor.execute(f"""
+                SELECT * FROM {POOP_TABLE} 
+                WHERE group_id = ? 
+                ORDER BY ts DESC, id DESC 
+                LIMIT {SNAPSHOT_POOPS}
+            """, (group_id,))
+            poop_data = cursor.fetchall()
+            
+            # Get message info of all members (filtered per user on read)
+            cursor.execute(f"""
+                SELECT * FROM {USER_MESSAGES_TABLE} 
+                WHERE group_id = ?
+            """, (group_id,))
+            messages_data = cursor.fetchall()
+            
+            # Format entries
+            entries = []
+            for entry in entries_data:
+                entries.append({
+                    'amount': entry['amount'],
+                    'time': _row_time(entry)
+                })
+            
+            # Format poop
+            poop = []
+            for poop_entry in poop_data:
+                poop.append({
+                    'time': _row_time(poop_entry),
+                    'info': poop_entry['info']
+                })
+            
+            # Format user messages
+            user_messages = {}
+            for msg in messages_data:
+                user_messages[str(msg['user_id'])] = {
+                    'main_message_id': msg['main_message_id'],
+                    'main_chat_id': msg['main_chat_id']
+                }
+            
+            # Parse users JSON
+            users = []
+            if group_row['users']:
+                try:
+                    users = json.loads(group_row['users'])
+                except:
+                    users = []
+            
+            return {
+                'id': group_id,
+                'name': group_row['name'],
+                'users': users,
+                'entries': entries,
+                'poop': poop,
+                'time_difference': group_row['time_difference'] or 0,
+                'last_bottle': group_row['last_bottle'] or 0,
+                'bottles_to_show': group_row['bottles_to_show'] or 5,
+                'poops_to_show': group_row['poops_to_show'] or 1,
+                'user_messages': user_messages
+            }
+    except Exception as e:
+        print(f"Error getting group data for group {group_id}: {e}")
+        return None
+
+@dataclass(frozen=True)
+class DashboardSnapshot:
+    """Everything the main message needs for one user, read in a single statement"""
+    user_id: int
+    group_id: int
+    name: str
+    users: List[int]
+    time_difference: int
+    last_bottle: int
+    bottles_to_show: int
+    poops_to_show: int
+    entries: List[Tuple[int, Optional[datetime]]]  # (amount, time), newest first
+    poop: List[Tuple[Optional[datetime], Optional[str]]]  # (time, info), newest first
+    main_message_id: Optional[int]
+    main_chat_id: Optional[int]
+    language: Optional[str]  # None when the user has no languages row yet
+    
+    def as_group_data(self) -> Dict[str, Dict]:
+        """Legacy {group_id: group_dict} shape used by get_main_message_content"""
         user_messages = {}
-        for msg in messages_data:
-            user_messages[str(msg['user_id'])] = {
-                'main_message_id': msg['main_message_id'],
-                'main_chat_id': msg['main_chat_id']
+        if self.main_message_id is not None:
+            user_messages[str(self.user_id)] = {
+                'main_message_id': self.main_message_id,
+                'main_chat_id': self.main_chat_id
             }
-        
-        # Parse users JSON
-        users = []
-        if group_row['users']:
-            try:
-                users = json.loads(group_row['users'])
-            except:
-                users = []
-        
-        return {
-            'id': group_id,
-            'name': group_row['name'],
-            'users': users,
-            'entries': entries,
-            'poop': poop,
-            'time_difference': group_row['time_difference'] or 0,
-            'last_bottle': group_row['last_bottle'] or 0,
-            'bottles_to_show': group_row['bottles_to_show'] or 5,
-            'poops_to_show': group_row['poops_to_show'] or 1,
+        return {str(self.group_id): {
+            'id': self.group_id,
+            'name': self.name,
+            'users': list(self.users),
+            'entries': [{'amount': amount, 'time': time} for amount, time in self.entries],
+            'poop': [{'time': time, 'info': info} for time, info in self.poop],
+            'time_difference': self.time_difference,
+            'last_bottle': self.last_bottle,
+            'bottles_to_show': self.bottles_to_show,
+            'poops_to_show': self.poops_to_show,
             'user_messages': user_messages
-        }
+        }}
+
+def _decode_json_time(ts, time):
+    if ts is not None:
+        return datetime.fromtimestamp(ts, UTC)
+    return parse_time(time)
+
+def get_dashboard_snapshot(user_id: int) -> Optional[DashboardSnapshot]:
+    """Dashboard of a user's group, served from the group and language caches (the group is
+    loaded into the cache on a miss, like load_user_data)"""
+    data = get_group_data_for_user(user_id)
+    if data is None:
+        return None
+    if data['bottles_to_show'] > SNAPSHOT_ENTRIES or data['poops_to_show'] > SNAPSHOT_POOPS:
+        # More rows than the cache keeps
+        return _load_dashboard_snapshot(user_id)
+    location = data['user_messages'].get(str(user_id))
+    return DashboardSnapshot(
+        user_id=int(user_id),
+        group_id=data['id'],
+        name=data['name'],
+        users=_to_int_users(data['users']),
+        time_difference=data['time_difference'],
+        last_bottle=data['last_bottle'],
+        bottles_to_show=data['bottles_to_show'],
+        poops_to_show=data['poops_to_show'],
+        entries=[(entry['amount'], entry['time']) for entry in data['entries'][:data['bottles_to_show']]],
+        poop=[(poop_entry['time'], poop_entry['info']) for poop_entry in data['poop'][:data['poops_to_show']]],
+        main_message_id=location['main_message_id'] if location else None,
+        main_chat_id=location['main_chat_id'] if location else None,
+        language=get_language(user_id)
+    )
+
+def _load_dashboard_snapshot(user_id: int) -> Optional[DashboardSnapshot]:
+    """Load the dashboard of a user's group (membership, settings, last bottles/poops,
+    message location and language) in one round trip, bypassing the caches"""
+    try:
+        with _reader() as conn:
+            cursor = conn.cursor()
+            cursor.execute(f"""
+                WITH membership AS (
+                    SELECT gm.group_id FROM {GROUP_MEMBERS_TABLE} gm
+                    JOIN {GROUPS_TABLE} g ON g.id = gm.group_id
+                    WHERE gm.user_id = :user_id
+                    ORDER BY g.name LIKE 'group_%', g.id ASC
+                    LIMIT 1
+                ),
+                grp AS (
+                    SELECT g.* FROM {GROUPS_TABLE} g JOIN membership m ON g.id = m.group_id
+                )
+                SELECT
+                    grp.id, grp.name, grp.users, grp.time_difference, grp.last_bottle,
+                    grp.bottles_to_show, grp.poops_to_show,
+                    (SELECT json_group_array(json_array(amount, ts, time)) FROM (
+                        SELECT amount, ts, time FROM {ENTRIES_TABLE}
+                        WHERE group_id = grp.id AND deleted_at IS NULL
+                        ORDER BY ts DESC, id DESC
+                        LIMIT (SELECT COALESCE(NULLIF(bottles_to_show, 0), 5) FROM grp)
+                    )) AS entries,
+                    (SELECT json_group_array(json_array(ts, time, info)) FROM (
+                        SELECT ts, time, info FROM {POOP_TABLE}
+                        WHERE group_id = grp.id
+                        ORDER BY ts DESC, id DESC
+                        LIMIT (SELECT COALESCE(NULLIF(poops_to_show, 0), 1) FROM grp)
+                    )) AS poop,
+                    um.main_message_id, um.main_chat_id,
+                    (SELECT language FROM {LANGUAGES_TABLE} WHERE user_id = :user_id) AS language
+                FROM grp
+                LEFT JOIN {USER_MESSAGES_TABLE} um ON um.group_id = grp.id AND um.user_id = :user_id
+                LIMIT 1
+            """, {'user_id': int(user_id)})
+            row = cursor.fetchone()
+            if not row:
+                return None
+            
+            main_message_id, main_chat_id = row['main_message_id'], row['main_chat_id']
+            location = _known_location(row['id'], user_id)
+            if location is not MISSING:
+                main_message_id, main_chat_id = location or (None, None)
+            
+            return DashboardSnapshot(
+                user_id=int(user_id),
+                group_id=row['id'],
+                name=row['name'],
+                users=_parse_users(row['users']),
+                time_difference=row['time_difference'] or 0,
+                last_bottle=row['last_bottle'] or 0,
+                bottles_to_show=row['bottles_to_show'] or 5,
+                poops_to_show=row['poops_to_show'] or 1,
+                entries=[(amount, _decode_json_time(ts, time)) for amount, ts, time in json.loads(row['entries'])],
+                poop=[(_decode_json_time(ts, time), info) for ts, time, info in json.loads(row['poop'])],
+                main_message_id=main_message_id,
+                main_chat_id=main_chat_id,
+                language=row['language']
+            )
     except Exception as e:
-        print(f"Error getting group data for user {user_id}: {e}")
+        print(f"Error getting dashboard for user {user_id}: {e}")
         return None
 
+def _window_start(days: int) -> date:
+    """First day of an N-day window (today included): stats, PDF listing and daily rollups all use it"""
+    from datetime import timedelta
+    return datetime.now(UTC).date() - timedelta(days=days - 1)
+
 def get_group_stats_for_user(user_id: int, days: int = 5) -> Optional[Dict]:
     """Get statistics data for a specific user - optimized for stats display"""
     try:
@@ -183,47 +522,35 @@ def get_group_stats_for_user(user_id: int, days: int = 5) -> Optional[Dict]:
         if not group_id:
             return None
         
-        conn = get_db_connection()
-        cursor = conn.cursor()
-        
-        # Get entries for the last N days only
-        from datetime import timedelta
-        cutoff_date = (datetime.now(ZoneInfo('UTC')) - timedelta(days=days)).isoformat()
-        
-        cursor.execute(f"""
-            SELECT * FROM {ENTRIES_TABLE} 
-            WHERE group_id = ? AND time >= ?
-            ORDER BY time DESC
-        """, (group_id, cutoff_date))
-        entries_data = cursor.fetchall()
-        
-        cursor.execute(f"""
-            SELECT * FROM {POOP_TABLE} 
-            WHERE group_id = ? AND time >= ?
-            ORDER BY time DESC
-        """, (group_id, cutoff_date))
-        poop_data = cursor.fetchall()
-        
-        # Format entries
-        entries = []
-        for entry in entries_data:
-            entries.append({
-                'amount': entry['amount'],
-                'time': parse_time(entry['time'])
-            })
-        
-        # Format poop
-        poop = []
-        for poop_entry in poop_data:
-            poop.append({
-                'time': parse_time(poop_entry['time']),
-                'info': poop_entry['info']
-            })
-        
-        return {
-            'entries': entries,
-            'poop': poop
-        }
+        with _reader() as conn:
+            cursor = conn.cursor()
+            
+            # Get entries for the last N calendar days only, the same days as the rollups (integer
+            # range on the (group_id, ts) index, plus the archive when the window reaches past the hot retention period)
+            cutoff_ts = to_epoch(datetime.combine(_window_start(days), datetime.min.time(), UTC))
+            entries_data = _fetch_history(cursor, ENTRIES_TABLE, group_id, cutoff_ts)
+            poop_data = _fetch_history(cursor, POOP_TABLE, group_id, cutoff_ts)
+            
+            # Format entries
+            entries = []
+            for entry in entries_data:
+                entries.append({
+                    'amount': entry['amount'],
+                    'time': _row_time(entry)
+                })
+            
+            # Format poop
+            poop = []
+            for poop_entry in poop_data:
+                poop.append({
+                    'time': _row_time(poop_entry),
+                    'info': poop_entry['info']
+                })
+            
+            return {
+                'entries': entries,
+                'poop': poop
+            }
     except Exception as e:
         print(f"Error getting group stats for user {user_id}: {e}")
         return None
@@ -231,38 +558,124 @@ def get_group_stats_for_user(user_id: int, days: int = 5) -> Optional[Dict]:
 def get_all_groups() -> Dict[str, Dict]:
     """Get all groups with their data - for compatibility with existing code"""
     try:
-        conn = get_db_connection()
-        cursor = conn.cursor()
-        
-        # Get all groups
-        cursor.execute(f"SELECT * FROM {GROUPS_TABLE}")
-        groups_data = cursor.fetchall()
-        
-        result = {}
-        for group_row in groups_data:
-            group_id = str(group_row['id'])
+        with _reader() as conn:
+            cursor = conn.cursor()
+            
+            # Get all groups
+            cursor.execute(f"SELECT * FROM {GROUPS_TABLE}")
+            groups_data = cursor.fetchall()
+            
+            result = {}
+            for group_row in groups_data:
+                group_id = str(group_row['id'])
+                
+                # Get entries for this group
+                cursor.execute(f"""
+                    SELECT * FROM {ENTRIES_TABLE} 
+                    WHERE group_id = ? AND deleted_at IS NULL
+                    ORDER BY ts DESC, id DESC
+                """, (group_row['id'],))
+                entries_data = cursor.fetchall()
+                
+                # Get poop for this group
+                cursor.execute(f"""
+                    SELECT * FROM {POOP_TABLE} 
+                    WHERE group_id = ? 
+                    ORDER BY ts DESC, id DESC
+                """, (group_row['id'],))
+                poop_data = cursor.fetchall()
+                
+                # Get user messages for this group
+                cursor.execute(f"""
+                    SELECT * FROM {USER_MESSAGES_TABLE} 
+                    WHERE group_id = ?
+                """, (group_row['id'],))
+                messages_data = cursor.fetchall()
+                
+                # Format entries
+                entries = []
+                for entry in entries_data:
+                    entries.append({
+                        'amount': entry['amount'],
+                        'time': _row_time(entry)
+                    })
+                
+                # Format poop
+                poop = []
+                for poop_entry in poop_data:
+                    poop.append({
+                        'time': _row_time(poop_entry),
+                        'info': poop_entry['info']
+                    })
+                
+                # Format user messages
+                user_messages = {}
+                for msg in messages_data:
+                    user_messages[str(msg['user_id'])] = {
+                        'main_message_id': msg['main_message_id'],
+                        'main_chat_id': msg['main_chat_id']
+                    }
+                
+                # Parse users JSON
+                users = []
+                if group_row['users']:
+                    try:
+                        users = json.loads(group_row['users'])
+                    except:
+                        users = []
+                
+                result[group_id] = {
+                    'id': group_row['id'],
+                    'name': group_row['name'],
+                    'users': users,
+                    'entries': entries,
+                    'poop': poop,
+                    'time_difference': group_row['time_difference'] or 0,
+                    'last_bottle': group_row['last_bottle'] or 0,
+                    'bottles_to_show': group_row['bottles_to_show'] or 5,
+                    'poops_to_show': group_row['poops_to_show'] or 1,
+                    'user_messages': user_messages
+                }
+            
+            _overlay_locations(result)
+            return result
+    except Exception as e:
+        print(f"Error getting all groups: {e}")
+        return {}
+
+def get_group_by_id(group_id: int) -> Optional[Dict]:
+    """Get a specific group by ID"""
+    try:
+        with _reader() as conn:
+            cursor = conn.cursor()
+            
+            cursor.execute(f"SELECT * FROM {GROUPS_TABLE} WHERE id = ?", (group_id,))
+            group_row = cursor.fetchone()
+            
+            if not group_row:
+                return None
             
             # Get entries for this group
             cursor.execute(f"""
                 SELECT * FROM {ENTRIES_TABLE} 
-                WHERE group_id = ? 
-                ORDER BY time DESC
-            """, (group_row['id'],))
+                WHERE group_id = ? AND deleted_at IS NULL
+                ORDER BY ts DESC, id DESC
+            """, (group_id,))
             entries_data = cursor.fetchall()
             
             # Get poop for this group
             cursor.execute(f"""
                 SELECT * FROM {POOP_TABLE} 
                 WHERE group_id = ? 
-                ORDER BY time DESC
-            """, (group_row['id'],))
+                ORDER BY ts DESC, id DESC
+            """, (group_id,))
             poop_data = cursor.fetchall()
             
             # Get user messages for this group
             cursor.execute(f"""
                 SELECT * FROM {USER_MESSAGES_TABLE} 
                 WHERE group_id = ?
-            """, (group_row['id'],))
+            """, (group_id,))
             messages_data = cursor.fetchall()
             
             # Format entries
@@ -270,14 +683,14 @@ def get_all_groups() -> Dict[str, Dict]:
             for entry in entries_data:
                 entries.append({
                     'amount': entry['amount'],
-                    'time': parse_time(entry['time'])
+                    'time': _row_time(entry)
                 })
             
             # Format poop
             poop = []
             for poop_entry in poop_data:
                 poop.append({
-                    'time': parse_time(poop_entry['time']),
+                    'time': _row_time(poop_entry),
                     'info': poop_entry['info']
                 })
             
@@ -288,6 +701,7 @@ def get_all_groups() -> Dict[str, Dict]:
                     'main_message_id': msg['main_message_id'],
                     'main_chat_id': msg['main_chat_id']
                 }
+            _overlay_locations({str(group_row['id']): {'user_messages': user_messages}})
             
             # Parse users JSON
             users = []
@@ -297,7 +711,7 @@ def get_all_groups() -> Dict[str, Dict]:
                 except:
                     users = []
             
-            result[group_id] = {
+            return {
                 'id': group_row['id'],
                 'name': group_row['name'],
                 'users': users,
@@ -309,416 +723,942 @@ def get_all_groups() -> Dict[str, Dict]:
                 'poops_to_show': group_row['poops_to_show'] or 1,
                 'user_messages': user_messages
             }
-        
-        return result
     except Exception as e:
-        print(f"Error getting all groups: {e}")
-        return {}
+        print(f"Error getting group by ID {group_id}: {e}")
+        return None
 
-def get_group_by_id(group_id: int) -> Optional[Dict]:
-    """Get a specific group by ID"""
+class GroupNameConflict(Exception):
+    """Raised by create_group/update_group_name when the name is already taken (case-insensitive) or reserved"""
+
+# group_<user id> (and group_<user id>_<n>) are personal groups: only the bot creates them, for that user
+_PERSONAL_GROUP_NAME = re.compile(r"group_(\d+)(?:_\d+)?", re.IGNORECASE)
+
+def is_personal_group_name(name: str, user_id: Optional[int] = None) -> bool:
+    """Whether name is in the reserved personal namespace (of this user, if given)"""
+    match = _PERSONAL_GROUP_NAME.fullmatch(name.strip())
+    return match is not None and (user_id is None or int(match.group(1)) == int(user_id))
+
+def find_group_id_by_name(name: str) -> Optional[int]:
+    """Return the id of the group with this name (case-insensitive), or None"""
     try:
-        conn = get_db_connection()
-        cursor = conn.cursor()
-        
-        cursor.execute(f"SELECT * FROM {GROUPS_TABLE} WHERE id = ?", (group_id,))
-        group_row = cursor.fetchone()
-        
-        if not group_row:
-            return None
-        
-        # Get entries for this group
-        cursor.execute(f"""
-            SELECT * FROM {ENTRIES_TABLE} 
-            WHERE group_id = ? 
-            ORDER BY time DESC
-        """, (group_id,))
-        entries_data = cursor.fetchall()
-        
-        # Get poop for this group
-        cursor.execute(f"""
-            SELECT * FROM {POOP_TABLE} 
-            WHERE group_id = ? 
-            ORDER BY time DESC
-        """, (group_id,))
-        poop_data = cursor.fetchall()
-        
-        # Get user messages for this group
-        cursor.execute(f"""
-            SELECT * FROM {USER_MESSAGES_TABLE} 
-            WHERE group_id = ?
-        """, (group_id,))
-        messages_data = cursor.fetchall()
-        
-        # Format entries
-        entries = []
-        for entry in entries_data:
-            entries.append({
-                'amount': entry['amount'],
-                'time': parse_time(entry['time'])
-            })
-        
-        # Format poop
-        poop = []
-        for poop_entry in poop_data:
-            poop.append({
-                'time': parse_time(poop_entry['time']),
-                'info': poop_entry['info']
-            })
-        
-        # Format user messages
-        user_messages = {}
-        for msg in messages_data:
-            user_messages[str(msg['user_id'])] = {
-                'main_message_id': msg['main_message_id'],
-                'main_chat_id': msg['main_chat_id']
-            }
-        
-        # Parse users JSON
-        users = []
-        if group_row['users']:
-            try:
-                users = json.loads(group_row['users'])
-            except:
-                users = []
-        
-        return {
-            'id': group_row['id'],
-            'name': group_row['name'],
-            'users': users,
-            'entries': entries,
-            'poop': poop,
-            'time_difference': group_row['time_difference'] or 0,
-            'last_bottle': group_row['last_bottle'] or 0,
-            'bottles_to_show': group_row['bottles_to_show'] or 5,
-            'poops_to_show': group_row['poops_to_show'] or 1,
-            'user_messages': user_messages
-        }
+        with _reader() as conn:
+            # COLLATE NOCASE matches the unique index idx_groups_name_nocase: one index seek
+            row = conn.execute(f"""
+                SELECT id FROM {GROUPS_TABLE} WHERE name = ? COLLATE NOCASE
+            """, (name,)).fetchone()
+            return row['id'] if row else None
     except Exception as e:
-        print(f"Error getting group by ID {group_id}: {e}")
+        print(f"Error finding group {name}: {e}")
         return None
 
+def get_group_members(group_id: int) -> List[int]:
+    """User IDs of a group, in the order they joined"""
+    try:
+        with _reader() as conn:
+            rows = conn.execute(f"""
+                SELECT user_id FROM {GROUP_MEMBERS_TABLE} WHERE group_id = ? ORDER BY rowid
+            """, (int(group_id),)).fetchall()
+            return [row['user_id'] for row in rows]
+    except Exception as e:
+        print(f"Error getting members of group {group_id}: {e}")
+        return []
+
+def get_group_settings(group_id: int) -> Optional[Dict]:
+    """Name and display settings of a group, without its entries"""
+    try:
+        with _reader() as conn:
+            row = conn.execute(f"""
+                SELECT id, name, time_difference, last_bottle, bottles_to_show, poops_to_show,
+                       (SELECT COUNT(*) FROM {GROUP_MEMBERS_TABLE} WHERE group_id = g.id) AS member_count
+                FROM {GROUPS_TABLE} g WHERE id = ?
+            """, (int(group_id),)).fetchone()
+            if not row:
+                return None
+            return {
+                'id': row['id'],
+                'name': row['name'],
+                'time_difference': row['time_difference'] or 0,
+                'last_bottle': row['last_bottle'] or 0,
+                'bottles_to_show': row['bottles_to_show'] or 5,
+                'poops_to_show': row['poops_to_show'] or 1,
+                'member_count': row['member_count']
+            }
+    except Exception as e:
+        print(f"Error getting settings of group {group_id}: {e}")
+        return None
 
 def create_group(group_name: str, user_id: int) -> Optional[int]:
-    """Create a new group and return the group ID"""
+    """Create a new group and return the group ID.
+    
+    Raises GroupNameConflict if the name is taken: the unique index decides, so
+    two concurrent creations of the same name cannot both succeed. Personal
+    group names are only available to their own user.
+    """
+    if is_personal_group_name(group_name) and not is_personal_group_name(group_name, user_id):
+        raise GroupNameConflict(group_name)
     try:
-        conn = get_db_connection()
-        cursor = conn.cursor()
-        
-        # Check if group already exists
-        cursor.execute(f"SELECT id FROM {GROUPS_TABLE} WHERE name = ?", (group_name,))
-        if cursor.fetchone():
-            return None
-        
-        # Create new group
-        users_json = json.dumps([user_id])
-        cursor.execute(f"""
-            INSERT INTO {GROUPS_TABLE} (name, users, time_difference, last_bottle, bottles_to_show, poops_to_show)
-            VALUES (?, ?, 3, 0, 5, 1)
-        """, (group_name, users_json))
-        
-        # Get the created group ID
-        group_id = cursor.lastrowid
+        with _writer() as conn:
+            cursor = conn.cursor()
+            
+            # Create new group
+            users_json = json.dumps([user_id])
+            cursor.execute(f"""
+                INSERT INTO {GROUPS_TABLE} (name, users, time_difference, last_bottle, bottles_to_show, poops_to_show)
+                VALUES (?, ?, 3, 0, 5, 1)
+            """, (group_name, users_json))
+            
+            # Get the created group ID
+            group_id = cursor.lastrowid
+            
+            cursor.execute(f"""
+                INSERT OR IGNORE INTO {GROUP_MEMBERS_TABLE} (user_id, group_id)
+                VALUES (?, ?)
+            """, (int(user_id), group_id))
         
-        conn.commit()
+        # Committed: the new group may take precedence over the creator's personal one
+        invalidate_group_cache(group_id, membership=True)
         print(f"Created group {group_name} with ID {group_id}")
         return group_id
+    except sqlite3.IntegrityError:
+        raise GroupNameConflict(group_name) from None
     except Exception as e:
         print(f"Error creating group {group_name}: {e}")
         return None
 
-def update_group(group_id: int, group_data: Dict) -> bool:
-    """Update group data"""
+# Columns of the groups table that update_group_settings may change
+GROUP_SETTINGS_FIELDS = ("name", "time_difference", "last_bottle", "bottles_to_show", "poops_to_show")
+
+# Only a rename can change which group a user resolves to
+@_invalidates_group(membership=lambda group_id, **fields: 'name' in fields)
+def update_group_settings(group_id: int, **fields) -> bool:
+    """Update only the given group settings, e.g. update_group_settings(1, bottles_to_show=6).
+
+    Raises GroupNameConflict, like update_group_name, if a new name is taken or reserved.
+    """
+    unknown = set(fields) - set(GROUP_SETTINGS_FIELDS)
+    if unknown:
+        print(f"Error updating group {group_id}: unknown settings {sorted(unknown)}")
+        return False
+    if not fields:
+        return True
+    if 'name' in fields and is_personal_group_name(fields['name']):
+        raise GroupNameConflict(fields['name'])
+    
     try:
-        conn = get_db_connection()
-        cursor = conn.cursor()
-        
-        # Update group basic info
-        cursor.execute(f"""
-            UPDATE {GROUPS_TABLE} 
-            SET name = ?, users = ?, time_difference = ?, last_bottle = ?, 
-                bottles_to_show = ?, poops_to_show = ?
-            WHERE id = ?
-        """, (
-            group_data.get('name', ''),
-            json.dumps(group_data.get('users', [])),
-            group_data.get('time_difference', 3),
-            group_data.get('last_bottle', 0),
-            group_data.get('bottles_to_show', 5),
-            group_data.get('poops_to_show', 1),
-            group_id
-        ))
-        
-        # Update entries
-        cursor.execute(f"DELETE FROM {ENTRIES_TABLE} WHERE group_id = ?", (group_id,))
-        for entry in group_data.get('entries', []):
-            cursor.execute(f"""
-                INSERT INTO {ENTRIES_TABLE} (group_id, amount, time)
-                VALUES (?, ?, ?)
-            """, (group_id, entry['amount'], entry['time'].isoformat()))
-        
-        # Update poop
-        cursor.execute(f"DELETE FROM {POOP_TABLE} WHERE group_id = ?", (group_id,))
-        for poop_entry in group_data.get('poop', []):
-            cursor.execute(f"""
-                INSERT INTO {POOP_TABLE} (group_id, time, info)
-                VALUES (?, ?, ?)
-            """, (group_id, poop_entry['time'].isoformat(), poop_entry.get('info')))
-        
-        # Update user messages
-        cursor.execute(f"DELETE FROM {USER_MESSAGES_TABLE} WHERE group_id = ?", (group_id,))
-        for user_id_str, msg_info in group_data.get('user_messages', {}).items():
+        with _writer() as conn:
+            cursor = conn.cursor()
+            
+            # Column names come from the whitelist above, values are bound
+            assignments = ", ".join(f"{column} = ?" for column in fields)
             cursor.execute(f"""
-                INSERT INTO {USER_MESSAGES_TABLE} (group_id, user_id, main_message_id, main_chat_id)
-                VALUES (?, ?, ?, ?)
-            """, (group_id, int(user_id_str), msg_info.get('main_message_id'), msg_info.get('main_chat_id')))
-        
-        conn.commit()
-        return True
+                UPDATE {GROUPS_TABLE} SET {assignments} WHERE id = ?
+            """, (*fields.values(), group_id))
+            
+            return cursor.rowcount > 0
+    except sqlite3.IntegrityError:
+        # Only the name is unique (idx_groups_name_nocase)
+        raise GroupNameConflict(fields['name']) from None
     except Exception as e:
         print(f"Error updating group {group_id}: {e}")
         return False
 
-def add_entry_to_group(group_id: int, amount: int, time: datetime) -> bool:
-    """Add a bottle entry to a group"""
+@_invalidates_group(membership=True)
+def update_group_members(group_id: int, add: Optional[List[int]] = None, remove: Optional[List[int]] = None) -> bool:
+    """Add and/or remove users from a group, keeping the users column and group_members in sync"""
+    add_ids = _to_int_users(add or [])
+    remove_ids = set(_to_int_users(remove or []))
+    
     try:
-        conn = get_db_connection()
-        cursor = conn.cursor()
-        
-        cursor.execute(f"""
-            INSERT INTO {ENTRIES_TABLE} (group_id, amount, time)
-            VALUES (?, ?, ?)
-        """, (group_id, amount, time.isoformat()))
-        
-        conn.commit()
-        return True
+        with _writer() as conn:
+            cursor = conn.cursor()
+            
+            cursor.execute(f"SELECT users FROM {GROUPS_TABLE} WHERE id = ?", (group_id,))
+            row = cursor.fetchone()
+            if not row:
+                return False
+            
+            users = [user for user in _parse_users(row['users']) if user not in remove_ids]
+            for user_id in add_ids:
+                if user_id not in users:
+                    users.append(user_id)
+            
+            cursor.execute(f"""
+                UPDATE {GROUPS_TABLE} SET users = ? WHERE id = ?
+            """, (json.dumps(users), group_id))
+            
+            for user_id in remove_ids:
+                cursor.execute(f"""
+                    DELETE FROM {GROUP_MEMBERS_TABLE} WHERE group_id = ? AND user_id = ?
+                """, (group_id, user_id))
+            for user_id in add_ids:
+                cursor.execute(f"""
+                    INSERT OR IGNORE INTO {GROUP_MEMBERS_TABLE} (user_id, group_id)
+                    VALUES (?, ?)
+                """, (user_id, group_id))
+            
+            return True
+    except Exception as e:
+        print(f"Error updating members of group {group_id}: {e}")
+        return False
+
+@_invalidates_group()
+def add_entry_to_group(group_id: int, amount: int, time: datetime, idempotency_key: Optional[str] = None) -> bool:
+    """Add a bottle entry to a group; a second call with the same idempotency_key (per group) changes nothing"""
+    try:
+        with _writer() as conn:
+            cursor = conn.cursor()
+            
+            cursor.execute(f"""
+                INSERT INTO {ENTRIES_TABLE} (group_id, amount, time, ts, idempotency_key)
+                VALUES (?, ?, ?, ?, ?)
+                ON CONFLICT(group_id, idempotency_key) WHERE idempotency_key IS NOT NULL DO NOTHING
+            """, (group_id, amount, time.isoformat(), to_epoch(time), idempotency_key))
+            if cursor.rowcount == 0:
+                print(f"Ignored duplicate bottle for group {group_id} (key {idempotency_key})")
+                return True
+            _bump_rollup(cursor, group_id, to_epoch(time), bottles=1, ml=amount)
+            
+            return True
     except Exception as e:
         print(f"Error adding entry to group {group_id}: {e}")
         return False
 
+@_invalidates_group()
 def remove_last_entry_from_group(group_id: int) -> bool:
-    """Remove the last bottle entry from a group"""
+    """Remove the last bottle entry from a group (tombstoned: restore_last_deleted_entry undoes it)"""
     try:
-        conn = get_db_connection()
-        cursor = conn.cursor()
-        
-        # Get the last entry
-        cursor.execute(f"""
-            SELECT id FROM {ENTRIES_TABLE} 
-            WHERE group_id = ? 
-            ORDER BY time DESC 
-            LIMIT 1
-        """, (group_id,))
-        
-        last_entry = cursor.fetchone()
-        if not last_entry:
-            return False
-        
-        # Delete the last entry
-        cursor.execute(f"DELETE FROM {ENTRIES_TABLE} WHERE id = ?", (last_entry['id'],))
-        
-        conn.commit()
-        return True
+        with _writer() as conn:
+            cursor = conn.cursor()
+            
+            # Get the last entry
+            cursor.execute(f"""
+                SELECT id, amount, ts FROM {ENTRIES_TABLE} 
+                WHERE group_id = ? AND deleted_at IS NULL
+                ORDER BY ts DESC, id DESC 
+                LIMIT 1
+            """, (group_id,))
+            
+            last_entry = cursor.fetchone()
+            if not last_entry:
+                return False
+            
+            # Tombstone the last entry; purge_tombstones deletes it for good later
+            cursor.execute(f"UPDATE {ENTRIES_TABLE} SET deleted_at = ? WHERE id = ?",
+                           (to_epoch(datetime.now(UTC)), last_entry['id']))
+            _bump_rollup(cursor, group_id, last_entry['ts'], bottles=-1, ml=-last_entry['amount'])
+            
+            return True
     except Exception as e:
         print(f"Error removing last entry from group {group_id}: {e}")
         return False
 
-def add_poop_to_group(group_id: int, time: datetime, info: Optional[str] = None) -> bool:
-    """Add a poop entry to a group"""
+@_invalidates_group()
+def restore_last_deleted_entry(group_id: int) -> Optional[Dict]:
+    """Undo the group's most recent bottle deletion; returns the restored entry, None if there is none"""
     try:
-        conn = get_db_connection()
-        cursor = conn.cursor()
-        
-        cursor.execute(f"""
-            INSERT INTO {POOP_TABLE} (group_id, time, info)
-            VALUES (?, ?, ?)
-        """, (group_id, time.isoformat(), info))
-        
-        conn.commit()
-        return True
+        with _writer() as conn:
+            cursor = conn.cursor()
+            
+            # Within one second, deletions went from the newest bottle to older ones
+            cursor.execute(f"""
+                SELECT id, amount, time, ts FROM {ENTRIES_TABLE} 
+                WHERE group_id = ? AND deleted_at IS NOT NULL
+                ORDER BY deleted_at DESC, ts ASC, id ASC 
+                LIMIT 1
+            """, (group_id,))
+            
+            deleted_entry = cursor.fetchone()
+            if not deleted_entry:
+                return None
+            
+            cursor.execute(f"UPDATE {ENTRIES_TABLE} SET deleted_at = NULL WHERE id = ?", (deleted_entry['id'],))
+            _bump_rollup(cursor, group_id, deleted_entry['ts'], bottles=1, ml=deleted_entry['amount'])
+            
+            return {'amount': deleted_entry['amount'], 'time': _row_time(deleted_entry)}
+    except Exception as e:
+        print(f"Error restoring deleted entry of group {group_id}: {e}")
+        return None
+
+@_invalidates_group()
+def add_poop_to_group(group_id: int, time: datetime, info: Optional[str] = None,
+                      idempotency_key: Optional[str] = None) -> bool:
+    """Add a poop entry to a group; a second call with the same idempotency_key (per group) changes nothing"""
+    try:
+        with _writer() as conn:
+            cursor = conn.cursor()
+            
+            cursor.execute(f"""
+                INSERT INTO {POOP_TABLE} (group_id, time, info, ts, idempotency_key)
+                VALUES (?, ?, ?, ?, ?)
+                ON CONFLICT(group_id, idempotency_key) WHERE idempotency_key IS NOT NULL DO NOTHING
+            """, (group_id, time.isoformat(), info, to_epoch(time), idempotency_key))
+            if cursor.rowcount == 0:
+                print(f"Ignored duplicate poop for group {group_id} (key {idempotency_key})")
+                return True
+            _bump_rollup(cursor, group_id, to_epoch(time), poops=1)
+            
+            return True
     except Exception as e:
         print(f"Error adding poop to group {group_id}: {e}")
         return False
 
+# Write-behind map of where each user's main message is: (group_id, user_id) ->
+# (message_id, chat_id), or None once cleared. Every edit re-saves the location,
+# which costs nothing when it did not change; changes wait in _dirty_locations
+# until flush_message_locations UPSERTs them (periodically and at shutdown).
+# A lost flush only means a stale message id, which the bot already recovers from.
+_message_locations: Dict[Tuple[int, int], Optional[Tuple[int, int]]] = {}
+_dirty_locations: Dict[Tuple[int, int], Optional[Tuple[int, int]]] = {}
+_locations_lock = threading.Lock()
+
+def _known_location(group_id: int, user_id: int) -> Any:
+    """In-memory location (possibly not flushed yet), None if cleared, MISSING if unknown"""
+    with _locations_lock:
+        return _message_locations.get((int(group_id), int(user_id)), MISSING)
+
+def _overlay_locations(groups: Dict[str, Dict]):
+    """Apply unflushed locations to the user_messages of groups read from the database"""
+    with _locations_lock:
+        changes = [(key, location) for key, location in _dirty_locations.items() if str(key[0]) in groups]
+    for (group_id, user_id), location in changes:
+        user_messages = groups[str(group_id)]['user_messages']
+        if location is None:
+            user_messages.pop(str(user_id), None)
+        else:
+            user_messages[str(user_id)] = {'main_message_id': location[0], 'main_chat_id': location[1]}
+
 def set_user_message_info(group_id: int, user_id: int, message_id: int, chat_id: int) -> bool:
-    """Set user message information"""
+    """Record where a user's main message is; only a change is written, by the next flush"""
+    if group_id is None:
+        return False
+    key = (int(group_id), int(user_id))
+    location = (message_id, chat_id)
+    with _locations_lock:
+        if _message_locations.get(key) == location:
+            return True
+        _message_locations[key] = location
+        _dirty_locations[key] = location
+    return True
+
+def get_cached_message_info(group_id: int, user_id: int) -> Optional[tuple]:
+    """Location from memory without touching the database, None when not loaded yet"""
+    location = _known_location(group_id, user_id)
+    if location is MISSING:
+        return None
+    return location or (None, None)
+
+def get_user_message_info(group_id: int, user_id: int) -> tuple:
+    """Get user message information"""
+    cached = get_cached_message_info(group_id, user_id)
+    if cached is not None:
+        return cached
     try:
-        conn = get_db_connection()
-        cursor = conn.cursor()
-        
-        # Check if record exists
-        cursor.execute(f"""
-            SELECT id FROM {USER_MESSAGES_TABLE} 
-            WHERE group_id = ? AND user_id = ?
-        """, (group_id, user_id))
-        
-        existing = cursor.fetchone()
-        if existing:
-            # Update existing record
+        with _reader() as conn:
+            cursor = conn.cursor()
+            
             cursor.execute(f"""
-                UPDATE {USER_MESSAGES_TABLE} 
-                SET main_message_id = ?, main_chat_id = ?
+                SELECT main_message_id, main_chat_id FROM {USER_MESSAGES_TABLE} 
                 WHERE group_id = ? AND user_id = ?
-            """, (message_id, chat_id, group_id, user_id))
-        else:
-            # Insert new record
-            cursor.execute(f"""
+            """, (group_id, user_id))
+            
+            result = cursor.fetchone()
+        location = (result['main_message_id'], result['main_chat_id']) if result else None
+        with _locations_lock:
+            # A set/clear that happened meanwhile is newer than what was read
+            location = _message_locations.setdefault((int(group_id), int(user_id)), location)
+        if location is None:
+            print(f"No message info found for user {user_id} in group {group_id}")
+            return (None, None)
+        return location
+    except Exception as e:
+        print(f"Error getting user message info: {e}")
+        return (None, None)
+
+def clear_user_message_info(group_id: int, user_id: int) -> bool:
+    """Forget a user's main message (deleted by the next flush)"""
+    if group_id is None:
+        return False
+    key = (int(group_id), int(user_id))
+    with _locations_lock:
+        if key in _message_locations and _message_locations[key] is None:
+            return True
+        _message_locations[key] = None
+        _dirty_locations[key] = None
+    return True
+
+def flush_message_locations() -> int:
+    """Write the changed message locations in one transaction; returns how many were written"""
+    with _locations_lock:
+        if not _dirty_locations:
+            return 0
+        pending = dict(_dirty_locations)
+        _dirty_locations.clear()
+    
+    upserts = [(g, u, location[0], location[1]) for (g, u), location in pending.items() if location is not None]
+    deletes = [(g, u) for (g, u), location in pending.items() if location is None]
+    try:
+        with _writer() as conn:
+            cursor = conn.cursor()
+            # One row per (group_id, user_id), enforced by the unique idx_user_messages_group_user
+            cursor.executemany(f"""
                 INSERT INTO {USER_MESSAGES_TABLE} (group_id, user_id, main_message_id, main_chat_id)
                 VALUES (?, ?, ?, ?)
-            """, (group_id, user_id, message_id, chat_id))
-        
-        conn.commit()
+                ON CONFLICT(group_id, user_id) DO UPDATE SET
+                    main_message_id = excluded.main_message_id,
+                    main_chat_id = excluded.main_chat_id
+            """, upserts)
+            cursor.executemany(f"""
+                DELETE FROM {USER_MESSAGES_TABLE} 
+                WHERE group_id = ? AND user_id = ?
+            """, deletes)
+        return len(pending)
+    except Exception as e:
+        print(f"Error flushing {len(pending)} message locations: {e}")
+        with _locations_lock:
+            # Keep them for the next flush, unless a newer change was recorded meanwhile
+            for key, location in pending.items():
+                _dirty_locations.setdefault(key, location)
+        return 0
+
+_location_flusher: Optional[threading.Thread] = None
+_location_flusher_stop = threading.Event()
+
+def _flush_locations_loop():
+    while not _location_flusher_stop.wait(MESSAGE_LOCATION_FLUSH_SECONDS):
+        flush_message_locations()
+
+def start_message_location_flusher():
+    """Flush changed message locations every MESSAGE_LOCATION_FLUSH_SECONDS on a background thread"""
+    global _location_flusher
+    if _location_flusher is not None and _location_flusher.is_alive():
+        return
+    _location_flusher_stop.clear()
+    _location_flusher = threading.Thread(target=_flush_locations_loop, name="message-locations", daemon=True)
+    _location_flusher.start()
+
+def stop_message_location_flusher():
+    """Stop the flusher thread and write what is still pending (called at shutdown)"""
+    global _location_flusher
+    _location_flusher_stop.set()
+    if _location_flusher is not None:
+        _location_flusher.join(10)
+        _location_flusher = None
+    flush_message_locations()
+
+# Outbox of failed dashboard edits: (chat_id, message_id) -> version of its queued
+# row, so a later successful edit of the message drops it without a query when
+# nothing is queued. Filled by load_outbox_keys at startup.
+_outbox_versions: Dict[Tuple[int, int], int] = {}
+_outbox_lock = threading.Lock()
+
+def load_outbox_keys() -> int:
+    """Load which messages have a queued edit; returns the queue depth"""
+    with _reader() as conn:
+        rows = conn.execute(f"SELECT chat_id, message_id, version FROM {OUTBOX_TABLE}").fetchall()
+    with _outbox_lock:
+        _outbox_versions.clear()
+        _outbox_versions.update({(row['chat_id'], row['message_id']): row['version'] for row in rows})
+    return len(rows)
+
+def has_outbox_edit(chat_id: int, message_id: int, version: Optional[int] = None) -> bool:
+    """Whether an edit of the message is queued (this version of it, if given); no database access"""
+    with _outbox_lock:
+        queued = _outbox_versions.get((int(chat_id), int(message_id)))
+    return queued is not None and (version is None or queued == version)
+
+def enqueue_outbox_edit(group_id: int, user_id: int, chat_id: int, message_id: int, text: str,
+                        reply_markup: Optional[str], parse_mode: Optional[str], error: str, delay: float) -> bool:
+    """Queue the edit of a message, retried in delay seconds.
+
+    An edit already queued for the message is replaced by this (newer) content
+    and keeps its attempts and schedule.
+    """
+    now = datetime.now(UTC).timestamp()
+    try:
+        with _writer() as conn:
+            row = conn.execute(f"""
+                INSERT INTO {OUTBOX_TABLE} (chat_id, message_id, group_id, user_id, text, reply_markup, parse_mode,
+                                            next_attempt_at, last_error, created_at)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+                ON CONFLICT(chat_id, message_id) DO UPDATE SET
+                    group_id = excluded.group_id,
+                    user_id = excluded.user_id,
+                    text = excluded.text,
+                    reply_markup = excluded.reply_markup,
+                    parse_mode = excluded.parse_mode,
+                    last_error = excluded.last_error,
+                    version = version + 1
+                RETURNING version
+            """, (chat_id, message_id, group_id, user_id, text, reply_markup, parse_mode, now + delay, error, now)).fetchone()
+        with _outbox_lock:
+            _outbox_versions[(int(chat_id), int(message_id))] = row['version']
         return True
     except Exception as e:
-        print(f"Error setting user message info: {e}")
+        print(f"Error queuing edit of message {message_id} in chat {chat_id}: {e}")
         return False
 
-def get_user_message_info(group_id: int, user_id: int) -> tuple:
-    """Get user message information"""
+def get_due_outbox_edits(limit: int) -> List[Dict]:
+    """Queued edits whose retry time has come, oldest schedule first"""
     try:
-        conn = get_db_connection()
-        cursor = conn.cursor()
-        
-        cursor.execute(f"""
-            SELECT main_message_id, main_chat_id FROM {USER_MESSAGES_TABLE} 
-            WHERE group_id = ? AND user_id = ?
-        """, (group_id, user_id))
-        
-        result = cursor.fetchone()
-        if result:
-            return (result['main_message_id'], result['main_chat_id'])
-        print(f"No message info found for user {user_id} in group {group_id}")
-        return (None, None)
+        with _reader() as conn:
+            rows = conn.execute(f"""
+                SELECT * FROM {OUTBOX_TABLE}
+                WHERE next_attempt_at <= ?
+                ORDER BY next_attempt_at
+                LIMIT ?
+            """, (datetime.now(UTC).timestamp(), limit)).fetchall()
+        return [dict(row) for row in rows]
     except Exception as e:
-        print(f"Error getting user message info: {e}")
-        return (None, None)
+        print(f"Error reading the edit outbox: {e}")
+        return []
 
-def clear_user_message_info(group_id: int, user_id: int) -> bool:
-    """Clear user message information"""
+def retry_outbox_edit(chat_id: int, message_id: int, attempts: int, delay: float, error: str) -> bool:
+    """Reschedule a queued edit after a failed attempt"""
     try:
-        conn = get_db_connection()
-        cursor = conn.cursor()
-        
-        cursor.execute(f"""
-            DELETE FROM {USER_MESSAGES_TABLE} 
-            WHERE group_id = ? AND user_id = ?
-        """, (group_id, user_id))
-        
-        conn.commit()
+        with _writer() as conn:
+            conn.execute(f"""
+                UPDATE {OUTBOX_TABLE} SET attempts = ?, next_attempt_at = ?, last_error = ?
+                WHERE chat_id = ? AND message_id = ?
+            """, (attempts, datetime.now(UTC).timestamp() + delay, error, chat_id, message_id))
         return True
     except Exception as e:
-        print(f"Error clearing user message info: {e}")
+        print(f"Error rescheduling edit of message {message_id} in chat {chat_id}: {e}")
         return False
 
-def create_database_backup() -> bool:
-    """Create a backup of the database before cleanup"""
+def remove_outbox_edit(chat_id: int, message_id: int, version: Optional[int] = None) -> bool:
+    """Drop the queued edit of a message (only if still at this version, when given)"""
+    key = (int(chat_id), int(message_id))
+    if not has_outbox_edit(chat_id, message_id, version):
+        return False
     try:
-        if not os.path.exists(DATABASE_PATH):
-            print("Database file not found, skipping backup")
-            return False
-        
-        # Create backup directory if it doesn't exist
-        backup_dir = os.path.join(os.path.dirname(DATABASE_PATH), "backups")
-        os.makedirs(backup_dir, exist_ok=True)
-        
-        # Generate backup filename with timestamp
-        timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-        backup_filename = f"baby_bottle_tracker_backup_{timestamp}.db"
-        backup_path = os.path.join(backup_dir, backup_filename)
-        
-        # Copy database file
-        shutil.copy2(DATABASE_PATH, backup_path)
-        
-        # Keep only the last 7 backups to avoid disk space issues
-        backup_files = [f for f in os.listdir(backup_dir) if f.startswith("baby_bottle_tracker_backup_") and f.endswith(".db")]
-        backup_files.sort(reverse=True)  # Sort by name (timestamp) descending
-        
-        if len(backup_files) > 7:
-            for old_backup in backup_files[7:]:
-                old_backup_path = os.path.join(backup_dir, old_backup)
-                try:
-                    os.remove(old_backup_path)
-                    print(f"Removed old backup: {old_backup}")
-                except Exception as e:
-                    print(f"Failed to remove old backup {old_backup}: {e}")
-        
-        print(f"Database backup created: {backup_path}")
+        with _writer() as conn:
+            if version is None:
+                conn.execute(f"DELETE FROM {OUTBOX_TABLE} WHERE chat_id = ? AND message_id = ?", key)
+            else:
+                conn.execute(f"DELETE FROM {OUTBOX_TABLE} WHERE chat_id = ? AND message_id = ? AND version = ?",
+                             key + (version,))
+        with _outbox_lock:
+            if version is None or _outbox_versions.get(key) == version:
+                _outbox_versions.pop(key, None)
         return True
     except Exception as e:
-        print(f"Error creating database backup: {e}")
+        print(f"Error removing edit of message {message_id} in chat {chat_id} from the outbox: {e}")
         return False
 
-def cleanup_old_data() -> bool:
-    """Clean up old data (entries older than 32 days) and create backup"""
+def get_outbox_depth() -> Dict[str, Any]:
+    """Queued edits, how many are due, the oldest one's age (s) and the most attempts of any"""
     try:
-        # Create backup before cleanup
-        backup_success = create_database_backup()
-        if not backup_success:
-            print("Warning: Backup failed, but continuing with cleanup")
-        
-        conn = get_db_connection()
-        cursor = conn.cursor()
-        
-        from datetime import timedelta
-        cutoff_date = (datetime.now(ZoneInfo('UTC')) - timedelta(days=32)).isoformat()
-        
-        # Delete old entries
-        cursor.execute(f"DELETE FROM {ENTRIES_TABLE} WHERE time < ?", (cutoff_date,))
-        entries_deleted = cursor.rowcount
-        
-        # Delete old poop entries
-        cursor.execute(f"DELETE FROM {POOP_TABLE} WHERE time < ?", (cutoff_date,))
-        poop_deleted = cursor.rowcount
+        with _reader() as conn:
+            row = conn.execute(f"""
+                SELECT COUNT(*) AS pending,
+                       COALESCE(SUM(next_attempt_at <= :now), 0) AS due,
+                       MIN(created_at) AS oldest,
+                       COALESCE(MAX(attempts), 0) AS max_attempts
+                FROM {OUTBOX_TABLE}
+            """, {'now': datetime.now(UTC).timestamp()}).fetchone()
+        return {
+            'pending': row['pending'],
+            'due': row['due'],
+            'oldest_s': round(datetime.now(UTC).timestamp() - row['oldest'], 1) if row['oldest'] is not None else 0,
+            'max_attempts': row['max_attempts'],
+        }
+    except Exception as e:
+        print(f"Error reading the edit outbox depth: {e}")
+        return {}
+
+# Columns copied to the archive, per hot table
+ARCHIVE_COLUMNS = {
+    ENTRIES_TABLE: ("id", "group_id", "amount", "time", "ts", "created_at"),
+    POOP_TABLE: ("id", "group_id", "time", "ts", "info", "created_at"),
+}
+
+def _month_of(ts: int) -> str:
+    return datetime.fromtimestamp(ts, UTC).strftime("%Y%m")
+
+def _hot_cutoff_ts() -> int:
+    """Rows with ts below this belong in the archive"""
+    from datetime import timedelta
+    return to_epoch(datetime.now(UTC) - timedelta(days=HOT_RETENTION_DAYS))
+
+def _archive_tables(cursor, table: str, start_ts: int, end_ts: Optional[int] = None) -> List[str]:
+    """Archive partitions (table_YYYYMM) that can hold rows in [start_ts, end_ts]"""
+    first_month = _month_of(start_ts)
+    last_month = _month_of(end_ts) if end_ts is not None else "999999"
+    cursor.execute(f"""
+        SELECT name FROM {ARCHIVE_SCHEMA}.sqlite_master
+        WHERE type = 'table' AND name GLOB '{table}_[0-9][0-9][0-9][0-9][0-9][0-9]'
+        ORDER BY name
+    """)
+    return [row['name'] for row in cursor.fetchall() if first_month <= row['name'][-6:] <= last_month]
+
+def _ensure_archive_table(cursor, table: str, month: str) -> str:
+    """Create the archive partition for a month if needed and return its name"""
+    name = f"{table}_{month}"
+    if table == ENTRIES_TABLE:
+        columns = "id INTEGER PRIMARY KEY, group_id INTEGER NOT NULL, amount INTEGER NOT NULL, time TIMESTAMP NOT NULL, ts INTEGER, created_at TIMESTAMP"
+    else:
+        columns = "id INTEGER PRIMARY KEY, group_id INTEGER NOT NULL, time TIMESTAMP NOT NULL, ts INTEGER, info TEXT, created_at TIMESTAMP"
+    cursor.execute(f"CREATE TABLE IF NOT EXISTS {ARCHIVE_SCHEMA}.{name} ({columns})")
+    cursor.execute(f"CREATE INDEX IF NOT EXISTS {ARCHIVE_SCHEMA}.idx_{name}_group_ts ON {name}(group_id, ts)")
+    return name
+
+def _live_clause(source: str) -> str:
+    """Filter out tombstoned rows; only the hot entries table has them (tombstones are never archived)"""
+    return " AND deleted_at IS NULL" if source == ENTRIES_TABLE else ""
+
+def _fetch_history(cursor, table: str, group_id: int, start_ts: int, end_ts: Optional[int] = None) -> List:
+    """Rows of a group in [start_ts, end_ts], newest first, merging the hot table and the archive"""
+    columns = ", ".join(ARCHIVE_COLUMNS[table])
+    end_clause = " AND ts <= ?" if end_ts is not None else ""
+    params = (group_id, start_ts) + ((end_ts,) if end_ts is not None else ())
+    
+    sources = [table]
+    if start_ts < _hot_cutoff_ts():
+        sources += [f"{ARCHIVE_SCHEMA}.{name}" for name in _archive_tables(cursor, table, start_ts, end_ts)]
+    
+    # UNION (not UNION ALL) drops a row left in both places by an interrupted archive batch
+    query = " UNION ".join(
+        f"SELECT {columns} FROM {source} WHERE group_id = ? AND ts >= ?{end_clause}{_live_clause(source)}"
+        for source in sources
+    )
+    cursor.execute(f"{query} ORDER BY ts DESC, id DESC", params * len(sources))
+    return cursor.fetchall()
+
+def get_group_history(group_id: int, start: datetime, end: Optional[datetime] = None) -> Optional[Dict]:
+    """Entries and poop of a group between two dates, read from both the hot and archive databases"""
+    try:
+        with _reader() as conn:
+            cursor = conn.cursor()
+            start_ts = to_epoch(start)
+            end_ts = to_epoch(end) if end is not None else None
+            entries = [
+                {'amount': row['amount'], 'time': _row_time(row)}
+                for row in _fetch_history(cursor, ENTRIES_TABLE, group_id, start_ts, end_ts)
+            ]
+            poop = [
+                {'time': _row_time(row), 'info': row['info']}
+                for row in _fetch_history(cursor, POOP_TABLE, group_id, start_ts, end_ts)
+            ]
+            return {'entries': entries, 'poop': poop}
+    except Exception as e:
+        print(f"Error getting history for group {group_id}: {e}")
+        return None
+
+def archive_old_data(batch_size: int = ARCHIVE_BATCH_SIZE) -> Dict[str, int]:
+    """Move entries/poop older than HOT_RETENTION_DAYS into the monthly archive tables.
+
+    Each batch is its own short writer transaction so regular writes interleave.
+    The archive keeps the original ids and uses INSERT OR IGNORE, so a batch
+    interrupted between the insert and the delete is simply redone next time.
+    """
+    cutoff_ts = _hot_cutoff_ts()
+    moved = {ENTRIES_TABLE: 0, POOP_TABLE: 0}
+    
+    for table, column_names in ARCHIVE_COLUMNS.items():
+        columns = ", ".join(column_names)
+        placeholders = ", ".join("?" * len(column_names))
+        while True:
+            with _writer() as conn:
+                cursor = conn.cursor()
+                cursor.execute(f"""
+                    SELECT {columns} FROM {table}
+                    WHERE ts < ?{_live_clause(table)}
+                    ORDER BY ts
+                    LIMIT ?
+                """, (cutoff_ts, batch_size))
+                rows = cursor.fetchall()
+                if not rows:
+                    break
+                
+                by_month = {}
+                for row in rows:
+                    by_month.setdefault(_month_of(row['ts']), []).append(tuple(row))
+                for month, month_rows in by_month.items():
+                    archive_table = _ensure_archive_table(cursor, table, month)
+                    cursor.executemany(f"""
+                        INSERT OR IGNORE INTO {ARCHIVE_SCHEMA}.{archive_table} ({columns})
+                        VALUES ({placeholders})
+                    """, month_rows)
+                cursor.executemany(f"DELETE FROM {table} WHERE id = ?", [(row['id'],) for row in rows])
+                moved[table] += len(rows)
+            if len(rows) < batch_size:
+                break
+    
+    if any(moved.values()):
+        # Archived rows may still be among a small group's last entries
+        invalidate_group_cache()
+    return moved
+
+def _local_date(ts: int) -> str:
+    """Day of a stored timestamp; times are saved in the group's local wall clock, so this is its local date"""
+    return datetime.fromtimestamp(ts, UTC).strftime("%Y-%m-%d")
+
+def _bump_rollup(cursor, group_id: int, ts: Optional[int], bottles: int = 0, ml: int = 0, poops: int = 0) -> None:
+    """Apply a delta to a group's daily rollup, inside the caller's transaction"""
+    if ts is None:
+        return
+    cursor.execute(f"""
+        INSERT INTO {DAILY_ROLLUPS_TABLE} (group_id, local_date, bottle_count, total_ml, poop_count)
+        VALUES (?, ?, ?, ?, ?)
+        ON CONFLICT (group_id, local_date) DO UPDATE SET
+            bottle_count = bottle_count + excluded.bottle_count,
+            total_ml = total_ml + excluded.total_ml,
+            poop_count = poop_count + excluded.poop_count
+    """, (group_id, _local_date(ts), bottles, ml, poops))
+
+def _rebuild_rollups(cursor, group_id: Optional[int] = None) -> int:
+    """Recompute daily_rollups from entries and poop, hot and archived (no commit)"""
+    where = "WHERE ts IS NOT NULL" + (" AND group_id = ?" if group_id is not None else "")
+    params = (group_id,) if group_id is not None else ()
+    
+    if group_id is not None:
+        cursor.execute(f"DELETE FROM {DAILY_ROLLUPS_TABLE} WHERE group_id = ?", (group_id,))
+    else:
+        cursor.execute(f"DELETE FROM {DAILY_ROLLUPS_TABLE}")
+    
+    # Migration 4 rebuilds before entries get their deleted_at column (migration 9)
+    entry_columns = [row['name'] for row in cursor.execute(f"PRAGMA table_info({ENTRIES_TABLE})")]
+    live = " AND deleted_at IS NULL" if 'deleted_at' in entry_columns else ""
+    
+    sources = {ENTRIES_TABLE: [ENTRIES_TABLE], POOP_TABLE: [POOP_TABLE]}
+    for table in sources:
+        sources[table] += [f"{ARCHIVE_SCHEMA}.{name}" for name in _archive_tables(cursor, table, 0)]
+    
+    for source in sources[ENTRIES_TABLE]:
+        cursor.execute(f"""
+            INSERT INTO {DAILY_ROLLUPS_TABLE} (group_id, local_date, bottle_count, total_ml, poop_count)
+            SELECT group_id, strftime('%Y-%m-%d', ts, 'unixepoch'), COUNT(*), SUM(amount), 0
+            FROM {source} {where}{live if source == ENTRIES_TABLE else ""}
+            GROUP BY 1, 2
+            ON CONFLICT (group_id, local_date) DO UPDATE SET
+                bottle_count = bottle_count + excluded.bottle_count,
+                total_ml = total_ml + excluded.total_ml
+        """, params)
+    for source in sources[POOP_TABLE]:
+        cursor.execute(f"""
+            INSERT INTO {DAILY_ROLLUPS_TABLE} (group_id, local_date, bottle_count, total_ml, poop_count)
+            SELECT group_id, strftime('%Y-%m-%d', ts, 'unixepoch'), 0, 0, COUNT(*)
+            FROM {source} {where}
+            GROUP BY 1, 2
+            ON CONFLICT (group_id, local_date) DO UPDATE SET
+                poop_count = poop_count + excluded.poop_count
+        """, params)
+    
+    cursor.execute(f"SELECT COUNT(*) FROM {DAILY_ROLLUPS_TABLE}")
+    return cursor.fetchone()[0]
+
+def rebuild_daily_rollups(group_id: Optional[int] = None) -> bool:
+    """Rebuild the daily rollups of one group (or all groups) from the raw rows"""
+    try:
+        with _writer() as conn:
+            count = _rebuild_rollups(conn.cursor(), group_id)
+        print(f"Rebuilt daily rollups ({count} rows)")
+        return True
+    except Exception as e:
+        print(f"Error rebuilding daily rollups: {e}")
+        return False
+
+def get_daily_rollups_for_user(user_id: int, days: int = 5) -> Optional[Dict[str, Dict]]:
+    """Per-day totals of the user's group for the last N days (today included), keyed by YYYY-MM-DD"""
+    try:
+        group_id = get_user_group_id(user_id)
+        if not group_id:
+            return None
         
-        conn.commit()
+        start_date = _window_start(days).isoformat()
+        with _reader() as conn:
+            cursor = conn.cursor()
+            cursor.execute(f"""
+                SELECT local_date, bottle_count, total_ml, poop_count FROM {DAILY_ROLLUPS_TABLE}
+                WHERE group_id = ? AND local_date >= ?
+                ORDER BY local_date
+            """, (group_id, start_date))
+            return {
+                row['local_date']: {
+                    'bottles': row['bottle_count'],
+                    'total_ml': row['total_ml'],
+                    'poops': row['poop_count']
+                }
+                for row in cursor.fetchall()
+            }
+    except Exception as e:
+        print(f"Error getting daily rollups for user {user_id}: {e}")
+        return None
+
+def cleanup_old_data() -> bool:
+    """Move data older than HOT_RETENTION_DAYS to the archive database; backups run separately (see backup.py).
+
+    Archived rows are still history, so their daily rollups are kept as they are.
+    """
+    try:
+        moved = archive_old_data()
+        entries_moved = moved[ENTRIES_TABLE]
+        poop_moved = moved[POOP_TABLE]
         
-        if entries_deleted > 0 or poop_deleted > 0:
-            print(f"Cleaned up {entries_deleted} old entries and {poop_deleted} old poop entries")
+        if entries_moved > 0 or poop_moved > 0:
+            print(f"Archived {entries_moved} old entries and {poop_moved} old poop entries")
         
         return True
     except Exception as e:
         print(f"Error cleaning up old data: {e}")
         return False
 
+_archiver: Optional[threading.Thread] = None
+_archiver_stop = threading.Event()
+
+def _archive_loop(initial_delay: float):
+    delay = initial_delay
+    while not _archiver_stop.wait(delay):
+        cleanup_old_data()
+        delay = ARCHIVE_INTERVAL_HOURS * 3600
+
+def start_archiver(initial_delay: float = 60):
+    """Archive old rows shortly after startup, then every ARCHIVE_INTERVAL_HOURS, on a background thread (no-op if disabled)"""
+    global _archiver
+    if ARCHIVE_INTERVAL_HOURS <= 0 or (_archiver is not None and _archiver.is_alive()):
+        return
+    _archiver_stop.clear()
+    _archiver = threading.Thread(target=_archive_loop, args=(initial_delay,), name="archiver", daemon=True)
+    _archiver.start()
+
+def stop_archiver(timeout: float = 30):
+    """Stop the archiver thread, letting a running pass finish its batch (called at shutdown)"""
+    global _archiver
+    _archiver_stop.set()
+    if _archiver is not None:
+        _archiver.join(timeout)
+        _archiver = None
+
+def purge_tombstones(retention_days: float = TOMBSTONE_RETENTION_DAYS,
+                     batch_size: int = TOMBSTONE_PURGE_BATCH_SIZE) -> int:
+    """Delete entries tombstoned more than retention_days ago, one short writer transaction per batch"""
+    cutoff = to_epoch(datetime.now(UTC)) - int(retention_days * 86400)
+    purged = 0
+    while True:
+        with _writer() as conn:
+            cursor = conn.cursor()
+            cursor.execute(f"""
+                DELETE FROM {ENTRIES_TABLE} WHERE id IN (
+                    SELECT id FROM {ENTRIES_TABLE}
+                    WHERE deleted_at IS NOT NULL AND deleted_at < ?
+                    LIMIT ?
+                )
+            """, (cutoff, batch_size))
+            deleted = cursor.rowcount
+        purged += deleted
+        if deleted < batch_size:
+            break
+    if purged:
+        print(f"Purged {purged} deleted bottles")
+    return purged
+
+_tombstone_compactor: Optional[threading.Thread] = None
+_tombstone_compactor_stop = threading.Event()
+
+def _compact_tombstones_loop():
+    while not _tombstone_compactor_stop.wait(TOMBSTONE_COMPACT_MINUTES * 60):
+        try:
+            purge_tombstones()
+        except Exception as e:
+            print(f"Error purging deleted bottles: {e}")
+
+def start_tombstone_compactor():
+    """Purge old tombstones every TOMBSTONE_COMPACT_MINUTES on a background thread (no-op if disabled)"""
+    global _tombstone_compactor
+    if TOMBSTONE_COMPACT_MINUTES <= 0 or (_tombstone_compactor is not None and _tombstone_compactor.is_alive()):
+        return
+    _tombstone_compactor_stop.clear()
+    _tombstone_compactor = threading.Thread(target=_compact_tombstones_loop, name="tombstone-compactor", daemon=True)
+    _tombstone_compactor.start()
+
+def stop_tombstone_compactor():
+    """Stop the compactor thread (called at shutdown)"""
+    global _tombstone_compactor
+    _tombstone_compactor_stop.set()
+    if _tombstone_compactor is not None:
+        _tombstone_compactor.join(10)
+        _tombstone_compactor = None
+
+@_invalidates_group(membership=True)
 def update_group_name(group_id: int, new_name: str) -> bool:
-    """Update group name"""
+    """Update group name (raises GroupNameConflict if another group already has it, or it is a personal group name)"""
+    if is_personal_group_name(new_name):
+        raise GroupNameConflict(new_name)
     try:
-        conn = get_db_connection()
-        cursor = conn.cursor()
-        
-        cursor.execute(f"UPDATE {GROUPS_TABLE} SET name = ? WHERE id = ?", (new_name, group_id))
-        conn.commit()
-        return True
+        with _writer() as conn:
+            cursor = conn.cursor()
+            
+            cursor.execute(f"UPDATE {GROUPS_TABLE} SET name = ? WHERE id = ?", (new_name, group_id))
+            return True
+    except sqlite3.IntegrityError:
+        raise GroupNameConflict(new_name) from None
     except Exception as e:
         print(f"Error updating group name: {e}")
         return False
 
-def get_language(user_id: int) -> str:
-    """Stub for language retrieval. Should return 'fr', 'en', or 'he' for the user."""
+# user_id -> language, written through by update_language. Users without a
+# languages row get the default cached; nothing is written on the read path.
+DEFAULT_LANGUAGE = "fr"
+_language_cache = LRUCache(LANGUAGE_CACHE_SIZE)
+
+def get_cached_language(user_id: int) -> Optional[str]:
+    """Language from the in-process cache, or None on a miss (no database access)"""
+    language = _language_cache.get(int(user_id))
+    return None if language is MISSING else language
+
+def _load_language(user_id: int) -> str:
+    """Read a language from the database and cache it"""
     try:
-        conn = get_db_connection()
-        cursor = conn.cursor()
-        
-        cursor.execute(f"SELECT language FROM {LANGUAGES_TABLE} WHERE user_id = ?", (user_id,))
-        result = cursor.fetchone()
-        if result:
-            return result['language']
-        cursor.execute(f"INSERT INTO {LANGUAGES_TABLE} (user_id, language) VALUES (?, ?)", (user_id, "fr"))
-        conn.commit()
-        return "fr"
+        with _reader() as conn:
+            cursor = conn.cursor()
+            
+            cursor.execute(f"SELECT language FROM {LANGUAGES_TABLE} WHERE user_id = ?", (user_id,))
+            result = cursor.fetchone()
+        language = result['language'] if result else DEFAULT_LANGUAGE
+        _language_cache.set(int(user_id), language)
+        return language
     except Exception as e:
         print(f"Error getting language for user {user_id}: {e}")
-        return "fr"
+        return DEFAULT_LANGUAGE
+
+def get_language(user_id: int) -> str:
+    """Return 'fr', 'en' or 'he' for the user (cached, 'fr' by default)"""
+    language = get_cached_language(user_id)
+    if language is not None:
+        return language
+    return _load_language(user_id)
 
 def update_language(user_id: int, language: str) -> bool:
-    """Update language"""
+    """Update language (creates the row for users still on the default)"""
     try:
-        conn = get_db_connection()
-        cursor = conn.cursor()
-        
-        cursor.execute(f"UPDATE {LANGUAGES_TABLE} SET language = ? WHERE user_id = ?", (language, user_id))
-        conn.commit()
+        with _writer() as conn:
+            cursor = conn.cursor()
+            
+            cursor.execute(f"""
+                INSERT INTO {LANGUAGES_TABLE} (user_id, language) VALUES (?, ?)
+                ON CONFLICT(user_id) DO UPDATE SET language = excluded.language
+            """, (user_id, language))
+        _language_cache.set(int(user_id), language)
         return True
     except Exception as e:
         print(f"Error updating language for user {user_id}: {e}")
+        # Do not keep serving a language that may not match the table
+        _language_cache.pop(int(user_id))
         return False
+
+def warm_language_cache() -> int:
+    """Preload stored languages at startup (up to LANGUAGE_CACHE_SIZE users)"""
+    try:
+        with _reader() as conn:
+            rows = conn.execute(f"SELECT user_id, language FROM {LANGUAGES_TABLE} LIMIT ?",
+                                (LANGUAGE_CACHE_SIZE,)).fetchall()
+        for row in rows:
+            _language_cache.set(row['user_id'], row['language'])
+        return len(rows)
+    except Exception as e:
+        print(f"Error warming language cache: {e}")
+        return 0
+
+def get_language_cache_stats() -> Dict[str, Any]:
+    """Size and hit/miss counters of the language cache"""
+    return _language_cache.stats()
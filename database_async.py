@@ -0,0 +1,188 @@
+import asyncio
+import functools
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from typing import Optional
+
+import database
+from config import DB_EXECUTOR_WORKERS, WRITE_BATCH_MAX_OPS, WRITE_BATCH_MAX_DELAY_MS
+from database import GroupNameConflict  # re-exported: raised through the async mirrors
+
+# Dedicated threads for SQLite work so queries never run on the bot's event loop.
+# Each worker borrows a pooled reader (or the single writer) from database.get_pool().
+_executor = ThreadPoolExecutor(max_workers=DB_EXECUTOR_WORKERS, thread_name_prefix="db")
+
+async def run_in_db_thread(func, *args, **kwargs):
+    """Run a blocking database function on the database executor and await its result"""
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(_executor, functools.partial(func, *args, **kwargs))
+
+def _async(func):
+    """Build an awaitable mirror of a synchronous database function"""
+    @functools.wraps(func)
+    async def wrapper(*args, **kwargs):
+        return await run_in_db_thread(func, *args, **kwargs)
+    return wrapper
+
+class _GroupCommit:
+    """Single task committing queued writes in batches (group commit).
+
+    The first write of a batch waits up to WRITE_BATCH_MAX_DELAY_MS (less once
+    WRITE_BATCH_MAX_OPS are queued) so writes submitted meanwhile share its
+    transaction; writes queued while a batch commits form the next one. Each
+    write has its own future, resolved once its batch is committed.
+    """
+
+    def __init__(self):
+        self.loop = asyncio.get_running_loop()
+        self.pending = deque()
+        self.wakeup = asyncio.Event()
+        self.full = asyncio.Event()
+        self.closing = False
+        self.task = self.loop.create_task(self._run(), name="db-group-commit")
+
+    def submit(self, func, args, kwargs) -> asyncio.Future:
+        future = self.loop.create_future()
+        self.pending.append((func, args, kwargs, future))
+        self.wakeup.set()
+        if len(self.pending) >= WRITE_BATCH_MAX_OPS:
+            self.full.set()
+        return future
+
+    async def _run(self):
+        while True:
+            await self.wakeup.wait()
+            if not self.pending:
+                if self.closing:
+                    return
+                self.wakeup.clear()
+                continue
+            if len(self.pending) < WRITE_BATCH_MAX_OPS and not self.closing:
+                try:
+                    await asyncio.wait_for(self.full.wait(), WRITE_BATCH_MAX_DELAY_MS / 1000)
+                except asyncio.TimeoutError:
+                    pass
+            self.full.clear()
+            batch = [self.pending.popleft() for _ in range(min(len(self.pending), WRITE_BATCH_MAX_OPS))]
+            await self._commit(batch)
+
+    async def _commit(self, batch):
+        try:
+            results = await run_in_db_thread(database.run_write_batch, [op[:3] for op in batch])
+        except Exception as e:
+            # The commit itself failed: nothing of the batch was saved
+            print(f"Error committing {len(batch)} queued writes: {e}")
+            results = [(True, False)] * len(batch)
+        for (_, _, _, future), (ok, value) in zip(batch, results):
+            if future.done():
+                continue
+            if ok:
+                future.set_result(value)
+            else:
+                future.set_exception(value)
+
+    async def close(self):
+        """Commit what is still queued, then stop"""
+        self.closing = True
+        self.wakeup.set()
+        self.full.set()
+        await self.task
+
+_group_commit: Optional[_GroupCommit] = None
+
+async def submit_write(func, *args, **kwargs):
+    """Queue a write for the next group commit and return its result once committed"""
+    global _group_commit
+    if WRITE_BATCH_MAX_OPS <= 1:
+        return await run_in_db_thread(func, *args, **kwargs)
+    if _group_commit is None or _group_commit.task.done() or _group_commit.loop is not asyncio.get_running_loop():
+        _group_commit = _GroupCommit()
+    return await _group_commit.submit(func, args, kwargs)
+
+def _queued(func):
+    """Build an awaitable mirror of a write function that goes through the group commit"""
+    @functools.wraps(func)
+    async def wrapper(*args, **kwargs):
+        return await submit_write(func, *args, **kwargs)
+    return wrapper
+
+async def close_write_queue():
+    """Commit the queued writes (called on shutdown, before shutdown_executor)"""
+    global _group_commit
+    if _group_commit is not None and not _group_commit.task.done():
+        await _group_commit.close()
+    _group_commit = None
+
+def shutdown_executor(wait: bool = True):
+    """Stop the database executor (called when the application shuts down)"""
+    _executor.shutdown(wait=wait)
+
+# Groups
+get_user_group_id = _async(database.get_user_group_id)
+get_group_data_for_user = _async(database.get_group_data_for_user)
+get_dashboard_snapshot = _async(database.get_dashboard_snapshot)
+get_group_stats_for_user = _async(database.get_group_stats_for_user)
+get_all_groups = _async(database.get_all_groups)
+get_group_by_id = _async(database.get_group_by_id)
+find_group_id_by_name = _async(database.find_group_id_by_name)
+get_group_members = _async(database.get_group_members)
+get_group_settings = _async(database.get_group_settings)
+create_group = _async(database.create_group)
+update_group_settings = _async(database.update_group_settings)
+update_group_members = _async(database.update_group_members)
+update_group_name = _async(database.update_group_name)
+
+# Entries and poop (appends are group-committed)
+add_entry_to_group = _queued(database.add_entry_to_group)
+remove_last_entry_from_group = _async(database.remove_last_entry_from_group)
+restore_last_deleted_entry = _async(database.restore_last_deleted_entry)
+add_poop_to_group = _queued(database.add_poop_to_group)
+get_group_history = _async(database.get_group_history)
+get_daily_rollups_for_user = _async(database.get_daily_rollups_for_user)
+
+# Main message tracking: locations live in a write-behind map, flushed by a background thread
+async def set_user_message_info(group_id: int, user_id: int, message_id: int, chat_id: int) -> bool:
+    """Only touches memory (no query), so it runs on the event loop"""
+    return database.set_user_message_info(group_id, user_id, message_id, chat_id)
+
+async def get_user_message_info(group_id: int, user_id: int) -> tuple:
+    """Known locations are answered on the event loop, only misses go to the database thread"""
+    location = database.get_cached_message_info(group_id, user_id)
+    if location is not None:
+        return location
+    return await run_in_db_thread(database.get_user_message_info, group_id, user_id)
+
+async def clear_user_message_info(group_id: int, user_id: int) -> bool:
+    return database.clear_user_message_info(group_id, user_id)
+
+flush_message_locations = _async(database.flush_message_locations)
+
+# Outbox of failed dashboard edits
+enqueue_outbox_edit = _async(database.enqueue_outbox_edit)
+get_due_outbox_edits = _async(database.get_due_outbox_edits)
+retry_outbox_edit = _async(database.retry_outbox_edit)
+remove_outbox_edit = _async(database.remove_outbox_edit)
+get_outbox_depth = _async(database.get_outbox_depth)
+load_outbox_keys = _async(database.load_outbox_keys)
+
+async def discard_outbox_edit(chat_id: int, message_id: int) -> bool:
+    """Drop a queued edit made stale by a newer one; only queued messages cost a query"""
+    if not database.has_outbox_edit(chat_id, message_id):
+        return False
+    return await run_in_db_thread(database.remove_outbox_edit, chat_id, message_id)
+
+# Maintenance
+cleanup_old_data = _async(database.cleanup_old_data)
+archive_old_data = _async(database.archive_old_data)
+rebuild_daily_rollups = _async(database.rebuild_daily_rollups)
+purge_tombstones = _async(database.purge_tombstones)
+
+# Languages
+async def get_language(user_id: int) -> str:
+    """Cached languages are answered on the event loop, only misses go to the database thread"""
+    language = database.get_cached_language(user_id)
+    if language is not None:
+        return language
+    return await run_in_db_thread(database._load_language, user_id)
+
+update_language = _async(database.update_language)
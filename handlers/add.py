@@ -2,9 +2,9 @@ from datetime import datetime, timedelta
 from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup
 from telegram.ext import ContextTypes, ConversationHandler
 from zoneinfo import ZoneInfo
-from utils import load_data, save_data, find_group_for_user, create_personal_group, is_valid_time, normalize_time, delete_user_message, update_main_message, ensure_main_message_exists, set_group_message_info, load_user_data, update_all_group_messages, run_daily_cleanup
+from utils import save_data, find_group_for_user, create_personal_group, is_valid_time, normalize_time, delete_user_message, update_main_message, ensure_main_message_exists, set_group_message_info, load_user_data, update_all_group_messages, idempotency_key
 from config import TEST_MODE
-from database import add_entry_to_group, get_language
+from database_async import add_entry_to_group, get_language
 from translations import t
 
 ASK_BOTTLE_TIME, ASK_BOTTLE_AMOUNT = range(2)
@@ -21,25 +21,21 @@ def round_to_nearest_quarter_hour(minutes, base=15):
 
 async def add_bottle(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Start the add bottle flow - show time selection"""
-    # Run daily cleanup check
-    run_daily_cleanup()
-    
     query = update.callback_query
     await query.answer()
     
     user_id = update.effective_user.id
-    language = get_language(user_id)
+    language = await get_language(user_id)
     
     # Use optimized data loading
-    data = load_user_data(user_id)
+    data = await load_user_data(user_id)
     if not data:
-        # Fallback to old method if needed
-        data = load_data()
-        group_id = find_group_for_user(data, user_id)
+        # No group loaded: resolve it from the database
+        group_id = await find_group_for_user(data, user_id)
         if not group_id:
-            group_id = create_personal_group(data, user_id)
+            group_id = await create_personal_group(data, user_id)
             await save_data(data, context)
-            data = load_user_data(user_id)
+            data = await load_user_data(user_id)
     
     if not data:
         error_msg = t("error_create_group", language)
@@ -113,14 +109,13 @@ async def handle_bottle_time(update: Update, context: ContextTypes.DEFAULT_TYPE,
         await delete_user_message(context, update.effective_chat.id, update.message.message_id)
     
     user_id = update.effective_user.id
-    language = get_language(user_id)
+    language = await get_language(user_id)
     
     # Use optimized data loading
-    data = load_user_data(user_id)
+    data = await load_user_data(user_id)
     if not data:
-        # Fallback to old method if needed
-        data = load_data()
-        group_id = find_group_for_user(data, user_id)
+        # No group loaded: resolve it from the database
+        group_id = await find_group_for_user(data, user_id)
         if not group_id or group_id not in data:
             error_msg = t("error_create_group", language)
             if hasattr(update, 'message') and update.message:
@@ -170,6 +165,8 @@ async def handle_bottle_time(update: Update, context: ContextTypes.DEFAULT_TYPE,
             if now_utc < dt:
                 dt = dt - timedelta(days=1)
         context.user_data['bottle_time'] = dt
+        # One bottle per amount prompt, however many times its buttons are tapped
+        context.user_data['bottle_key'] = idempotency_key(update, "bottle")
         
         # Show amount selection
         last_bottle = group_data.get("last_bottle", 120)
@@ -209,7 +206,7 @@ async def handle_bottle_time(update: Update, context: ContextTypes.DEFAULT_TYPE,
             await update_main_message(context, message, InlineKeyboardMarkup(keyboard))
             # Store the message ID for future text inputs
             if context.user_data.get('main_message_id') and context.user_data.get('chat_id'):
-                set_group_message_info(data, group_id, user_id, context.user_data['main_message_id'], context.user_data['chat_id'])
+                await set_group_message_info(data, group_id, user_id, context.user_data['main_message_id'], context.user_data['chat_id'])
                 await save_data(data, context)
         
         return ASK_BOTTLE_AMOUNT
@@ -224,12 +221,10 @@ async def handle_bottle_time(update: Update, context: ContextTypes.DEFAULT_TYPE,
             )
         else:
             # Load data first
-            data = load_user_data(user_id)
-            if not data:
-                data = load_data()
+            data = await load_user_data(user_id)
             
             # Use utility function to update main message
-            group_id = find_group_for_user(data, user_id)
+            group_id = await find_group_for_user(data, user_id)
             await ensure_main_message_exists(update, context, data, group_id)
             await update_main_message(context, error_msg, InlineKeyboardMarkup([[
                 InlineKeyboardButton(t("btn_cancel", language), callback_data="cancel")
@@ -254,7 +249,7 @@ async def handle_bottle_amount(update: Update, context: ContextTypes.DEFAULT_TYP
         await delete_user_message(context, update.effective_chat.id, update.message.message_id)
     
     user_id = update.effective_user.id
-    language = get_language(user_id)
+    language = await get_language(user_id)
     
     try:
         amount = int(amount_str)
@@ -270,38 +265,32 @@ async def handle_bottle_amount(update: Update, context: ContextTypes.DEFAULT_TYP
                 )
             else:
                 # Use utility function to update main message
-                data = load_user_data(user_id)
-                if not data:
-                    data = load_data()
-                group_id = find_group_for_user(data, user_id)
+                data = await load_user_data(user_id)
+                group_id = await find_group_for_user(data, user_id)
                 await ensure_main_message_exists(update, context, data, group_id)
                 await update_main_message(context, error_msg, InlineKeyboardMarkup([[
                     InlineKeyboardButton(t("btn_cancel", language), callback_data="cancel")
                 ]]))
                 # Store the message ID for future text inputs
                 if context.user_data.get('main_message_id') and context.user_data.get('chat_id'):
-                    set_group_message_info(data, group_id, user_id, context.user_data['main_message_id'], context.user_data['chat_id'])
+                    await set_group_message_info(data, group_id, user_id, context.user_data['main_message_id'], context.user_data['chat_id'])
                     await save_data(data, context)
             return ConversationHandler.END
         # Add the bottle entry to the database
         user_id = update.effective_user.id
         
         # Load data first
-        data = load_user_data(user_id)
-        if not data:
-            data = load_data()
+        data = await load_user_data(user_id)
         
-        group_id = find_group_for_user(data, user_id)
+        group_id = await find_group_for_user(data, user_id)
         await ensure_main_message_exists(update, context, data, group_id)
         # Convert group_id to int for database function
-        add_entry_to_group(int(group_id), amount, dt)
+        await add_entry_to_group(int(group_id), amount, dt, idempotency_key=context.user_data.get('bottle_key'))
         
 
         
         # Reload data to get the updated information including the new bottle
-        data = load_user_data(user_id)
-        if not data:
-            data = load_data()
+        data = await load_user_data(user_id)
         
         # Return to main message with updated data
         from handlers.queries import get_main_message_content
@@ -319,7 +308,7 @@ async def handle_bottle_amount(update: Update, context: ContextTypes.DEFAULT_TYP
             await update_main_message(context, success_text, keyboard)
             # Store the message ID for future text inputs
             if context.user_data.get('main_message_id') and context.user_data.get('chat_id'):
-                set_group_message_info(data, group_id, user_id, context.user_data['main_message_id'], context.user_data['chat_id'])
+                await set_group_message_info(data, group_id, user_id, context.user_data['main_message_id'], context.user_data['chat_id'])
         user_id = update.effective_user.id
         print(f"user_id: {user_id}")
         # Update all group messages with the new content
@@ -328,6 +317,7 @@ async def handle_bottle_amount(update: Update, context: ContextTypes.DEFAULT_TYP
         # Clear conversation state
         context.user_data.pop('conversation_state', None)
         context.user_data.pop('bottle_time', None)
+        context.user_data.pop('bottle_key', None)
         
         return ConversationHandler.END
     except ValueError:
@@ -341,17 +331,15 @@ async def handle_bottle_amount(update: Update, context: ContextTypes.DEFAULT_TYP
             )
         else:
             # Use utility function to update main message
-            data = load_user_data(user_id)
-            if not data:
-                data = load_data()
-            group_id = find_group_for_user(data, user_id)
+            data = await load_user_data(user_id)
+            group_id = await find_group_for_user(data, user_id)
             await ensure_main_message_exists(update, context, data, group_id)
             await update_main_message(context, error_msg, InlineKeyboardMarkup([[
                 InlineKeyboardButton(t("btn_cancel", language), callback_data="cancel")
             ]]))
             # Store the message ID for future text inputs
             if context.user_data.get('main_message_id') and context.user_data.get('chat_id'):
-                set_group_message_info(data, group_id, user_id, context.user_data['main_message_id'], context.user_data['chat_id'])
+                await set_group_message_info(data, group_id, user_id, context.user_data['main_message_id'], context.user_data['chat_id'])
                 await save_data(data, context)
         return ASK_BOTTLE_AMOUNT
     except Exception as e:
@@ -365,12 +353,10 @@ async def handle_bottle_amount(update: Update, context: ContextTypes.DEFAULT_TYP
             )
         else:
             # Load data first
-            data = load_user_data(user_id)
-            if not data:
-                data = load_data()
+            data = await load_user_data(user_id)
             
             # Use utility function to update main message
-            group_id = find_group_for_user(data, user_id)
+            group_id = await find_group_for_user(data, user_id)
             await ensure_main_message_exists(update, context, data, group_id)
             await update_main_message(context, error_msg, InlineKeyboardMarkup([[
                 InlineKeyboardButton(t("btn_cancel", language), callback_data="cancel")
@@ -383,12 +369,10 @@ async def cancel_bottle(update: Update, context: ContextTypes.DEFAULT_TYPE):
     await query.answer()
     
     user_id = update.effective_user.id
-    language = get_language(user_id)
-    data = load_user_data(user_id)
-    if not data:
-        data = load_data()
+    language = await get_language(user_id)
+    data = await load_user_data(user_id)
     
-    group_id = find_group_for_user(data, user_id)
+    group_id = await find_group_for_user(data, user_id)
     
     # Clear conversation state
     context.user_data.pop('conversation_state', None)
@@ -1,7 +1,7 @@
 from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup
 from telegram.ext import ContextTypes
-from utils import load_data, find_group_for_user, load_user_data, update_all_group_messages
-from database import remove_last_entry_from_group, get_language
+from utils import find_group_for_user, load_user_data, update_all_group_messages
+from database_async import remove_last_entry_from_group, restore_last_deleted_entry, get_language
 from translations import t
 
 async def delete_bottle(update: Update, context: ContextTypes.DEFAULT_TYPE):
@@ -10,14 +10,13 @@ async def delete_bottle(update: Update, context: ContextTypes.DEFAULT_TYPE):
     await query.answer()
     
     user_id = update.effective_user.id
-    language = get_language(user_id)
+    language = await get_language(user_id)
     
     # Use optimized data loading
-    data = load_user_data(user_id)
+    data = await load_user_data(user_id)
     if not data:
-        # Fallback to old method if needed
-        data = load_data()
-        group_id = find_group_for_user(data, user_id)
+        # No group loaded: resolve it from the database
+        group_id = await find_group_for_user(data, user_id)
         if not group_id or group_id not in data:
             error_msg = t("error_create_group", language)
             if hasattr(update, 'message') and update.message:
@@ -63,15 +62,14 @@ async def confirm_delete_bottle(update: Update, context: ContextTypes.DEFAULT_TY
     await query.answer()
     
     user_id = update.effective_user.id
-    language = get_language(user_id)
+    language = await get_language(user_id)
     
     # Use optimized data loading
-    data = load_user_data(user_id)
+    data = await load_user_data(user_id)
     if not data:
-        # Fallback to old method if needed
-        data = load_data()
-        group_id = find_group_for_user(data, user_id)
-        if not group_id or not data[group_id]["entries"]:
+        # No group loaded: resolve it from the database
+        group_id = await find_group_for_user(data, user_id)
+        if not group_id or group_id not in data or not data[group_id]["entries"]:
             await query.edit_message_text(
                 t("delete_no_bottles", language),
                 reply_markup=InlineKeyboardMarkup([[InlineKeyboardButton(t("btn_home", language), callback_data="refresh")]])
@@ -91,14 +89,12 @@ async def confirm_delete_bottle(update: Update, context: ContextTypes.DEFAULT_TY
         return False
     
     removed_entry = group_data["entries"][0]
-    remove_last_entry_from_group(int(group_id))
+    await remove_last_entry_from_group(int(group_id))
     
 
     
     # Reload data to get updated information
-    data = load_user_data(user_id)
-    if not data:
-        data = load_data()
+    data = await load_user_data(user_id)
     
     # Generate updated main message content
     user_id = update.effective_user.id
@@ -111,10 +107,51 @@ async def confirm_delete_bottle(update: Update, context: ContextTypes.DEFAULT_TY
         # Update all group messages with the new content
     await update_all_group_messages(context, int(group_id), message_text, keyboard, user_id)
        
-    # Show confirmation
+    # Show confirmation, with a way back
     await query.edit_message_text(
         t("delete_success", language, removed_entry['amount'], removed_entry['time'].strftime('%H:%M')),
-        reply_markup=InlineKeyboardMarkup([[InlineKeyboardButton(t("btn_home", language), callback_data="refresh")]])
+        reply_markup=InlineKeyboardMarkup([
+            [InlineKeyboardButton(t("btn_undo_delete", language), callback_data="undo_delete")],
+            [InlineKeyboardButton(t("btn_home", language), callback_data="refresh")]
+        ])
+    )
+    
+    return True
+
+async def undo_delete_bottle(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Restore the last deleted bottle of the user's group"""
+    query = update.callback_query
+    await query.answer()
+    
+    user_id = update.effective_user.id
+    language = await get_language(user_id)
+    
+    data = await load_user_data(user_id)
+    group_id = await find_group_for_user(data, user_id)
+    if not group_id:
+        await query.edit_message_text(t("error_create_group", language))
+        return False
+    
+    restored_entry = await restore_last_deleted_entry(int(group_id))
+    if not restored_entry:
+        await query.edit_message_text(
+            t("undo_delete_nothing", language),
+            reply_markup=InlineKeyboardMarkup([[InlineKeyboardButton(t("btn_home", language), callback_data="refresh")]])
+        )
+        return False
+    
+    # Reload data to get updated information
+    data = await load_user_data(user_id)
+    from handlers.queries import get_main_message_content
+    message_text, keyboard = get_main_message_content(data, group_id, language)
+    
+    # Update all group messages with the new content
+    await update_all_group_messages(context, int(group_id), message_text, keyboard, user_id)
+    
+    await query.edit_message_text(
+        t("undo_delete_success", language, restored_entry['amount'], restored_entry['time'].strftime('%H:%M'), message_text),
+        reply_markup=keyboard,
+        parse_mode="Markdown"
     )
     
     return True
@@ -131,8 +168,8 @@ async def cancel_delete_bottle(update: Update, context: ContextTypes.DEFAULT_TYP
     from handlers.queries import get_main_message_content_for_user
     
     user_id = update.effective_user.id
-    language = get_language(user_id)
-    message_text, keyboard = get_main_message_content_for_user(user_id, language)
+    language = await get_language(user_id)
+    message_text, keyboard = await get_main_message_content_for_user(user_id, language)
     
     await query.edit_message_text(
         text=message_text,
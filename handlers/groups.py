@@ -1,8 +1,9 @@
 from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup
 from telegram.ext import ContextTypes
-from utils import load_data, save_data, find_group_for_user, create_personal_group, delete_user_message, update_main_message
-from database import get_language
-from database import update_group, create_group, update_group_name,  get_user_group_id
+from utils import load_user_data, find_group_for_user, create_personal_group, delete_user_message, update_main_message
+from database_async import get_language
+from database_async import update_group_members, create_group, update_group_name,  get_user_group_id
+from database_async import find_group_id_by_name, get_group_members, get_group_settings, GroupNameConflict
 import re
 from translations import t
 
@@ -11,25 +12,24 @@ async def show_groups_menu(update: Update, context: ContextTypes.DEFAULT_TYPE):
     query = update.callback_query
     await query.answer()
     
-    data = load_data()
     user_id = update.effective_user.id
-    language = get_language(user_id)
-    group_id = find_group_for_user(data, user_id)
+    language = await get_language(user_id)
+    group_id = await get_user_group_id(user_id)
     
     # Only create personal group if user has no group
     if not group_id:
-        group_id = create_personal_group(data, user_id)
+        group_id = await create_personal_group({}, user_id)
     
-    if not group_id or group_id not in data:
+    group_info = await get_group_settings(group_id) if group_id else None
+    if not group_info:
         error_msg = t("error_find_group", language)
         await query.edit_message_text(error_msg, parse_mode="Markdown")
         return
     
     # Get current group info
-    group_info = data[group_id]
-    group_name = group_info.get('name', str(group_id))
+    group_name = group_info['name']
     group_id_str = str(group_id)
-    member_count = len(group_info.get("users", []))
+    member_count = group_info['member_count']
     
     message = t("groups_title", language)
     message += t("groups_current", language, group_name, group_id_str, member_count)
@@ -69,17 +69,15 @@ async def handle_group_actions(update: Update, context: ContextTypes.DEFAULT_TYP
     if not action:
         action = query.data.replace("group_", "")
     
-    data = load_data()
-    
     user_id = update.effective_user.id
-    group_id = find_group_for_user(data, user_id)
+    group_id = await find_group_for_user({}, user_id)
     
     # Only create personal group if user has no group
     if not group_id:
-        group_id = create_personal_group(data, user_id)
+        group_id = await create_personal_group({}, user_id)
     
-    if not group_id or group_id not in data:
-        error_msg = t("error_find_group", get_language(user_id))
+    if not group_id:
+        error_msg = t("error_find_group", await get_language(user_id))
         await query.edit_message_text(error_msg)
         return
     
@@ -97,15 +95,13 @@ async def handle_group_actions(update: Update, context: ContextTypes.DEFAULT_TYP
     if action not in ['join', 'create', 'rename']:
         context.user_data.pop('conversation_state', None)
 
-    await save_data(data, context)
-
 async def show_rename_group(update: Update, context: ContextTypes.DEFAULT_TYPE, current_group_id: str):
     """Show rename group interface"""
     query = update.callback_query
-    language = get_language(update.effective_user.id)
-    data = load_data()
+    language = await get_language(update.effective_user.id)
+    group_info = await get_group_settings(current_group_id)
     
-    message = t("rename_group_title", language, data[current_group_id]['name'])
+    message = t("rename_group_title", language, group_info['name'] if group_info else current_group_id)
     
     # Set conversation state for text input
     context.user_data['conversation_state'] = 'group_rename'
@@ -121,7 +117,7 @@ async def show_rename_group(update: Update, context: ContextTypes.DEFAULT_TYPE,
 async def show_join_group(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Show join group interface"""
     query = update.callback_query
-    language = get_language(update.effective_user.id)
+    language = await get_language(update.effective_user.id)
     message = t("join_group_title", language)
     
     # Set conversation state for text input
@@ -138,7 +134,7 @@ async def show_join_group(update: Update, context: ContextTypes.DEFAULT_TYPE):
 async def show_create_group(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Show create group interface"""
     query = update.callback_query
-    language = get_language(update.effective_user.id)
+    language = await get_language(update.effective_user.id)
     message = t("create_group_title", language)
     
     # Set conversation state for text input
@@ -167,7 +163,7 @@ async def rename_group(update: Update, context: ContextTypes.DEFAULT_TYPE, curre
         query = None
         # Delete user message for clean chat
         await delete_user_message(context, update.effective_chat.id, update.message.message_id)
-    language = get_language(update.effective_user.id)
+    language = await get_language(update.effective_user.id)
     # Validate new name
     if not is_valid_group_name(new_name):
         message = t("rename_group_error", language)
@@ -191,42 +187,40 @@ async def rename_group(update: Update, context: ContextTypes.DEFAULT_TYPE, curre
             await update_main_message(context, message, InlineKeyboardMarkup(keyboard))
         return
     
-    data = load_data()
-    
-    # Check if name already exists using loaded data instead of database call
-    for group_id, group_info in data.items():
-        if group_info['name'] == new_name:
-            message = t("rename_group_exists", language, new_name)
-            
-            # Create keyboard with retry and return options
-            keyboard = [
-                [InlineKeyboardButton(t("btn_home", language), callback_data="refresh")],
-                [InlineKeyboardButton(t("btn_return_settings", language), callback_data="settings")]
-            ]
-            
-            # Keep conversation state active for retry
-            context.user_data['conversation_state'] = 'group_rename'
-            
-            if query:
-                await query.edit_message_text(
-                    message,
-                    reply_markup=InlineKeyboardMarkup(keyboard)
-                )
-            else:
-                # For text input, update main message using utility function
-                await update_main_message(context, message, InlineKeyboardMarkup(keyboard))
-            return
-    
-    # Rename the group in the database
+    # Rename the group in the database; the unique name index rejects a taken name
     current_group_id_int = int(current_group_id)
     user_id = update.effective_user.id
-    if update_group_name(current_group_id_int, new_name):
+    try:
+        renamed = await update_group_name(current_group_id_int, new_name)
+    except GroupNameConflict:
+        message = t("rename_group_exists", language, new_name)
+        
+        # Create keyboard with retry and return options
+        keyboard = [
+            [InlineKeyboardButton(t("btn_home", language), callback_data="refresh")],
+            [InlineKeyboardButton(t("btn_return_settings", language), callback_data="settings")]
+        ]
+        
+        # Keep conversation state active for retry
+        context.user_data['conversation_state'] = 'group_rename'
+        
+        if query:
+            await query.edit_message_text(
+                message,
+                reply_markup=InlineKeyboardMarkup(keyboard)
+            )
+        else:
+            # For text input, update main message using utility function
+            await update_main_message(context, message, InlineKeyboardMarkup(keyboard))
+        return
+    
+    if renamed:
         # Clear conversation state after successful rename
         context.user_data.pop('conversation_state', None)
         # Return to main menu
         from handlers.queries import get_main_message_content
-        data = load_data()
-        group_id = find_group_for_user(data, user_id)
+        data = await load_user_data(user_id)
+        group_id = await find_group_for_user(data, user_id)
         message_text, main_keyboard = get_main_message_content(data, group_id)
         
         success_text = t("rename_group_success", language, new_name, message_text)
@@ -261,9 +255,6 @@ async def rename_group(update: Update, context: ContextTypes.DEFAULT_TYPE, curre
             )
         else:
             # For text input, update main message with error
-            data = load_data()
-            user_id = update.effective_user.id
-            group_id = find_group_for_user(data, user_id)
             await update_main_message(context, message, InlineKeyboardMarkup(keyboard))
 
 async def join_group(update: Update, context: ContextTypes.DEFAULT_TYPE, target_group_name: str):
@@ -277,18 +268,12 @@ async def join_group(update: Update, context: ContextTypes.DEFAULT_TYPE, target_
         # Delete user message for clean chat
         await delete_user_message(context, update.effective_chat.id, update.message.message_id)
     
-    data = load_data()
-    
     user_id = update.effective_user.id
-    current_group_id = find_group_for_user(data, user_id)
+    current_group_id = await get_user_group_id(user_id)
     
     # Find the target group by name
-    target_group_id = None
-    for group_id, group_info in data.items():
-        if group_info.get('name') == target_group_name:
-            target_group_id = group_id
-            break
-    language = get_language(user_id)
+    target_group_id = await find_group_id_by_name(target_group_name)
+    language = await get_language(user_id)
     # Check if group exists
     if target_group_id is None:
         message = t("join_group_not_found", language, target_group_name)
@@ -308,7 +293,6 @@ async def join_group(update: Update, context: ContextTypes.DEFAULT_TYPE, target_
             )
         else:
             # For text input, update main message with error
-            group_id = find_group_for_user(data, user_id)            
             await update_main_message(context, message, InlineKeyboardMarkup(keyboard))
         return
     
@@ -332,7 +316,6 @@ async def join_group(update: Update, context: ContextTypes.DEFAULT_TYPE, target_
             )
         else:
             # For text input, update main message with error
-            group_id = find_group_for_user(data, user_id)
             await update_main_message(context, message, InlineKeyboardMarkup(keyboard))
         return
     
@@ -351,11 +334,10 @@ async def join_group(update: Update, context: ContextTypes.DEFAULT_TYPE, target_
     
 async def id_check_group_join(update: Update, context: ContextTypes.DEFAULT_TYPE, text: str):
     await delete_user_message(context, update.effective_chat.id, update.message.message_id)
-    data = load_data()
     user_id = update.effective_user.id
-    language = get_language(user_id)
+    language = await get_language(user_id)
     target_group_id = context.user_data['target_group_id']
-    current_group_id = find_group_for_user(data, user_id)
+    current_group_id = await get_user_group_id(user_id)
     if text != str(target_group_id):
         message = t("join_group_id_incorrect", language)
         keyboard = [
@@ -364,33 +346,24 @@ async def id_check_group_join(update: Update, context: ContextTypes.DEFAULT_TYPE
         ]
         await update_main_message(context, message, InlineKeyboardMarkup(keyboard))
         return 
-    else:
-        group_users = data[current_group_id]["users"]
-        # Convert all user IDs to integers for comparison
-        int_users = []
-        for user in group_users:
-            try:
-                int_users.append(int(user))
-            except (ValueError, TypeError):
-                continue
-        
-        if user_id in int_users:
-            data[current_group_id]["users"].remove(str(user_id) if str(user_id) in group_users else user_id)
-            # Convert group_id to int for database function
-            update_group(int(current_group_id), data[current_group_id])
+    
+    # Remove user from current group
+    if current_group_id and user_id in await get_group_members(current_group_id):
+        await update_group_members(current_group_id, remove=[user_id])
     
     # Add user to target group
-    data[target_group_id]["users"].append(int(user_id))
     # Convert group_id to int for database function
-    update_group(int(target_group_id), data[target_group_id])
+    await update_group_members(int(target_group_id), add=[user_id])
     
     # Clear conversation state after successful join
     context.user_data.pop('conversation_state', None)
     # Return to main menu
     from handlers.queries import get_main_message_content
-    group_id = find_group_for_user(data, user_id)
+    data = await load_user_data(user_id)
+    group_id = await find_group_for_user(data, user_id)
     message_text, main_keyboard = get_main_message_content(data, group_id)
-    target_group_name = data[target_group_id]['name']
+    target_group = await get_group_settings(target_group_id)
+    target_group_name = target_group['name'] if target_group else str(target_group_id)
     # Add confirmation message to avoid "Message is not modified" error
     success_text = t("join_group_success", language, target_group_name, message_text)
     await update_main_message(context, success_text, main_keyboard)
@@ -405,7 +378,7 @@ async def create_new_group(update: Update, context: ContextTypes.DEFAULT_TYPE, n
         query = None
         # Delete user message for clean chat
         await delete_user_message(context, update.effective_chat.id, update.message.message_id)
-    language = get_language(update.effective_user.id)
+    language = await get_language(update.effective_user.id)
     # Validate new name
     if not is_valid_group_name(new_name):
         message = t("create_group_invalid_name", language)
@@ -426,66 +399,49 @@ async def create_new_group(update: Update, context: ContextTypes.DEFAULT_TYPE, n
             )
         else:
             # For text input, update main message with error
-            data = load_data()
-            user_id = update.effective_user.id
-            group_id = find_group_for_user(data, user_id)
             await update_main_message(context, message, InlineKeyboardMarkup(keyboard))
         return
     
-    data = load_data()
-    
     user_id = update.effective_user.id
-    current_group_id = find_group_for_user(data, user_id)
-    
-    # Check if name already exists using loaded data instead of database call
-    for group_id, group_info in data.items():
-        if group_info['name'] == new_name:
-            message = t("create_group_exists", language, new_name)
-            
-            # Create keyboard with retry and return options
-            keyboard = [
-                [InlineKeyboardButton(t("btn_home", language), callback_data="refresh")],
-                [InlineKeyboardButton(t("btn_return_settings", language), callback_data="settings")]
-            ]
-            
-            # Keep conversation state active for retry
-            context.user_data['conversation_state'] = 'group_create'
-            
-            if query:
-                await query.edit_message_text(
-                    message,
-                    reply_markup=InlineKeyboardMarkup(keyboard)
-                )
-            else:
-                # For text input, update main message with error
-                group_id = find_group_for_user(data, user_id)
-                await update_main_message(context, message, InlineKeyboardMarkup(keyboard))
-            return
+    current_group_id = await get_user_group_id(user_id)
     
-    # Remove user from current group
-    if current_group_id and current_group_id in data:
-        group_users = data[current_group_id].get("users", [])
-        # Convert all user IDs to integers for comparison
-        int_users = []
-        for user in group_users:
-            try:
-                int_users.append(int(user))
-            except (ValueError, TypeError):
-                continue
+    # Create new group first: the unique name index decides whether the name is free
+    try:
+        new_group_id = await create_group(new_name, user_id)
+    except GroupNameConflict:
+        message = t("create_group_exists", language, new_name)
+        
+        # Create keyboard with retry and return options
+        keyboard = [
+            [InlineKeyboardButton(t("btn_home", language), callback_data="refresh")],
+            [InlineKeyboardButton(t("btn_return_settings", language), callback_data="settings")]
+        ]
         
-        if user_id in int_users:
-            data[current_group_id]["users"].remove(str(user_id) if str(user_id) in group_users else user_id)
-            # Update the current group in database
-            update_group(int(current_group_id), data[current_group_id])
+        # Keep conversation state active for retry
+        context.user_data['conversation_state'] = 'group_create'
+        
+        if query:
+            await query.edit_message_text(
+                message,
+                reply_markup=InlineKeyboardMarkup(keyboard)
+            )
+        else:
+            # For text input, update main message with error
+            await update_main_message(context, message, InlineKeyboardMarkup(keyboard))
+        return
+    if not new_group_id:
+        return
+    
+    # Only now leave the current group
+    if current_group_id and user_id in await get_group_members(current_group_id):
+        await update_group_members(current_group_id, remove=[user_id])
     
-    # Create new group
-    create_group(new_name, user_id)
     # Clear conversation state after successful creation
     context.user_data.pop('conversation_state', None)
     # Return to main menu
     from handlers.queries import get_main_message_content
-    data = load_data()
-    group_id = find_group_for_user(data, user_id)
+    data = await load_user_data(user_id)
+    group_id = await find_group_for_user(data, user_id)
     message_text, main_keyboard = get_main_message_content(data, group_id)
     
     # Add confirmation message to avoid "Message is not modified" error
@@ -510,54 +466,25 @@ async def leave_group(update: Update, context: ContextTypes.DEFAULT_TYPE, curren
     else:
         query = None
     
-    data = load_data()
-    
     user_id = update.effective_user.id
     
     # Remove user from current group
-    if current_group_id:
-        group_users = data[current_group_id]["users"]
-        # Convert all user IDs to integers for comparison
-        int_users = []
-        for user in group_users:
-            try:
-                int_users.append(int(user))
-            except (ValueError, TypeError):
-                continue
-        
-        if user_id in int_users:
-            data[current_group_id]["users"].remove(str(user_id) if str(user_id) in group_users else user_id)
-            # Convert group_id to int for database function
-            update_group(int(current_group_id), data[current_group_id])
-    
-    # Create or use personal group (highly optimized)
-    personal_group_name = f"group_{user_id}"
-    personal_group_id = None
-    
-    # Check if personal group already exists in current data
-    for group_id, group_info in data.items():
-        if group_info.get('name') == personal_group_name:
-            personal_group_id = group_id
-            # Ensure user is in the group
-            if user_id not in group_info.get('users', []):
-                group_info['users'].append(user_id)
-                update_group(int(group_id), group_info)
-            break
-    
-    # If personal group doesn't exist, create it directly in database
-    if personal_group_id is None:
-        create_group(personal_group_name, user_id)
-        # Get the created group ID efficiently
-        personal_group_id = get_user_group_id(user_id)
+    if current_group_id and user_id in await get_group_members(current_group_id):
+        # Convert group_id to int for database function
+        await update_group_members(int(current_group_id), remove=[user_id])
+    
+    # Back to the personal group group_<id>: rejoined with its history if it exists, created otherwise
+    await create_personal_group({}, user_id)
     
     # Clear conversation state after leaving group
     context.user_data.pop('conversation_state', None)
     
     # Return to main menu
     from handlers.queries import get_main_message_content
-    group_id = find_group_for_user(data, user_id)
+    data = await load_user_data(user_id)
+    group_id = await find_group_for_user(data, user_id)
     message_text, main_keyboard = get_main_message_content(data, group_id)
-    language = get_language(user_id)
+    language = await get_language(user_id)
     # Add confirmation message to avoid "Message is not modified" error
     success_text = t("leave_group_success", language, message_text)
     
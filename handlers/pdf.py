@@ -13,8 +13,9 @@ from reportlab.pdfbase.ttfonts import TTFont
 from reportlab.pdfbase.pdfmetrics import stringWidth
 from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup
 from telegram.ext import ContextTypes
-from utils import load_user_stats, load_user_data
-from database import get_user_group_id
+from rate_limiter import PRIORITY_DOCUMENT
+from utils import load_user_stats, load_user_data, load_user_rollups
+from database_async import get_user_group_id
 from zoneinfo import ZoneInfo
 import requests
 import matplotlib.pyplot as plt
@@ -23,7 +24,7 @@ from matplotlib import rcParams
 import numpy as np
 from collections import defaultdict
 from translations import t as tr
-from database import get_language
+from database_async import get_language
 
 LINK_TO_OFFICIAL_INFORMATIONS = "https://www.allobebe.fr/quantite-lait-biberon.html"
 # Dictionnaire de traductions pour le PDF
@@ -441,13 +442,14 @@ async def show_pdf_menu(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Affiche le menu de téléchargement PDF avec sélection de langue"""
     query = update.callback_query
     await query.answer()
-    language = get_language(query.from_user.id)
+    language = await get_language(query.from_user.id)
     message = tr("pdf_menu", language) + "\n\n"
 
     
     keyboard = [
         [InlineKeyboardButton(tr("pdf_menu_7_days", language), callback_data="pdf_7_days")],
         [InlineKeyboardButton(tr("pdf_menu_30_days", language), callback_data="pdf_30_days")],
+        [InlineKeyboardButton(tr("pdf_menu_90_days", language), callback_data="pdf_90_days")],
         [InlineKeyboardButton(tr("btn_home", language), callback_data="refresh")]
     ]
     
@@ -461,7 +463,7 @@ async def show_language_selection(update: Update, context: ContextTypes.DEFAULT_
     """Affiche la sélection de langue pour le PDF"""
     query = update.callback_query
     await query.answer()
-    language = get_language(query.from_user.id)
+    language = await get_language(query.from_user.id)
     # Stocker les jours dans le contexte
     context.user_data['pdf_days'] = days
     
@@ -497,7 +499,7 @@ async def generate_pdf_report(update: Update, context: ContextTypes.DEFAULT_TYPE
         return
     
     user_id = user.id
-    language = get_language(user_id)
+    language = await get_language(user_id)
     # Message de chargement
     loading_message = tr("pdf_loading", language)
     
@@ -511,7 +513,10 @@ async def generate_pdf_report(update: Update, context: ContextTypes.DEFAULT_TYPE
     
     try:
         # Charger les données
-        stats_data = load_user_stats(user_id, days)
+        stats_data = await load_user_stats(user_id, days)
+        if stats_data is not None:
+            # Totaux par jour pour le résumé et le graphique (une ligne par jour)
+            stats_data['daily'] = await load_user_rollups(user_id, days)
         if not stats_data:
             error_msg = tr("error_loading_data", language)
             await query.edit_message_text(
@@ -524,7 +529,7 @@ async def generate_pdf_report(update: Update, context: ContextTypes.DEFAULT_TYPE
             return
         
         # Charger les données du groupe pour le nom
-        group_data = load_user_data(user_id)
+        group_data = await load_user_data(user_id)
         group_name = "Mon Bébé"
         group_id = None
         timediff = 0
@@ -558,6 +563,15 @@ async def generate_pdf_report(update: Update, context: ContextTypes.DEFAULT_TYPE
         # Générer le PDF
         pdf_buffer = await create_weekly_pdf(stats_data, group_name, days, language, timediff)
         
+        # Mêmes totaux que le résumé du PDF (daily_rollups, mêmes jours que la liste)
+        daily = stats_data.get('daily')
+        if daily is not None:
+            bottles_count = sum(day['bottles'] for day in daily.values())
+            poops_count = sum(day['poops'] for day in daily.values())
+        else:
+            bottles_count = len(stats_data.get('entries', []))
+            poops_count = len(stats_data.get('poop', []))
+        
         # Envoyer le PDF
         filename = f"rapport_bebe_{language}_{(datetime.now(ZoneInfo('UTC')) + timedelta(hours=timediff)).strftime('%Y%m%d_%H%M')}.pdf"
         
@@ -569,9 +583,11 @@ async def generate_pdf_report(update: Update, context: ContextTypes.DEFAULT_TYPE
             chat_id=query.message.chat.id,
             document=pdf_buffer,
             filename=filename,
+            # Uploads wait behind dashboard edits
+            rate_limit_args={"priority": PRIORITY_DOCUMENT},
             caption=f"📄 **{TRANSLATIONS[language]['report_days']} {days} {TRANSLATIONS[language]['days']}** - {group_name}\n\n"
-                   f"📊 {len(stats_data.get('entries', []))} {TRANSLATIONS[language]['bottles_count']}\n"
-                   f"💩 {len(stats_data.get('poop', []))} {TRANSLATIONS[language]['changes_count']}\n"
+                   f"📊 {bottles_count} {TRANSLATIONS[language]['bottles_count']}\n"
+                   f"💩 {poops_count} {TRANSLATIONS[language]['changes_count']}\n"
                    f"📅 {TRANSLATIONS[language]['generated_on']} {(datetime.now(ZoneInfo('UTC')) + timedelta(hours=timediff)).strftime('%d/%m/%Y à %H:%M')}"
         )
         
@@ -588,7 +604,7 @@ async def generate_pdf_report(update: Update, context: ContextTypes.DEFAULT_TYPE
         from handlers.queries import get_main_message_content_for_user
         from utils import set_group_message_info, save_data
         
-        message_text, keyboard = get_main_message_content_for_user(user_id)
+        message_text, keyboard = await get_main_message_content_for_user(user_id)
         
         # Envoyer le nouveau message principal
         new_message = await context.bot.send_message(
@@ -600,7 +616,7 @@ async def generate_pdf_report(update: Update, context: ContextTypes.DEFAULT_TYPE
         
         # Mettre à jour les informations du message dans la base de données
         if group_id:
-            set_group_message_info(group_data, group_id, user_id, new_message.message_id, new_message.chat.id)
+            await set_group_message_info(group_data, group_id, user_id, new_message.message_id, new_message.chat.id)
             await save_data(group_data, context)
         
     except Exception as e:
@@ -692,27 +708,36 @@ async def create_weekly_pdf(stats_data, group_name, days, language='fr', timedif
     entries = stats_data.get('entries', [])
     poop = stats_data.get('poop', [])
     
-    total_ml = sum(e['amount'] for e in entries)
+    # Résumé depuis daily_rollups quand disponible, sinon depuis les lignes brutes
+    daily = stats_data.get('daily')
+    if daily is not None:
+        total_bottles = sum(day['bottles'] for day in daily.values())
+        total_ml = sum(day['total_ml'] for day in daily.values())
+        total_poops = sum(day['poops'] for day in daily.values())
+    else:
+        total_bottles = len(entries)
+        total_ml = sum(e['amount'] for e in entries)
+        total_poops = len(poop)
     avg_ml_per_day = total_ml / days if days > 0 else 0
-    avg_bottles_per_day = len(entries) / days if days > 0 else 0
+    avg_bottles_per_day = total_bottles / days if days > 0 else 0
     
     story.append(Paragraph(t['general_stats'], subtitle_style))
     if language == 'he':
         stats_data_table = [
             [t['value'], t['metric']],
-            [f"{len(entries)}", t['total_bottles']],
+            [f"{total_bottles}", t['total_bottles']],
             [f"{avg_ml_per_day:.0f}ml", t['avg_ml_day']],
             [f"{avg_bottles_per_day:.1f}", t['avg_bottles_day']],
-            [f"{len(poop)}", t['diaper_changes']]
+            [f"{total_poops}", t['diaper_changes']]
         ]
         stats_table = Table(stats_data_table, colWidths=[2*inch, 3*inch])
     else:
         stats_data_table = [
         [t['metric'], t['value']],
-        [t['total_bottles'], f"{len(entries)}"],
+        [t['total_bottles'], f"{total_bottles}"],
         [t['avg_ml_day'], f"{avg_ml_per_day:.0f}ml"],
         [t['avg_bottles_day'], f"{avg_bottles_per_day:.1f}"],
-        [t['diaper_changes'], f"{len(poop)}"]
+        [t['diaper_changes'], f"{total_poops}"]
         ]
         stats_table = Table(stats_data_table, colWidths=[3*inch, 2*inch])
     stats_table.setStyle(TableStyle([
@@ -921,6 +946,9 @@ async def handle_pdf_callback(update: Update, context: ContextTypes.DEFAULT_TYPE
         await show_language_selection(update, context, 7)
     elif action == "pdf_30_days":
         await show_language_selection(update, context, 30)
+    elif action == "pdf_90_days":
+        # Reaches past the hot retention window, read through the archive
+        await show_language_selection(update, context, 90)
     elif action == "pdf_cancel":
         await query.edit_message_text(
             text="❌ Génération annulée",
@@ -997,8 +1025,12 @@ def create_daily_consumption_chart(stats_data, days: int, language: str = 'fr')
         # Préparer les données
         entries = stats_data.get('entries', [])
         
-        # Grouper par jour
+        # Grouper par jour (déjà fait par daily_rollups quand disponible)
         daily_consumption = defaultdict(int)
+        if stats_data.get('daily') is not None:
+            for date_key, day in stats_data['daily'].items():
+                daily_consumption[date_key] = day['total_ml']
+            entries = []
         for entry in entries:
             # Normaliser la date à UTC pour éviter les problèmes de timezone
             entry_time = entry['time']
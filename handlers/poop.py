@@ -2,8 +2,8 @@ from datetime import datetime, timedelta
 from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup
 from telegram.ext import ContextTypes, ConversationHandler
 from zoneinfo import ZoneInfo
-from utils import load_data, save_data, find_group_for_user, create_personal_group, is_valid_time, normalize_time, delete_user_message, update_main_message, set_group_message_info, load_user_data,  update_all_group_messages
-from database import add_poop_to_group, get_language
+from utils import save_data, find_group_for_user, create_personal_group, is_valid_time, normalize_time, delete_user_message, update_main_message, set_group_message_info, load_user_data,  update_all_group_messages, idempotency_key
+from database_async import add_poop_to_group, get_language
 from translations import t
 
 ASK_POOP_TIME, ASK_POOP_INFO = range(2)
@@ -24,18 +24,17 @@ async def add_poop(update: Update, context: ContextTypes.DEFAULT_TYPE):
     await query.answer()
     
     user_id = update.effective_user.id
-    language = get_language(user_id)
+    language = await get_language(user_id)
     
     # Use optimized data loading
-    data = load_user_data(user_id)
+    data = await load_user_data(user_id)
     if not data:
-        # Fallback to old method if needed
-        data = load_data()
-        group_id = find_group_for_user(data, user_id)
+        # No group loaded: resolve it from the database
+        group_id = await find_group_for_user(data, user_id)
         if not group_id:
-            group_id = create_personal_group(data, user_id)
+            group_id = await create_personal_group(data, user_id)
             await save_data(data, context)
-            data = load_user_data(user_id)
+            data = await load_user_data(user_id)
     
     if not data:
         error_msg = t("error_create_group", language)
@@ -105,14 +104,13 @@ async def handle_poop_time(update: Update, context: ContextTypes.DEFAULT_TYPE, t
         await delete_user_message(context, update.effective_chat.id, update.message.message_id)
     
     user_id = update.effective_user.id
-    language = get_language(user_id)
+    language = await get_language(user_id)
     
     # Use optimized data loading
-    data = load_user_data(user_id)
+    data = await load_user_data(user_id)
     if not data:
-        # Fallback to old method if needed
-        data = load_data()
-        group_id = find_group_for_user(data, user_id)
+        # No group loaded: resolve it from the database
+        group_id = await find_group_for_user(data, user_id)
         if not group_id or group_id not in data:
             error_msg = t("error_create_group", language)
             if hasattr(update, 'message') and update.message:
@@ -153,6 +151,8 @@ async def handle_poop_time(update: Update, context: ContextTypes.DEFAULT_TYPE, t
             if now_utc < dt:
                 dt = dt - timedelta(days=1)
         context.user_data['poop_time'] = dt
+        # One poop per info prompt, however many times its buttons are tapped
+        context.user_data['poop_key'] = idempotency_key(update, "poop")
         keyboard = [
             [InlineKeyboardButton(t("btn_finish", language), callback_data="poop_info_none")],
             [InlineKeyboardButton(t("btn_cancel", language), callback_data="cancel")]
@@ -168,7 +168,7 @@ async def handle_poop_time(update: Update, context: ContextTypes.DEFAULT_TYPE, t
         else:
             await update_main_message(context, message, InlineKeyboardMarkup(keyboard))
             if context.user_data.get('main_message_id') and context.user_data.get('chat_id'):
-                set_group_message_info(data, group_id, user_id, context.user_data['main_message_id'], context.user_data['chat_id'])
+                await set_group_message_info(data, group_id, user_id, context.user_data['main_message_id'], context.user_data['chat_id'])
         return ASK_POOP_INFO
     except Exception as e:
         error_msg = t("error_general", language)
@@ -197,7 +197,7 @@ async def handle_poop_info(update: Update, context: ContextTypes.DEFAULT_TYPE, i
         await delete_user_message(context, update.effective_chat.id, update.message.message_id)
     
     user_id = update.effective_user.id
-    language = get_language(user_id)
+    language = await get_language(user_id)
     
     try:
         dt = context.user_data.get('poop_time')
@@ -209,26 +209,20 @@ async def handle_poop_info(update: Update, context: ContextTypes.DEFAULT_TYPE, i
                     reply_markup=InlineKeyboardMarkup([[InlineKeyboardButton(t("btn_cancel", language), callback_data="cancel")]])
                 )
             else:
-                data = load_user_data(user_id)
-                if not data:
-                    data = load_data()
-                group_id = find_group_for_user(data, user_id)
+                data = await load_user_data(user_id)
+                group_id = await find_group_for_user(data, user_id)
                 await update_main_message(context, error_msg, InlineKeyboardMarkup([[InlineKeyboardButton(t("btn_cancel", language), callback_data="cancel")]]))
             return ConversationHandler.END
         
-        data = load_user_data(user_id)
-        if not data:
-            data = load_data()
+        data = await load_user_data(user_id)
         
-        group_id = find_group_for_user(data, user_id)
+        group_id = await find_group_for_user(data, user_id)
         # Convert group_id to int for database function
-        add_poop_to_group(int(group_id), dt, info)
+        await add_poop_to_group(int(group_id), dt, info, idempotency_key=context.user_data.get('poop_key'))
         
         
         # Reload data to get the updated information including the new poop
-        data = load_user_data(user_id)
-        if not data:
-            data = load_data()
+        data = await load_user_data(user_id)
         
         # Return to main message with updated data
         from handlers.queries import get_main_message_content
@@ -249,7 +243,7 @@ async def handle_poop_info(update: Update, context: ContextTypes.DEFAULT_TYPE, i
             await update_main_message(context, success_text, keyboard)
             # Store the message ID for future text inputs
             if context.user_data.get('main_message_id') and context.user_data.get('chat_id'):
-                set_group_message_info(data, group_id, user_id, context.user_data['main_message_id'], context.user_data['chat_id'])
+                await set_group_message_info(data, group_id, user_id, context.user_data['main_message_id'], context.user_data['chat_id'])
         
         # Update all group messages with the new content
         user_id = update.effective_user.id
@@ -260,6 +254,7 @@ async def handle_poop_info(update: Update, context: ContextTypes.DEFAULT_TYPE, i
         # Clear conversation state
         context.user_data.pop('conversation_state', None)
         context.user_data.pop('poop_time', None)
+        context.user_data.pop('poop_key', None)
         
         return ConversationHandler.END
     except Exception as e:
@@ -270,11 +265,9 @@ async def handle_poop_info(update: Update, context: ContextTypes.DEFAULT_TYPE, i
                 reply_markup=InlineKeyboardMarkup([[InlineKeyboardButton(t("btn_cancel", language), callback_data="cancel")]])
             )
         else:
-            data = load_user_data(user_id)
-            if not data:
-                data = load_data()
+            data = await load_user_data(user_id)
             
-            group_id = find_group_for_user(data, user_id)
+            group_id = await find_group_for_user(data, user_id)
             await update_main_message(context, error_msg, InlineKeyboardMarkup([[InlineKeyboardButton(t("btn_cancel", language), callback_data="cancel")]]))
         return ConversationHandler.END
 
@@ -1,8 +1,7 @@
 from datetime import datetime
 from telegram import InlineKeyboardButton, InlineKeyboardMarkup
 
-from utils import load_user_data
-from database import get_language
+from database_async import get_language, get_dashboard_snapshot
 from translations import t
 
 def format_time(time: str) -> str:
@@ -90,15 +89,15 @@ def get_main_message_content(data, group_id, language="fr"):
     ]
     return message, InlineKeyboardMarkup(keyboard)
 
-def get_main_message_content_for_user(user_id: int):
-    """Optimized version that loads only user-specific data"""
-    data = load_user_data(user_id)
-    language = get_language(user_id)
-    if not data:
+async def get_main_message_content_for_user(user_id: int, language: str = None):
+    """Optimized version: group, last entries, message info and language in one query"""
+    snapshot = await get_dashboard_snapshot(user_id)
+    if language is None:
+        language = snapshot.language if snapshot and snapshot.language else await get_language(user_id)
+    if not snapshot:
         return t("error_load_data", language), InlineKeyboardMarkup([[
             InlineKeyboardButton(t("btn_refresh", language), callback_data="refresh")
         ]])
     
-    # Get the first (and only) group in the data
-    group_id = list(data.keys())[0]
-    return get_main_message_content(data, group_id, language)
+    data = snapshot.as_group_data()
+    return get_main_message_content(data, str(snapshot.group_id), language)
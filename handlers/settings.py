@@ -1,10 +1,10 @@
 from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup
 from telegram.ext import ContextTypes
-from utils import load_data, save_data, find_group_for_user, create_personal_group, normalize_time, ensure_main_message_exists, update_main_message
+from utils import load_user_data, find_group_for_user, create_personal_group, normalize_time, ensure_main_message_exists, update_main_message
 from datetime import datetime, timedelta
 from zoneinfo import ZoneInfo
 from config import TEST_MODE
-from database import update_group, get_language, update_language
+from database_async import update_group_settings, get_language, update_language, get_user_group_id, get_group_settings
 from translations import t
 
 async def show_settings(update: Update, context: ContextTypes.DEFAULT_TYPE):
@@ -12,16 +12,14 @@ async def show_settings(update: Update, context: ContextTypes.DEFAULT_TYPE):
     query = update.callback_query
     await query.answer()
     
-    data = load_data()
     user_id = update.effective_user.id
-    language = get_language(user_id)
-    group_id = find_group_for_user(data, user_id)
+    language = await get_language(user_id)
+    group_id = await get_user_group_id(user_id)
     if not group_id:
-        group_id = create_personal_group(data, user_id)
-        await save_data(data, context)
-        data = load_data()
+        group_id = await create_personal_group({}, user_id)
+    settings = await get_group_settings(group_id) if group_id else None
     
-    if not group_id or group_id not in data:
+    if not settings:
         error_msg = t("error_create_group", language)
         if hasattr(update, 'message') and update.message:
             await update.message.reply_text(error_msg)
@@ -30,13 +28,10 @@ async def show_settings(update: Update, context: ContextTypes.DEFAULT_TYPE):
         return
     
     # Get current settings
-    bottles_to_show = data[group_id].get("bottles_to_show", 5)
-    poops_to_show = data[group_id].get("poops_to_show", 1)
-    td = data[group_id].get("time_difference", 0)
-    if td is None:
-        td = 0
-    last_bottle = data[group_id].get("last_bottle", 120)
-    time_difference = td
+    bottles_to_show = settings["bottles_to_show"]
+    poops_to_show = settings["poops_to_show"]
+    last_bottle = settings["last_bottle"]
+    time_difference = settings["time_difference"]
     adjusted_time = datetime.now(ZoneInfo("UTC")) + timedelta(hours=time_difference)
     
     message = t("settings_title", language)
@@ -79,12 +74,12 @@ async def handle_settings(update: Update, context: ContextTypes.DEFAULT_TYPE, se
         # Extract setting from callback data
         setting = query.data.replace("setting_", "")
     
-    data = load_data()
     user_id = update.effective_user.id
-    language = get_language(user_id)
-    group_id = find_group_for_user(data, user_id)
+    language = await get_language(user_id)
+    group_id = await get_user_group_id(user_id)
+    settings = await get_group_settings(group_id) if group_id else None
     
-    if not group_id or group_id not in data:
+    if not settings:
         error_msg = t("error_create_group", language)
         if hasattr(update, 'message') and update.message:
             await update.message.reply_text(error_msg)
@@ -94,7 +89,7 @@ async def handle_settings(update: Update, context: ContextTypes.DEFAULT_TYPE, se
     
     if setting == "bottles":
         # Show bottle count options
-        current = data[group_id].get("bottles_to_show", 5)
+        current = settings["bottles_to_show"]
         keyboard = []
         
         # Create rows of 3 buttons each
@@ -120,7 +115,7 @@ async def handle_settings(update: Update, context: ContextTypes.DEFAULT_TYPE, se
     
     elif setting == "poops":
         # Show poop count options
-        current = data[group_id].get("poops_to_show", 1)
+        current = settings["poops_to_show"]
         keyboard = []
         
         # Create rows of 3 buttons each
@@ -146,28 +141,16 @@ async def handle_settings(update: Update, context: ContextTypes.DEFAULT_TYPE, se
     
     elif setting.startswith("set_bottles_"):
         count = int(setting.replace("set_bottles_", ""))
-        data[group_id]["bottles_to_show"] = count
-        # Convert group_id to int for database function
-        update_group(int(group_id), data[group_id])
-
-        # Recharge les données du groupe après la modification
-        data = load_data()
+        await update_group_settings(group_id, bottles_to_show=count)
         await show_settings(update, context)
     
     elif setting.startswith("set_poops_"):
         count = int(setting.replace("set_poops_", ""))
-        data[group_id]["poops_to_show"] = count
-        # Convert group_id to int for database function
-        update_group(int(group_id), data[group_id])
-        # Recharge les données du groupe après la modification
-        data = load_data()
+        await update_group_settings(group_id, poops_to_show=count)
         await show_settings(update, context)
     
     elif setting == "timezone":
-        td = data[group_id].get("time_difference", 0)
-        if td is None:
-            td = 0
-        current_diff = td
+        current_diff = settings["time_difference"]
         current_time = datetime.now(ZoneInfo("UTC")) + timedelta(hours=current_diff)
         utc_time = datetime.now(ZoneInfo("UTC"))
         
@@ -216,11 +199,7 @@ async def handle_settings(update: Update, context: ContextTypes.DEFAULT_TYPE, se
                 diff_hour -= 24
             elif diff_hour < -12:
                 diff_hour += 24
-            data[group_id]["time_difference"] = diff_hour
-            # Convert group_id to int for database function
-            update_group(int(group_id), data[group_id])
-            # Recharge les données du groupe après la modification
-            data = load_data()
+            await update_group_settings(group_id, time_difference=diff_hour)
             adjusted_time = datetime.now(ZoneInfo("UTC")) + timedelta(hours=diff_hour)
             message = t("timezone_success", language, time_str, now.strftime('%H:%M'), diff_hour)
             keyboard = [[InlineKeyboardButton(t("btn_return_settings", language), callback_data="settings")]]
@@ -239,8 +218,8 @@ async def handle_settings(update: Update, context: ContextTypes.DEFAULT_TYPE, se
             )
     
     elif setting == "groups":
-        # Show groups
-        groups = list(data.keys())
+        # Show the user's group
+        groups = [str(group_id)]
         keyboard = []
         
         for group in groups:
@@ -257,11 +236,7 @@ async def handle_settings(update: Update, context: ContextTypes.DEFAULT_TYPE, se
         )
     
     elif setting.startswith("group_"):
-        # Set group
-        group = setting.replace("group_", "")
-        data[group] = {}
-        # No save_data here; persistence is handled elsewhere
-        # Show confirmation and return to settings
+        # Group switching goes through the groups menu; just return to settings
         await show_settings(update, context)
     
     elif setting == "refresh":
@@ -297,7 +272,7 @@ async def handle_settings(update: Update, context: ContextTypes.DEFAULT_TYPE, se
     elif setting == "last_bottle":
         context.user_data['conversation_state'] = 'last_bottle'
         # Show quick choices for last bottle + manual input
-        current = data[group_id].get("last_bottle", 120)
+        current = settings["last_bottle"]
         quick_choices = [current -10, current, current + 10, current + 20, current + 30, current + 40]
         keyboard = []
         row = []
@@ -318,9 +293,7 @@ async def handle_settings(update: Update, context: ContextTypes.DEFAULT_TYPE, se
         )
     elif setting.startswith("set_last_bottle_"):
         value = int(setting.replace("set_last_bottle_", ""))
-        data[group_id]["last_bottle"] = value
-        update_group(int(group_id), data[group_id])
-        data = load_data()
+        await update_group_settings(group_id, last_bottle=value)
         message = t("bottle_size_success", language, value)
         keyboard = [[InlineKeyboardButton(t("btn_return_settings", language), callback_data="settings")]]
         await query.edit_message_text(
@@ -330,7 +303,7 @@ async def handle_settings(update: Update, context: ContextTypes.DEFAULT_TYPE, se
         )
     elif setting == "language":
             # Show poop count options
-        current = get_language(user_id)
+        current = await get_language(user_id)
         keyboard = []
         
         # Create rows of 3 buttons each
@@ -354,12 +327,12 @@ async def handle_settings(update: Update, context: ContextTypes.DEFAULT_TYPE, se
     
     elif setting.startswith("set_language_"):
         language = setting.replace("set_language_", "")
-        update_language(user_id, language)
+        await update_language(user_id, language)
         context.user_data.pop('conversation_state', None)
         # Recharge les données du groupe après la modification
-        data = load_data()
+        data = await load_user_data(user_id)
         from handlers.queries import get_main_message_content
-        message_text, keyboard = get_main_message_content(data, group_id, language)
+        message_text, keyboard = get_main_message_content(data, str(group_id), language)
         await update_main_message(context, message_text, keyboard)
     
 
@@ -367,9 +340,9 @@ async def handle_settings(update: Update, context: ContextTypes.DEFAULT_TYPE, se
 async def handle_timezone_text_input(update: Update, context: ContextTypes.DEFAULT_TYPE, time_str: str):
     """Handle manual timezone text input"""
     user_id = update.effective_user.id
-    language = get_language(user_id)
-    data = load_data()
-    group_id = find_group_for_user(data, user_id)
+    language = await get_language(user_id)
+    data = await load_user_data(user_id)
+    group_id = await find_group_for_user(data, user_id)
     try:
         # Normalize the time input
         normalized_time = normalize_time(time_str)
@@ -385,12 +358,11 @@ async def handle_timezone_text_input(update: Update, context: ContextTypes.DEFAU
             diff_hour -= 24
         elif diff_hour < -12:
             diff_hour += 24
-        # Update the time difference and persist to Supabase
-        data[group_id]["time_difference"] = diff_hour
+        # Update the time difference and persist it
         # Convert group_id to int for database function
-        update_group(int(group_id), data[group_id])
+        await update_group_settings(int(group_id), time_difference=diff_hour)
         # Recharge les données du groupe après la modification
-        data = load_data()
+        data = await load_user_data(user_id)
         # Clear conversation state
         context.user_data.pop('conversation_state', None)
         # Show confirmation
@@ -409,16 +381,15 @@ async def handle_timezone_text_input(update: Update, context: ContextTypes.DEFAU
 
 async def handle_last_bottle_text_input(update: Update, context: ContextTypes.DEFAULT_TYPE, value_str: str):
     user_id = update.effective_user.id
-    language = get_language(user_id)
-    data = load_data()
-    group_id = find_group_for_user(data, user_id)
+    language = await get_language(user_id)
+    data = await load_user_data(user_id)
+    group_id = await find_group_for_user(data, user_id)
     try:
         value = int(value_str.strip())
         if value <= 0:
             raise ValueError
-        data[group_id]["last_bottle"] = value
-        update_group(int(group_id), data[group_id])
-        data = load_data()
+        await update_group_settings(int(group_id), last_bottle=value)
+        data = await load_user_data(user_id)
         context.user_data.pop('conversation_state', None)
         message = t("bottle_size_success", language, value)
         keyboard = [[InlineKeyboardButton(t("btn_return_settings", language), callback_data="settings")]]
@@ -1,9 +1,10 @@
+import asyncio
 from datetime import datetime, timedelta
 from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup
 from telegram.ext import ContextTypes, ConversationHandler
 from zoneinfo import ZoneInfo
-from utils import load_data, save_data, find_group_for_user, create_personal_group, update_main_message, load_user_data,  update_all_group_messages
-from database import add_entry_to_group, add_poop_to_group, get_language
+from utils import save_data, find_group_for_user, create_personal_group, update_main_message, load_user_data,  update_all_group_messages, idempotency_key
+from database_async import add_entry_to_group, add_poop_to_group, get_language
 from translations import t
 
 ASK_SHABBAT_FRIDAY_POOP, ASK_SHABBAT_FRIDAY_BOTTLE, ASK_SHABBAT_SATURDAY_POOP, ASK_SHABBAT_SATURDAY_BOTTLE = range(4)
@@ -12,15 +13,15 @@ async def start_shabbat(update: Update, context: ContextTypes.DEFAULT_TYPE):
     query = update.callback_query
     await query.answer()
     user_id = update.effective_user.id
-    data = load_user_data(user_id)
-    language = get_language(user_id)
+    data = await load_user_data(user_id)
+    language = await get_language(user_id)
     if not data:
-        data = load_data()
-        group_id = find_group_for_user(data, user_id)
+        # No group loaded: resolve it from the database
+        group_id = await find_group_for_user(data, user_id)
         if not group_id:
-            group_id = create_personal_group(data, user_id)
+            group_id = await create_personal_group(data, user_id)
             await save_data(data, context)
-            data = load_user_data(user_id)
+            data = await load_user_data(user_id)
     if not data:
         await query.edit_message_text(t("error_load_data", language))
         return
@@ -31,6 +32,8 @@ async def start_shabbat(update: Update, context: ContextTypes.DEFAULT_TYPE):
         td = 0
     context.user_data['shabbat_group_id'] = group_id
     context.user_data['shabbat_time_difference'] = td
+    # Clé du parcours : le rejouer (ou taper deux fois) n'ajoute pas les entrées en double
+    context.user_data['shabbat_key'] = idempotency_key(update, "shabbat")
     # Demander le nombre de cacas vendredi soir
     keyboard = [[InlineKeyboardButton(t("btn_cancel", language), callback_data="cancel")]]
     message = t("shabbat_friday_poop", language)
@@ -39,7 +42,7 @@ async def start_shabbat(update: Update, context: ContextTypes.DEFAULT_TYPE):
 
 async def handle_shabbat_friday_poop(update: Update, context: ContextTypes.DEFAULT_TYPE):
     user_id = update.effective_user.id
-    language = get_language(user_id)
+    language = await get_language(user_id)
     query = update.callback_query if hasattr(update, 'callback_query') and update.callback_query else None
     if query:
         await query.answer()
@@ -69,7 +72,7 @@ async def handle_shabbat_friday_poop(update: Update, context: ContextTypes.DEFAU
 async def handle_shabbat_friday_bottle(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Gère la saisie de la quantité de lait vendredi soir"""
     user_id = update.effective_user.id
-    language = get_language(user_id)
+    language = await get_language(user_id)
     query = update.callback_query if hasattr(update, 'callback_query') and update.callback_query else None
     if query:
         await query.answer()
@@ -97,7 +100,7 @@ async def handle_shabbat_friday_bottle(update: Update, context: ContextTypes.DEF
 
 async def handle_shabbat_saturday_poop(update: Update, context: ContextTypes.DEFAULT_TYPE):
     user_id = update.effective_user.id
-    language = get_language(user_id)
+    language = await get_language(user_id)
     query = update.callback_query if hasattr(update, 'callback_query') and update.callback_query else None
     if query:
         await query.answer()
@@ -125,7 +128,7 @@ async def handle_shabbat_saturday_poop(update: Update, context: ContextTypes.DEF
 
 async def handle_shabbat_saturday_bottle(update: Update, context: ContextTypes.DEFAULT_TYPE):
     user_id = update.effective_user.id
-    language = get_language(user_id)
+    language = await get_language(user_id)
     query = update.callback_query if hasattr(update, 'callback_query') and update.callback_query else None
     if query:
         await query.answer()
@@ -155,22 +158,28 @@ async def handle_shabbat_saturday_bottle(update: Update, context: ContextTypes.D
     # Samedi midi (12h)
     saturday = friday + timedelta(days=1)
     saturday_12h = saturday.replace(hour=12, minute=0, second=0, microsecond=0)
+    # Toutes les écritures partent ensemble : un seul commit pour le week-end
+    writes = []
+    key = context.user_data.get('shabbat_key') or idempotency_key(update, "shabbat")
     # Ajouter les cacas vendredi soir
-    for _ in range(context.user_data['shabbat_friday_poop']):
-        add_poop_to_group(int(group_id), friday_23h)
+    for i in range(context.user_data['shabbat_friday_poop']):
+        writes.append(add_poop_to_group(int(group_id), friday_23h, idempotency_key=f"{key}:friday_poop:{i}"))
     # Ajouter le biberon vendredi soir
     if context.user_data['shabbat_friday_bottle'] > 0:
-        add_entry_to_group(int(group_id), context.user_data['shabbat_friday_bottle'], friday_23h)
+        writes.append(add_entry_to_group(int(group_id), context.user_data['shabbat_friday_bottle'], friday_23h,
+                                         idempotency_key=f"{key}:friday_bottle"))
     # Ajouter les cacas samedi midi
-    for _ in range(context.user_data['shabbat_saturday_poop']):
-        add_poop_to_group(int(group_id), saturday_12h)
+    for i in range(context.user_data['shabbat_saturday_poop']):
+        writes.append(add_poop_to_group(int(group_id), saturday_12h, idempotency_key=f"{key}:saturday_poop:{i}"))
     # Ajouter le biberon samedi midi
     if context.user_data['shabbat_saturday_bottle'] > 0:
-        add_entry_to_group(int(group_id), context.user_data['shabbat_saturday_bottle'], saturday_12h)
+        writes.append(add_entry_to_group(int(group_id), context.user_data['shabbat_saturday_bottle'], saturday_12h,
+                                         idempotency_key=f"{key}:saturday_bottle"))
+    await asyncio.gather(*writes)
 
     # Message de succès et retour à l'accueil
     from handlers.queries import get_main_message_content
-    data = load_user_data(user_id)
+    data = await load_user_data(user_id)
     message_text, keyboard = get_main_message_content(data, group_id, language)
     message = t("shabbat_success", language) + "\n\n" + message_text
     
@@ -189,7 +198,8 @@ async def handle_shabbat_saturday_bottle(update: Update, context: ContextTypes.D
     context.user_data.pop('shabbat_friday_poop', None)
     context.user_data.pop('shabbat_friday_bottle', None)
     context.user_data.pop('shabbat_saturday_poop', None)
-    context.user_data.pop('shabbat_saturday_bottle', None) 
+    context.user_data.pop('shabbat_saturday_bottle', None)
+    context.user_data.pop('shabbat_key', None)
 
 async def show_shabbat_menu(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Show Shabbat mode menu"""
@@ -197,18 +207,17 @@ async def show_shabbat_menu(update: Update, context: ContextTypes.DEFAULT_TYPE):
     await query.answer()
     
     user_id = update.effective_user.id
-    language = get_language(user_id)
+    language = await get_language(user_id)
     
     # Use optimized data loading
-    data = load_user_data(user_id)
+    data = await load_user_data(user_id)
     if not data:
-        # Fallback to old method if needed
-        data = load_data()
-        group_id = find_group_for_user(data, user_id)
+        # No group loaded: resolve it from the database
+        group_id = await find_group_for_user(data, user_id)
         if not group_id:
-            group_id = create_personal_group(data, user_id)
+            group_id = await create_personal_group(data, user_id)
             await save_data(data, context)
-            data = load_user_data(user_id)
+            data = await load_user_data(user_id)
     
     if not data:
         error_msg = t("error_load_data", language)
@@ -247,18 +256,17 @@ async def enable_shabbat_mode(update: Update, context: ContextTypes.DEFAULT_TYPE
     await query.answer()
     
     user_id = update.effective_user.id
-    language = get_language(user_id)
+    language = await get_language(user_id)
     
     # Use optimized data loading
-    data = load_user_data(user_id)
+    data = await load_user_data(user_id)
     if not data:
-        # Fallback to old method if needed
-        data = load_data()
-        group_id = find_group_for_user(data, user_id)
+        # No group loaded: resolve it from the database
+        group_id = await find_group_for_user(data, user_id)
         if not group_id:
-            group_id = create_personal_group(data, user_id)
+            group_id = await create_personal_group(data, user_id)
             await save_data(data, context)
-            data = load_user_data(user_id)
+            data = await load_user_data(user_id)
     
     if not data:
         error_msg = t("error_load_data", language)
@@ -273,14 +281,10 @@ async def enable_shabbat_mode(update: Update, context: ContextTypes.DEFAULT_TYPE
     group_data["shabbat_mode"] = True
     group_data["shabbat_start"] = datetime.now(ZoneInfo("UTC")).isoformat()
     
-    # Save to database
-    from database import update_group
-    update_group(int(group_id), group_data)
+    # shabbat_mode/shabbat_start are not groups columns: nothing to write back
     
     # Reload data
-    data = load_user_data(user_id)
-    if not data:
-        data = load_data()
+    data = await load_user_data(user_id)
     
     # Return to main message with updated data
     from handlers.queries import get_main_message_content
@@ -304,18 +308,17 @@ async def disable_shabbat_mode(update: Update, context: ContextTypes.DEFAULT_TYP
     await query.answer()
     
     user_id = update.effective_user.id
-    language = get_language(user_id)
+    language = await get_language(user_id)
     
     # Use optimized data loading
-    data = load_user_data(user_id)
+    data = await load_user_data(user_id)
     if not data:
-        # Fallback to old method if needed
-        data = load_data()
-        group_id = find_group_for_user(data, user_id)
+        # No group loaded: resolve it from the database
+        group_id = await find_group_for_user(data, user_id)
         if not group_id:
-            group_id = create_personal_group(data, user_id)
+            group_id = await create_personal_group(data, user_id)
             await save_data(data, context)
-            data = load_user_data(user_id)
+            data = await load_user_data(user_id)
     
     if not data:
         error_msg = t("error_load_data", language)
@@ -331,14 +334,10 @@ async def disable_shabbat_mode(update: Update, context: ContextTypes.DEFAULT_TYP
     if "shabbat_start" in group_data:
         del group_data["shabbat_start"]
     
-    # Save to database
-    from database import update_group
-    update_group(int(group_id), group_data)
+    # shabbat_mode/shabbat_start are not groups columns: nothing to write back
     
     # Reload data
-    data = load_user_data(user_id)
-    if not data:
-        data = load_data()
+    data = await load_user_data(user_id)
     
     # Return to main message with updated data
     from handlers.queries import get_main_message_content
@@ -359,18 +358,17 @@ async def disable_shabbat_mode(update: Update, context: ContextTypes.DEFAULT_TYP
 async def add_shabbat_bottle(update: Update, context: ContextTypes.DEFAULT_TYPE, amount: int, time_str: str = None):
     """Add a bottle during Shabbat mode (without updating messages)"""
     user_id = update.effective_user.id
-    language = get_language(user_id)
+    language = await get_language(user_id)
     
     # Use optimized data loading
-    data = load_user_data(user_id)
+    data = await load_user_data(user_id)
     if not data:
-        # Fallback to old method if needed
-        data = load_data()
-        group_id = find_group_for_user(data, user_id)
+        # No group loaded: resolve it from the database
+        group_id = await find_group_for_user(data, user_id)
         if not group_id:
-            group_id = create_personal_group(data, user_id)
+            group_id = await create_personal_group(data, user_id)
             await save_data(data, context)
-            data = load_user_data(user_id)
+            data = await load_user_data(user_id)
     
     if not data:
         return False
@@ -397,6 +395,6 @@ async def add_shabbat_bottle(update: Update, context: ContextTypes.DEFAULT_TYPE,
         dt = datetime.now(ZoneInfo("UTC"))
     
     # Add the bottle entry to the database
-    add_entry_to_group(int(group_id), amount, dt)
+    await add_entry_to_group(int(group_id), amount, dt, idempotency_key=idempotency_key(update, "shabbat_bottle"))
     
     return True 
\ No newline at end of file
@@ -2,8 +2,8 @@ from datetime import datetime, timedelta
 from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup
 from telegram.ext import ContextTypes
 from zoneinfo import ZoneInfo
-from utils import load_data, find_group_for_user, load_user_stats
-from database import get_language
+from utils import load_user_stats, load_user_rollups
+from database_async import get_language
 from translations import t
 import os
 import requests
@@ -21,15 +21,14 @@ async def show_stats(update: Update, context: ContextTypes.DEFAULT_TYPE):
         return
     
     user_id = user.id
-    language = get_language(user_id)
+    language = await get_language(user_id)
     
-    # Use optimized stats loading
-    stats_data = load_user_stats(user_id, 5)
-    if not stats_data:
-        # Fallback to old method if needed
-        data = load_data()
-        group_id = find_group_for_user(data, user_id)
-        if not group_id or group_id not in data:
+    # Per-day totals come straight from daily_rollups (one row per day)
+    daily = await load_user_rollups(user_id, 5)
+    if daily is None:
+        # Fallback: aggregate the last 5 days of raw history
+        history = await load_user_stats(user_id, 5)
+        if not history:
             error_msg = t("error_create_group", language)
             if hasattr(update, 'message') and update.message:
                 await update.message.reply_text(error_msg)
@@ -37,11 +36,14 @@ async def show_stats(update: Update, context: ContextTypes.DEFAULT_TYPE):
                 await update.callback_query.edit_message_text(error_msg)
             return
         
-        entries = data[group_id].get("entries", [])
-        poop = data[group_id].get("poop", [])
-    else:
-        entries = stats_data.get("entries", [])
-        poop = stats_data.get("poop", [])
+        daily = {}
+        for e in history.get("entries", []):
+            day = daily.setdefault(e["time"].strftime("%Y-%m-%d"), {"bottles": 0, "total_ml": 0, "poops": 0})
+            day["bottles"] += 1
+            day["total_ml"] += e["amount"]
+        for p in history.get("poop", []):
+            day = daily.setdefault(p["time"].strftime("%Y-%m-%d"), {"bottles": 0, "total_ml": 0, "poops": 0})
+            day["poops"] += 1
     
     # Calculate stats for last 5 days
     today = datetime.now(ZoneInfo('UTC')).date()
@@ -50,20 +52,12 @@ async def show_stats(update: Update, context: ContextTypes.DEFAULT_TYPE):
     for i in range(5):
         date = today - timedelta(days=i)
         date_str = date.strftime("%d-%m-%Y")
-        
-        # Count bottles for this date
-        day_bottles = [e for e in entries if e["time"].strftime("%d-%m-%Y") == date_str]
-        total_ml = sum(e["amount"] for e in day_bottles)
-        bottle_count = len(day_bottles)
-        
-        # Count poops for this date
-        day_poops = [p for p in poop if p["time"].strftime("%d-%m-%Y") == date_str]
-        poop_count = len(day_poops)
+        day_stats = daily.get(date.isoformat(), {})
         
         stats[date_str] = {
-            "bottles": bottle_count,
-            "total_ml": total_ml,
-            "poops": poop_count,
+            "bottles": day_stats.get("bottles", 0),
+            "total_ml": day_stats.get("total_ml", 0),
+            "poops": day_stats.get("poops", 0),
             "date": date
         }
     today_str = today.strftime("%d-%m-%Y")
@@ -4,14 +4,14 @@ from telegram.ext import ApplicationBuilder, CommandHandler, CallbackQueryHandle
 from telegram import Update, BotCommand, InlineKeyboardButton, InlineKeyboardMarkup
 from handlers.add import add_bottle, handle_bottle_time, handle_bottle_amount
 from handlers.poop import add_poop, handle_poop_time, handle_poop_info
-from handlers.delete import delete_bottle, confirm_delete_bottle, cancel_delete_bottle
+from handlers.delete import delete_bottle, confirm_delete_bottle, cancel_delete_bottle, undo_delete_bottle
 from handlers.stats import show_stats
 from handlers.settings import show_settings, handle_settings
 from handlers.groups import show_groups_menu, handle_group_actions
 from handlers.queries import get_main_message_content, get_main_message_content_for_user
 from handlers.pdf import show_pdf_menu, handle_pdf_callback
-from utils import load_data, save_data, find_group_for_user, create_personal_group, get_group_message_info, set_group_message_info, load_user_data
-from config import TEST_MODE
+from utils import save_data, find_group_for_user, create_personal_group, get_group_message_info, set_group_message_info, load_user_data
+from config import TEST_MODE, LANGUAGE_CACHE_WARMUP, DB_QUERY_STATS
 from handlers.shabbat import (
     start_shabbat,
     handle_shabbat_friday_poop,
@@ -20,7 +20,17 @@ from handlers.shabbat import (
     handle_shabbat_saturday_bottle
 )
 from translations import t
-from database import get_language
+from database import (
+    log_connection_settings, close_db_connection, warm_language_cache,
+    start_message_location_flusher, stop_message_location_flusher,
+    start_tombstone_compactor, stop_tombstone_compactor, start_archiver, stop_archiver,
+)
+from migrations import run_migrations
+from backup import start_backup_scheduler, stop_backup_scheduler
+from query_stats import start_query_stats_reporter, stop_query_stats_reporter
+from rate_limiter import TelegramRateLimiter
+from outbox import start_outbox_worker, stop_outbox_worker
+from database_async import get_language, shutdown_executor, close_write_queue
 
 import sys
 import traceback
@@ -33,32 +43,31 @@ async def start(update, context):
     print(f"DEBUG START: Starting /start for user {user_id}")
     
     # Use optimized data loading
-    data = load_user_data(user_id)
+    data = await load_user_data(user_id)
     print(f"DEBUG START: load_user_data returned: {data}")
     if not data:
         print("No data found")
         # Fallback to create personal group if needed
-        data = load_data()
-        group_id = find_group_for_user(data, user_id)
+        group_id = await find_group_for_user(data, user_id)
         print(f"DEBUG START: find_group_for_user returned: {group_id}")
         if not group_id:
             print("Creating personal group")
-            group_id = create_personal_group(data, user_id)
+            group_id = await create_personal_group(data, user_id)
             if group_id:
-                data = load_user_data(user_id)
+                data = await load_user_data(user_id)
     
     if not data:
-        language = get_language(user_id)
+        language = await get_language(user_id)
         error_msg = t("error_load_data", language)
         await update.message.reply_text(error_msg)
         return
     
     # Get group info
-    group_id = find_group_for_user(data, user_id)
+    group_id = await find_group_for_user(data, user_id)
     print(f"DEBUG START: Group ID found: {group_id}")
     
     if not group_id:
-        language = get_language(user_id)
+        language = await get_language(user_id)
         error_msg = t("error_find_group", language)
         await update.message.reply_text(error_msg)
         return
@@ -68,7 +77,7 @@ async def start(update, context):
     print(f"DEBUG START: Group name: {group_name}")
     
     # Check if main message exists for this group/user
-    message_info = get_group_message_info(data, group_id, user_id)
+    message_info = await get_group_message_info(data, group_id, user_id)
     print(f"DEBUG START: Message info for group {group_id}, user {user_id}: {message_info}")
     
     # Supprimer l'ancien message principal s'il existe
@@ -95,7 +104,7 @@ async def start(update, context):
     print(f"DEBUG START: Nouveau message créé - ID: {sent_message.message_id}, Chat: {sent_message.chat_id}")
     
     # Mettre à jour l'ID du message principal dans la base
-    set_group_message_info(data, group_id, user_id, sent_message.message_id, sent_message.chat_id)
+    await set_group_message_info(data, group_id, user_id, sent_message.message_id, sent_message.chat_id)
     await save_data(data, context)
     current = "en"
     keyboard = []
@@ -135,19 +144,18 @@ async def help_command(update, context):
     context.user_data['user_id'] = user_id  # Store user_id for utility functions
     
     # Use optimized data loading
-    data = load_user_data(user_id)
+    data = await load_user_data(user_id)
     if not data:
         # Fallback to create personal group if needed
-        data = load_data()
-        group_id = find_group_for_user(data, user_id)
+        group_id = await find_group_for_user(data, user_id)
         if not group_id:
-            group_id = create_personal_group(data, user_id)
+            group_id = await create_personal_group(data, user_id)
             await save_data(data, context)
             # Reload user data after creating group
-            data = load_user_data(user_id)
+            data = await load_user_data(user_id)
     
     if not data:
-        language = get_language(user_id)
+        language = await get_language(user_id)
         error_msg = t("error_create_group", language)
         if hasattr(update, 'message') and update.message:
             await update.message.reply_text(error_msg)
@@ -157,12 +165,12 @@ async def help_command(update, context):
     
     # Get the group ID from the loaded data
     group_id = list(data.keys())[0]
-    language = get_language(user_id)
+    language = await get_language(user_id)
     help_message = t("help_title", language) + t("help_features", language) + t("help_usage", language)
     # Create keyboard with just a return button
     keyboard = InlineKeyboardMarkup([[InlineKeyboardButton(t("btn_return", language), callback_data="refresh")]])
     # Get existing main message info
-    message_id, chat_id = get_group_message_info(data, group_id, user_id)
+    message_id, chat_id = await get_group_message_info(data, group_id, user_id)
     
     if message_id and chat_id:
         # Try to edit existing main message
@@ -185,7 +193,7 @@ async def help_command(update, context):
                     reply_markup=keyboard,
                     parse_mode="Markdown"
                 )
-                set_group_message_info(data, group_id, user_id, sent_message.message_id, sent_message.chat_id)
+                await set_group_message_info(data, group_id, user_id, sent_message.message_id, sent_message.chat_id)
                 await save_data(data, context)
     else:
         # No existing main message, create new one
@@ -194,7 +202,7 @@ async def help_command(update, context):
             reply_markup=keyboard,
             parse_mode="Markdown"
         )
-        set_group_message_info(data, group_id, user_id, sent_message.message_id, sent_message.chat_id)
+        await set_group_message_info(data, group_id, user_id, sent_message.message_id, sent_message.chat_id)
         await save_data(data, context)
     
     # Delete the user's command message for clean chat
@@ -212,19 +220,18 @@ async def button_handler(update, context):
     context.user_data['user_id'] = user_id  # Store user_id for utility functions
     
     # Use optimized data loading
-    data = load_user_data(user_id)
+    data = await load_user_data(user_id)
     if not data:
         # Fallback to create personal group if needed
-        data = load_data()
-        group_id = find_group_for_user(data, user_id)
+        group_id = await find_group_for_user(data, user_id)
         if not group_id:
-            group_id = create_personal_group(data, user_id)
+            group_id = await create_personal_group(data, user_id)
             await save_data(data, context)
             # Reload user data after creating group
-            data = load_user_data(user_id)
+            data = await load_user_data(user_id)
     
     if not data:
-        language = get_language(user_id)
+        language = await get_language(user_id)
         error_msg = t("error_create_group", language)
         if hasattr(update, 'message') and update.message:
             await update.message.reply_text(error_msg)
@@ -238,7 +245,7 @@ async def button_handler(update, context):
     # Store the current message ID for this interaction (only for this session)
     context.user_data['main_message_id'] = query.message.message_id
     context.user_data['chat_id'] = query.message.chat.id
-    set_group_message_info(data, group_id, user_id, query.message.message_id, query.message.chat.id)
+    await set_group_message_info(data, group_id, user_id, query.message.message_id, query.message.chat.id)
     
     action = query.data
     
@@ -246,7 +253,7 @@ async def button_handler(update, context):
         # Refresh main message using optimized function
         # Clear conversation state when returning to main
         context.user_data.pop('conversation_state', None)
-        message_text, keyboard = get_main_message_content_for_user(user_id)
+        message_text, keyboard = await get_main_message_content_for_user(user_id)
         try:
             await query.edit_message_text(
                 text=message_text,
@@ -276,6 +283,10 @@ async def button_handler(update, context):
         # Cancel bottle deletion
         return await cancel_delete_bottle(update, context)
 
+    elif action == "undo_delete":
+        # Restore the last deleted bottle
+        return await undo_delete_bottle(update, context)
+
     elif action == "add_poop":
         # Start add poop flow
         context.user_data['action'] = 'add_poop'
@@ -385,7 +396,7 @@ async def button_handler(update, context):
     else:
         # Unknown action
         print(f"Unknown action: {action}")
-        language = get_language(user_id)
+        language = await get_language(user_id)
         await query.edit_message_text(t("error_unknown_action", language))
 
 async def error_handler(update, context):
@@ -399,14 +410,14 @@ async def error_handler(update, context):
     try:
         if update and update.effective_user:
             user_id = update.effective_user.id
-            language = get_language(user_id)
+            language = await get_language(user_id)
             # Try to get user data to show error in main message
             try:
-                data = load_user_data(user_id)
+                data = await load_user_data(user_id)
                 if data:
-                    group_id = find_group_for_user(data, user_id)
+                    group_id = await find_group_for_user(data, user_id)
                     if group_id:
-                        message_id, chat_id = get_group_message_info(data, group_id, user_id)
+                        message_id, chat_id = await get_group_message_info(data, group_id, user_id)
                         
                         if message_id and chat_id:
                             # Try to edit the main message with error
@@ -434,11 +445,25 @@ async def error_handler(update, context):
                 print(f"Failed to edit main message with error: {edit_error}")
             
             # Fallback: send new error message
-            language = get_language(user_id)
+            language = await get_language(user_id)
         await update.effective_message.reply_text(t("error_general", language) + " " + str(context.error))
     except Exception as e:
         print(f"Failed to send error message: {e}")
 
+async def shutdown_database(app):
+    """Stop backups and the database executor, then close pooled connections on shutdown"""
+    stop_backup_scheduler()
+    stop_tombstone_compactor()
+    stop_archiver()
+    # Queued writes still need the executor to commit
+    await close_write_queue()
+    shutdown_executor()
+    # Writes the message locations changed since the last flush
+    stop_message_location_flusher()
+    # Logs the final per-statement summary
+    stop_query_stats_reporter()
+    close_db_connection()
+
 async def set_commands(app):
     commands = [
         BotCommand("start", "Démarrer le bot"),
@@ -446,6 +471,11 @@ async def set_commands(app):
     ]
     await app.bot.set_my_commands(commands)
 
+async def post_init(app):
+    await set_commands(app)
+    # Dashboard edits that failed on a network error are retried by this task
+    await start_outbox_worker(app)
+
 async def handle_text_input(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Handle text input for non-conversation cases"""
     # Check if update and user are valid
@@ -458,13 +488,11 @@ async def handle_text_input(update: Update, context: ContextTypes.DEFAULT_TYPE):
     context.user_data['user_id'] = user_id  # Store user_id for utility functions
     
     # Use optimized data loading
-    data = load_user_data(user_id)
-    if not data:
-        data = load_data()
-    language = get_language(user_id)
-    group_id = find_group_for_user(data, user_id)
+    data = await load_user_data(user_id)
+    language = await get_language(user_id)
+    group_id = await find_group_for_user(data, user_id)
     if not group_id:
-        group_id = create_personal_group(data, user_id)
+        group_id = await create_personal_group(data, user_id)
         await save_data(data, context)
     if not group_id or group_id not in data:
         error_msg = t("error_create_group", language)
@@ -506,7 +534,7 @@ async def handle_text_input(update: Update, context: ContextTypes.DEFAULT_TYPE):
         return
     
     # For text input, we need to get the stored message ID from the group data
-    message_id, chat_id = get_group_message_info(data, group_id, user_id)
+    message_id, chat_id = await get_group_message_info(data, group_id, user_id)
     if message_id and chat_id:
         context.user_data['main_message_id'] = message_id
         context.user_data['chat_id'] = chat_id
@@ -539,7 +567,7 @@ async def handle_text_input(update: Update, context: ContextTypes.DEFAULT_TYPE):
     elif state == 'group_rename':
         # Handle group rename text input
         from handlers.groups import rename_group
-        current_group = find_group_for_user(data, user_id)
+        current_group = await find_group_for_user(data, user_id)
         if current_group:
             await rename_group(update, context, current_group, text)
     
@@ -602,8 +630,40 @@ def main():
         print("❌ No bot token found. Please set TELEGRAM_TOKEN or TEST_TOKEN in your .env file")
         return
     
+    # Check the effective SQLite settings (WAL, synchronous, cache...) before serving updates
+    log_connection_settings()
+    
+    # Create or upgrade the schema before serving updates
+    if not run_migrations():
+        print("❌ Database migrations failed, not starting the bot")
+        return
+    
+    # Language lookups then cost no database round trip for known users
+    if LANGUAGE_CACHE_WARMUP:
+        print(f"Language cache warmed with {warm_language_cache()} users")
+    
+    # Online backups run on their own thread, off the request path
+    start_backup_scheduler()
+    
+    # Main-message locations are re-saved in memory and written by this thread
+    start_message_location_flusher()
+    
+    # Deleted bottles stay undoable for a while, then get purged off the request path
+    start_tombstone_compactor()
+    
+    # Rows past HOT_RETENTION_DAYS move to the archive database off the request path
+    start_archiver()
+    
+    # Slow queries are logged as they happen; the per-statement summary periodically
+    if DB_QUERY_STATS:
+        start_query_stats_reporter()
+    
     # Create application
-    application = ApplicationBuilder().token(token).post_init(set_commands).build()
+    # Every Bot API call goes through the rate limiter (Telegram's global, per-chat and group limits)
+    application = (
+        ApplicationBuilder().token(token).rate_limiter(TelegramRateLimiter())
+        .post_init(post_init).post_stop(stop_outbox_worker).post_shutdown(shutdown_database).build()
+    )
     
     # Add command handlers
     application.add_handler(CommandHandler("start", start))
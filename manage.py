@@ -0,0 +1,36 @@
+"""Maintenance commands for the bot database.
+
+Usage:
+    python manage.py migrate
+    python manage.py rebuild-rollups [--group GROUP_ID]
+"""
+import argparse
+import sys
+
+from migrations import run_migrations
+from database import rebuild_daily_rollups, close_db_connection
+
+def cmd_migrate(args) -> bool:
+    return run_migrations()
+
+def cmd_rebuild_rollups(args) -> bool:
+    return rebuild_daily_rollups(args.group)
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Baby bottle tracker database maintenance")
+    subcommands = parser.add_subparsers(dest="command", required=True)
+
+    subcommands.add_parser("migrate", help="apply pending schema migrations").set_defaults(func=cmd_migrate)
+
+    rebuild = subcommands.add_parser("rebuild-rollups", help="recompute daily_rollups from entries and poop")
+    rebuild.add_argument("--group", type=int, default=None, help="only this group id (default: all groups)")
+    rebuild.set_defaults(func=cmd_rebuild_rollups)
+
+    args = parser.parse_args(argv)
+    try:
+        return 0 if args.func(args) else 1
+    finally:
+        close_db_connection()
+
+if __name__ == "__main__":
+    sys.exit(main())
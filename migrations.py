@@ -0,0 +1,284 @@
+import time
+from typing import Callable, List, Tuple
+from config import (
+    GROUPS_TABLE, ENTRIES_TABLE, POOP_TABLE, USER_MESSAGES_TABLE, LANGUAGES_TABLE, GROUP_MEMBERS_TABLE,
+    SCHEMA_VERSION_TABLE, DAILY_ROLLUPS_TABLE, OUTBOX_TABLE
+)
+from database import _writer, _parse_users, _rebuild_rollups, to_epoch
+
+# Schema migrations, applied in order at startup.
+# Each step must be idempotent: databases created by the old docker-compose
+# bootstrap already have some of these tables but no schema_version rows.
+
+def _base_schema(cursor):
+    """Tables and indexes previously created by the docker-compose database service"""
+    cursor.execute(f"""
+        CREATE TABLE IF NOT EXISTS {GROUPS_TABLE} (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            name TEXT NOT NULL,
+            users TEXT,
+            time_difference INTEGER DEFAULT 0,
+            last_bottle INTEGER DEFAULT 0,
+            bottles_to_show INTEGER DEFAULT 5,
+            poops_to_show INTEGER DEFAULT 1,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    """)
+    cursor.execute(f"""
+        CREATE TABLE IF NOT EXISTS {ENTRIES_TABLE} (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            group_id INTEGER NOT NULL,
+            amount INTEGER NOT NULL,
+            time TIMESTAMP NOT NULL,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            FOREIGN KEY (group_id) REFERENCES {GROUPS_TABLE} (id)
+        )
+    """)
+    cursor.execute(f"""
+        CREATE TABLE IF NOT EXISTS {POOP_TABLE} (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            group_id INTEGER NOT NULL,
+            time TIMESTAMP NOT NULL,
+            info TEXT,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            FOREIGN KEY (group_id) REFERENCES {GROUPS_TABLE} (id)
+        )
+    """)
+    cursor.execute(f"""
+        CREATE TABLE IF NOT EXISTS {USER_MESSAGES_TABLE} (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            group_id INTEGER NOT NULL,
+            user_id INTEGER NOT NULL,
+            main_message_id INTEGER,
+            main_chat_id INTEGER,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            FOREIGN KEY (group_id) REFERENCES {GROUPS_TABLE} (id)
+        )
+    """)
+    cursor.execute(f"""
+        CREATE TABLE IF NOT EXISTS {LANGUAGES_TABLE} (
+            user_id INTEGER PRIMARY KEY,
+            language TEXT NOT NULL
+        )
+    """)
+    cursor.execute(f"CREATE INDEX IF NOT EXISTS idx_entries_group_time ON {ENTRIES_TABLE}(group_id, time)")
+    cursor.execute(f"CREATE INDEX IF NOT EXISTS idx_poop_group_time ON {POOP_TABLE}(group_id, time)")
+    cursor.execute(f"CREATE INDEX IF NOT EXISTS idx_user_messages_group_user ON {USER_MESSAGES_TABLE}(group_id, user_id)")
+
+def _group_members(cursor):
+    """Indexed user -> group membership table, backfilled from the legacy users JSON column"""
+    cursor.execute(f"""
+        CREATE TABLE IF NOT EXISTS {GROUP_MEMBERS_TABLE} (
+            user_id INTEGER NOT NULL,
+            group_id INTEGER NOT NULL,
+            joined_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            PRIMARY KEY (group_id, user_id),
+            FOREIGN KEY (group_id) REFERENCES {GROUPS_TABLE} (id)
+        )
+    """)
+    cursor.execute(f"CREATE INDEX IF NOT EXISTS idx_group_members_user ON {GROUP_MEMBERS_TABLE}(user_id)")
+
+    # INSERT OR IGNORE keeps the backfill idempotent
+    cursor.execute(f"SELECT id, users, created_at FROM {GROUPS_TABLE}")
+    backfilled = 0
+    for row in cursor.fetchall():
+        for user_id in _parse_users(row['users']):
+            cursor.execute(f"""
+                INSERT OR IGNORE INTO {GROUP_MEMBERS_TABLE} (user_id, group_id, joined_at)
+                VALUES (?, ?, COALESCE(?, CURRENT_TIMESTAMP))
+            """, (user_id, row['id'], row['created_at']))
+            backfilled += cursor.rowcount
+    if backfilled > 0:
+        print(f"Backfilled {backfilled} group memberships")
+
+def _integer_timestamps(cursor):
+    """Integer epoch-seconds ts column on entries/poop, backfilled and indexed by (group_id, ts)"""
+    for table in (ENTRIES_TABLE, POOP_TABLE):
+        columns = [row['name'] for row in cursor.execute(f"PRAGMA table_info({table})")]
+        if 'ts' not in columns:
+            cursor.execute(f"ALTER TABLE {table} ADD COLUMN ts INTEGER")
+
+        # Unparseable times stay NULL and keep falling back to parse_time on read
+        cursor.execute(f"SELECT id, time FROM {table} WHERE ts IS NULL")
+        updates = [(to_epoch(row['time']), row['id']) for row in cursor.fetchall()]
+        updates = [update for update in updates if update[0] is not None]
+        cursor.executemany(f"UPDATE {table} SET ts = ? WHERE id = ?", updates)
+        if updates:
+            print(f"Backfilled ts for {len(updates)} rows in {table}")
+
+        cursor.execute(f"CREATE INDEX IF NOT EXISTS idx_{table}_group_ts ON {table}(group_id, ts)")
+        # Reads and cleanup no longer touch the ISO time column
+        cursor.execute(f"DROP INDEX IF EXISTS idx_{table}_group_time")
+
+def _daily_rollups(cursor):
+    """Per group and local day totals, maintained by the write functions; backfilled from history"""
+    cursor.execute(f"""
+        CREATE TABLE IF NOT EXISTS {DAILY_ROLLUPS_TABLE} (
+            group_id INTEGER NOT NULL,
+            local_date TEXT NOT NULL,
+            bottle_count INTEGER NOT NULL DEFAULT 0,
+            total_ml INTEGER NOT NULL DEFAULT 0,
+            poop_count INTEGER NOT NULL DEFAULT 0,
+            PRIMARY KEY (group_id, local_date)
+        ) WITHOUT ROWID
+    """)
+    count = _rebuild_rollups(cursor)
+    if count:
+        print(f"Backfilled {count} daily rollups")
+
+def _unique_group_names(cursor):
+    """Case-insensitive UNIQUE index on groups.name; later duplicates get their id appended first"""
+    # Same comparison as the index (NOCASE), so exactly the rows that would violate it
+    cursor.execute(f"""
+        SELECT id, name FROM {GROUPS_TABLE} g
+        WHERE EXISTS (
+            SELECT 1 FROM {GROUPS_TABLE} earlier
+            WHERE earlier.name = g.name COLLATE NOCASE AND earlier.id < g.id
+        )
+        ORDER BY id
+    """)
+    for row in cursor.fetchall():
+        new_name = f"{row['name']}-{row['id']}"
+        while cursor.execute(f"SELECT 1 FROM {GROUPS_TABLE} WHERE name = ? COLLATE NOCASE",
+                             (new_name,)).fetchone():
+            new_name += "-"
+        cursor.execute(f"UPDATE {GROUPS_TABLE} SET name = ? WHERE id = ?", (new_name, row['id']))
+        print(f"Renamed duplicate group {row['id']}: {row['name']!r} -> {new_name!r}")
+
+    cursor.execute(f"CREATE UNIQUE INDEX IF NOT EXISTS idx_groups_name_nocase ON {GROUPS_TABLE}(name COLLATE NOCASE)")
+
+def _unique_user_messages(cursor):
+    """One row per (group_id, user_id), enforced, so message locations can be UPSERTed"""
+    # Keep the newest row of any duplicates left by the old SELECT-then-INSERT
+    cursor.execute(f"""
+        DELETE FROM {USER_MESSAGES_TABLE}
+        WHERE id NOT IN (SELECT MAX(id) FROM {USER_MESSAGES_TABLE} GROUP BY group_id, user_id)
+    """)
+    cursor.execute("DROP INDEX IF EXISTS idx_user_messages_group_user")
+    cursor.execute(f"CREATE UNIQUE INDEX idx_user_messages_group_user ON {USER_MESSAGES_TABLE}(group_id, user_id)")
+
+def _idempotency_keys(cursor):
+    """Optional idempotency_key on entries/poop, unique when set, so a retried write is a no-op"""
+    for table in (ENTRIES_TABLE, POOP_TABLE):
+        columns = [row['name'] for row in cursor.execute(f"PRAGMA table_info({table})")]
+        if 'idempotency_key' not in columns:
+            cursor.execute(f"ALTER TABLE {table} ADD COLUMN idempotency_key TEXT")
+        # Partial: rows written without a key (history, maintenance) stay out of the index
+        cursor.execute(f"""
+            CREATE UNIQUE INDEX IF NOT EXISTS idx_{table}_idempotency
+            ON {table}(idempotency_key) WHERE idempotency_key IS NOT NULL
+        """)
+
+def _group_idempotency_keys(cursor):
+    """Idempotency keys are unique per group: another group's key can never swallow a write"""
+    for table in (ENTRIES_TABLE, POOP_TABLE):
+        cursor.execute(f"""
+            CREATE UNIQUE INDEX IF NOT EXISTS idx_{table}_group_idempotency
+            ON {table}(group_id, idempotency_key) WHERE idempotency_key IS NOT NULL
+        """)
+        cursor.execute(f"DROP INDEX IF EXISTS idx_{table}_idempotency")
+
+def _entry_tombstones(cursor):
+    """deleted_at (epoch seconds) on entries: deleting a bottle tombstones it, the compactor purges it later"""
+    columns = [row['name'] for row in cursor.execute(f"PRAGMA table_info({ENTRIES_TABLE})")]
+    if 'deleted_at' not in columns:
+        cursor.execute(f"ALTER TABLE {ENTRIES_TABLE} ADD COLUMN deleted_at INTEGER")
+    # Hot reads only look at live rows: the (group_id, ts) index leaves tombstones out
+    cursor.execute(f"""
+        CREATE INDEX IF NOT EXISTS idx_{ENTRIES_TABLE}_live_group_ts
+        ON {ENTRIES_TABLE}(group_id, ts) WHERE deleted_at IS NULL
+    """)
+    cursor.execute(f"DROP INDEX IF EXISTS idx_{ENTRIES_TABLE}_group_ts")
+    # Tombstones only (a handful of rows): last deleted of a group for undo, oldest for the compactor
+    cursor.execute(f"""
+        CREATE INDEX IF NOT EXISTS idx_{ENTRIES_TABLE}_tombstones_group
+        ON {ENTRIES_TABLE}(group_id, deleted_at) WHERE deleted_at IS NOT NULL
+    """)
+    cursor.execute(f"""
+        CREATE INDEX IF NOT EXISTS idx_{ENTRIES_TABLE}_tombstones
+        ON {ENTRIES_TABLE}(deleted_at) WHERE deleted_at IS NOT NULL
+    """)
+
+def _edit_outbox(cursor):
+    """Dashboard edits waiting for a retry: one row per message, holding its latest content"""
+    cursor.execute(f"""
+        CREATE TABLE IF NOT EXISTS {OUTBOX_TABLE} (
+            chat_id INTEGER NOT NULL,
+            message_id INTEGER NOT NULL,
+            group_id INTEGER NOT NULL,
+            user_id INTEGER NOT NULL,
+            text TEXT NOT NULL,
+            reply_markup TEXT,
+            parse_mode TEXT,
+            version INTEGER NOT NULL DEFAULT 1,
+            attempts INTEGER NOT NULL DEFAULT 1,
+            next_attempt_at REAL NOT NULL,
+            last_error TEXT,
+            created_at REAL NOT NULL,
+            PRIMARY KEY (chat_id, message_id)
+        )
+    """)
+    cursor.execute(f"CREATE INDEX IF NOT EXISTS idx_{OUTBOX_TABLE}_next ON {OUTBOX_TABLE}(next_attempt_at)")
+
+def _archive_ts_indexes(cursor):
+    """archive_old_data picks the oldest rows across all groups: (group_id, ts) cannot serve that"""
+    for table in (ENTRIES_TABLE, POOP_TABLE):
+        cursor.execute(f"CREATE INDEX IF NOT EXISTS idx_{table}_ts ON {table}(ts)")
+
+# (version, description, step) - append new steps at the end, never reorder or edit applied ones
+MIGRATIONS: List[Tuple[int, str, Callable]] = [
+    (1, "base schema", _base_schema),
+    (2, "group_members table", _group_members),
+    (3, "integer timestamps on entries and poop", _integer_timestamps),
+    (4, "daily rollups", _daily_rollups),
+    (5, "unique case-insensitive group names", _unique_group_names),
+    (6, "ts indexes for archiving", _archive_ts_indexes),
+    (7, "unique user_messages (group_id, user_id)", _unique_user_messages),
+    (8, "idempotency keys on entries and poop", _idempotency_keys),
+    (9, "tombstones on entries", _entry_tombstones),
+    (10, "outbox of failed dashboard edits", _edit_outbox),
+    (11, "idempotency keys unique per group", _group_idempotency_keys),
+]
+
+def get_schema_version() -> int:
+    """Return the highest applied migration version (0 for a fresh database)"""
+    with _writer() as conn:
+        conn.execute(f"""
+            CREATE TABLE IF NOT EXISTS {SCHEMA_VERSION_TABLE} (
+                version INTEGER PRIMARY KEY,
+                description TEXT NOT NULL,
+                applied_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                duration_ms REAL
+            )
+        """)
+        row = conn.execute(f"SELECT MAX(version) AS version FROM {SCHEMA_VERSION_TABLE}").fetchone()
+        return row['version'] or 0
+
+def run_migrations() -> bool:
+    """Apply every pending migration, each in its own transaction"""
+    try:
+        current = get_schema_version()
+        pending = [migration for migration in MIGRATIONS if migration[0] > current]
+        if not pending:
+            print(f"Database schema is up to date (version {current})")
+            return True
+
+        for version, description, step in pending:
+            started = time.perf_counter()
+            with _writer() as conn:
+                # Explicit BEGIN so DDL is part of the transaction too (sqlite3 only
+                # opens one implicitly before DML); the writer commits on exit
+                conn.execute("BEGIN")
+                cursor = conn.cursor()
+                step(cursor)
+                duration_ms = (time.perf_counter() - started) * 1000
+                cursor.execute(f"""
+                    INSERT INTO {SCHEMA_VERSION_TABLE} (version, description, duration_ms)
+                    VALUES (?, ?, ?)
+                """, (version, description, duration_ms))
+            print(f"Applied migration {version} ({description}) in {duration_ms:.1f} ms")
+
+        return True
+    except Exception as e:
+        print(f"Error running migrations: {e}")
+        return False
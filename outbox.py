@@ -0,0 +1,136 @@
+import asyncio
+import json
+import random
+from typing import Any, Dict, Optional
+
+from telegram import InlineKeyboardMarkup
+from telegram.error import BadRequest, NetworkError, RetryAfter
+
+import database
+from config import (
+    OUTBOX_POLL_SECONDS, OUTBOX_BASE_DELAY_SECONDS, OUTBOX_MAX_DELAY_SECONDS, OUTBOX_MAX_ATTEMPTS, OUTBOX_BATCH_SIZE
+)
+from database_async import (
+    enqueue_outbox_edit, get_due_outbox_edits, retry_outbox_edit, remove_outbox_edit, get_outbox_depth,
+    load_outbox_keys, clear_user_message_info
+)
+from rate_limiter import PRIORITY_FANOUT, content_hash
+
+# Durable retries of dashboard edits: a fan-out edit that fails on a transient
+# error (network, timeout, rate limit after the limiter's own retries) is queued
+# in the outbox table, one row per message holding its latest content. A worker
+# task on the bot's event loop sends the due ones, backing off exponentially
+# (with jitter) after each failure.
+
+_worker: Optional[asyncio.Task] = None
+_stats = {'queued': 0, 'delivered': 0, 'retried': 0, 'dropped': 0}
+
+def is_transient(error: Exception) -> bool:
+    """Errors worth retrying later (BadRequest is a NetworkError too, but retrying it is pointless)"""
+    return isinstance(error, (NetworkError, RetryAfter)) and not isinstance(error, BadRequest)
+
+def backoff_delay(attempts: int) -> float:
+    """Seconds before the next attempt after attempts failed ones: doubling, capped, jittered"""
+    delay = min(OUTBOX_MAX_DELAY_SECONDS, OUTBOX_BASE_DELAY_SECONDS * 2 ** max(0, attempts - 1))
+    return random.uniform(delay / 2, delay)
+
+async def queue_failed_edit(group_id: int, user_id: int, chat_id: int, message_id: int, text: str,
+                            keyboard, parse_mode: Optional[str], error: Exception) -> bool:
+    """Queue an edit that failed on a transient error for the worker to retry"""
+    reply_markup = keyboard.to_json() if keyboard is not None else None
+    queued = await enqueue_outbox_edit(group_id, user_id, chat_id, message_id, text, reply_markup, parse_mode,
+                                       str(error), backoff_delay(1))
+    if queued:
+        _stats['queued'] += 1
+        print(f"📮 Edit of user {user_id}'s dashboard in group {group_id} queued for retry ({error})")
+    return queued
+
+async def _deliver(bot, row: Dict) -> str:
+    """Send one queued edit and settle its row; returns the outcome"""
+    chat_id, message_id = row['chat_id'], row['message_id']
+    keyboard = InlineKeyboardMarkup.de_json(json.loads(row['reply_markup']), bot) if row['reply_markup'] else None
+    try:
+        await bot.edit_message_text(
+            text=row['text'],
+            chat_id=chat_id,
+            message_id=message_id,
+            reply_markup=keyboard,
+            parse_mode=row['parse_mode'],
+            rate_limit_args={"priority": PRIORITY_FANOUT,
+                             "content_hash": content_hash(row['text'], keyboard, row['parse_mode'])}
+        )
+        outcome = "delivered"
+    except Exception as e:
+        error_msg = str(e)
+        if "Message is not modified" in error_msg:
+            outcome = "delivered"
+        elif "message to edit not found" in error_msg:
+            await clear_user_message_info(row['group_id'], row['user_id'])
+            outcome = "dropped"
+        elif is_transient(e) and row['attempts'] < OUTBOX_MAX_ATTEMPTS:
+            attempts = row['attempts'] + 1
+            await retry_outbox_edit(chat_id, message_id, attempts, backoff_delay(attempts), error_msg)
+            print(f"⏳ Retry {attempts} of user {row['user_id']}'s dashboard in group {row['group_id']} failed: {e}")
+            _stats['retried'] += 1
+            return "retried"
+        else:
+            print(f"❌ Giving up on user {row['user_id']}'s dashboard in group {row['group_id']} "
+                  f"after {row['attempts']} attempts: {e}")
+            outcome = "dropped"
+    # A newer version queued meanwhile stays for the next round
+    await remove_outbox_edit(chat_id, message_id, row['version'])
+    _stats[outcome] += 1
+    return outcome
+
+async def process_outbox(bot) -> int:
+    """Send the due edits (up to OUTBOX_BATCH_SIZE); returns how many were attempted"""
+    from utils import group_fanout_lock
+    rows = await get_due_outbox_edits(OUTBOX_BATCH_SIZE)
+    attempted = 0
+    for row in rows:
+        # Serialized with the group's fan-outs, so a retry never lands after a newer dashboard
+        async with group_fanout_lock(row['group_id']):
+            # Delivered or replaced by a fan-out while this one waited
+            if not database.has_outbox_edit(row['chat_id'], row['message_id'], row['version']):
+                continue
+            await _deliver(bot, row)
+            attempted += 1
+    if attempted:
+        print(f"📮 Outbox: {await get_outbox_stats()}")
+    return attempted
+
+async def get_outbox_stats() -> Dict[str, Any]:
+    """Edits queued, delivered, retried and dropped since startup, and the queue depth (pending, due, oldest_s, max_attempts)"""
+    return {**_stats, **(await get_outbox_depth())}
+
+async def _run(bot):
+    while True:
+        try:
+            await process_outbox(bot)
+        except Exception as e:
+            print(f"Error processing the edit outbox: {e}")
+        await asyncio.sleep(OUTBOX_POLL_SECONDS)
+
+async def start_outbox_worker(application):
+    """Start the worker on the running loop (post_init); edits left from a previous run are retried"""
+    global _worker
+    if _worker is not None and not _worker.done():
+        return
+    pending = await load_outbox_keys()
+    if pending:
+        print(f"📮 {pending} dashboard edits waiting in the outbox")
+    # Not application.create_task: Application.stop() would wait for it forever
+    _worker = asyncio.get_running_loop().create_task(_run(application.bot), name="edit-outbox")
+
+async def stop_outbox_worker(application=None):
+    """Stop the worker (post_stop); queued edits stay in the table for the next run"""
+    global _worker
+    if _worker is None:
+        return
+    _worker.cancel()
+    try:
+        await _worker
+    except asyncio.CancelledError:
+        pass
+    _worker = None
+    print(f"📮 Outbox: {await get_outbox_stats()}")
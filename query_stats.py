@@ -0,0 +1,283 @@
+import functools
+import re
+import sqlite3
+import threading
+from bisect import bisect_left
+from time import perf_counter
+from typing import Any, Dict, List, Optional, Sequence
+from config import DB_SLOW_QUERY_MS, DB_QUERY_STATS_LOG_MINUTES
+
+# Upper bounds (ms) of the latency histogram buckets; the last bucket is unbounded
+LATENCY_BUCKETS_MS = (0.1, 0.25, 0.5, 1, 2.5, 5, 10, 25, 50, 100, 250, 500, 1000)
+# Distinct statements tracked; anything past this is counted under OVERFLOW_FINGERPRINT
+MAX_FINGERPRINTS = 1000
+OVERFLOW_FINGERPRINT = "<other statements>"
+
+_COMMENT_RE = re.compile(r"--[^\n]*|/\*.*?\*/", re.S)
+_STRING_RE = re.compile(r"'(?:[^']|'')*'")
+_NUMBER_RE = re.compile(r"\b\d+(?:\.\d+)?\b")
+_IN_LIST_RE = re.compile(r"\bIN \(\?(?:, ?\?)+\)", re.I)
+_SPACE_RE = re.compile(r"\s+")
+# Only these have a meaningful plan; explaining DDL after it ran can even fail (duplicate column...)
+_EXPLAINABLE = ("SELECT", "WITH", "INSERT", "UPDATE", "DELETE", "REPLACE")
+
+@functools.lru_cache(maxsize=2048)
+def fingerprint(sql: str) -> str:
+    """Normalize a statement so calls that only differ by literals or layout share one entry"""
+    normalized = _COMMENT_RE.sub(" ", sql)
+    normalized = _STRING_RE.sub("?", normalized)
+    # \b keeps digits inside identifiers (archive.entries_202401) intact
+    normalized = _NUMBER_RE.sub("?", normalized)
+    normalized = _SPACE_RE.sub(" ", normalized).strip()
+    # Variable-length IN lists share one entry
+    return _IN_LIST_RE.sub("IN (?+)", normalized)
+
+class _Statement:
+    __slots__ = ("calls", "errors", "rows", "total", "max", "buckets")
+
+    def __init__(self):
+        self.calls = 0
+        self.errors = 0
+        self.rows = 0
+        self.total = 0.0
+        self.max = 0.0
+        self.buckets = [0] * (len(LATENCY_BUCKETS_MS) + 1)
+
+_stats: Dict[str, _Statement] = {}
+_stats_lock = threading.Lock()
+
+def record(sql: str, seconds: float, rows: int, error: bool = False):
+    """Add one execution of sql to the per-fingerprint counters"""
+    key = fingerprint(sql)
+    ms = seconds * 1000
+    bucket = bisect_left(LATENCY_BUCKETS_MS, ms)
+    with _stats_lock:
+        stat = _stats.get(key)
+        if stat is None:
+            if len(_stats) >= MAX_FINGERPRINTS:
+                key = OVERFLOW_FINGERPRINT
+            stat = _stats.setdefault(key, _Statement())
+        stat.calls += 1
+        stat.errors += error
+        stat.rows += rows
+        stat.total += ms
+        if ms > stat.max:
+            stat.max = ms
+        stat.buckets[bucket] += 1
+
+def _percentile(buckets: List[int], calls: int, fraction: float) -> float:
+    """Upper bound of the histogram bucket holding the given fraction of calls"""
+    threshold = calls * fraction
+    seen = 0
+    for index, count in enumerate(buckets):
+        seen += count
+        if seen >= threshold:
+            return LATENCY_BUCKETS_MS[index] if index < len(LATENCY_BUCKETS_MS) else float("inf")
+    return float("inf")
+
+def get_query_stats(sort_by: str = "total_ms", limit: Optional[int] = None) -> List[Dict[str, Any]]:
+    """Per-statement summary (calls, rows, latency and histogram), most expensive first"""
+    with _stats_lock:
+        snapshot = [(key, stat.calls, stat.errors, stat.rows, stat.total, stat.max, list(stat.buckets))
+                    for key, stat in _stats.items()]
+    summary = []
+    for key, calls, errors, rows, total, max_ms, buckets in snapshot:
+        summary.append({
+            'fingerprint': key,
+            'calls': calls,
+            'errors': errors,
+            'rows': rows,
+            'rows_per_call': round(rows / calls, 1) if calls else 0.0,
+            'total_ms': round(total, 3),
+            'mean_ms': round(total / calls, 3) if calls else 0.0,
+            'max_ms': round(max_ms, 3),
+            'p50_ms': _percentile(buckets, calls, 0.50),
+            'p95_ms': _percentile(buckets, calls, 0.95),
+            'p99_ms': _percentile(buckets, calls, 0.99),
+            'histogram': dict(zip([f"<={bound}ms" for bound in LATENCY_BUCKETS_MS] + ["inf"], buckets)),
+        })
+    summary.sort(key=lambda item: item[sort_by], reverse=True)
+    return summary[:limit] if limit else summary
+
+def format_query_stats(limit: int = 15, sort_by: str = "total_ms") -> str:
+    """Human readable table of get_query_stats, for logs"""
+    lines = [f"{'calls':>8} {'total ms':>10} {'mean ms':>8} {'p95 ms':>7} {'max ms':>8} {'rows/call':>9}  statement"]
+    for item in get_query_stats(sort_by, limit):
+        statement = item['fingerprint'] if len(item['fingerprint']) <= 120 else item['fingerprint'][:117] + "..."
+        lines.append(f"{item['calls']:>8} {item['total_ms']:>10.1f} {item['mean_ms']:>8.3f} {item['p95_ms']:>7} "
+                     f"{item['max_ms']:>8.2f} {item['rows_per_call']:>9}  {statement}")
+    return "\n".join(lines)
+
+def reset_query_stats():
+    with _stats_lock:
+        _stats.clear()
+
+def _explain(conn: sqlite3.Connection, sql: str, parameters) -> List[str]:
+    """EXPLAIN QUERY PLAN of a statement, one line per plan step"""
+    if parameters is None:
+        # executemany: the plan does not depend on the values, bind NULLs
+        parameters = (None,) * sql.count("?")
+    # Base class execute: a plain cursor, so the EXPLAIN itself is not recorded
+    rows = sqlite3.Connection.execute(conn, "EXPLAIN QUERY PLAN " + sql, parameters).fetchall()
+    return [row[3] for row in rows]
+
+def _log_slow_query(conn: sqlite3.Connection, sql: str, parameters, ms: float, rows: int):
+    plan = "(no plan)"
+    if sql.lstrip().upper().startswith(_EXPLAINABLE):
+        try:
+            plan = "\n    ".join(_explain(conn, sql, parameters)) or plan
+        except Exception as e:
+            plan = f"(unavailable: {e})"
+    print(f"🐢 Slow query ({ms:.1f} ms, {rows} rows): {fingerprint(sql)}\n    {plan}")
+
+# Unbound base methods: the wrappers below run on every statement, skip super() lookups
+_execute, _executemany = sqlite3.Cursor.execute, sqlite3.Cursor.executemany
+_fetchone, _fetchmany, _fetchall, _next = (sqlite3.Cursor.fetchone, sqlite3.Cursor.fetchmany,
+                                           sqlite3.Cursor.fetchall, sqlite3.Cursor.__next__)
+
+class InstrumentedCursor(sqlite3.Cursor):
+    """Cursor recording each statement's latency and row count.
+
+    A SELECT is timed until its rows are consumed (fetchall, fetchone/iteration
+    hitting the end, the next execute, close, or the cursor being dropped), so the
+    latency includes the stepping SQLite does while rows are fetched.
+    """
+    _sql = None
+
+    def _finish(self, error: bool = False):
+        sql = self._sql
+        if sql is None:
+            return
+        self._sql = None
+        record(sql, self._elapsed, self._rows, error)
+        if self._elapsed * 1000 >= DB_SLOW_QUERY_MS and not error:
+            _log_slow_query(self.connection, sql, self._parameters, self._elapsed * 1000, self._rows)
+
+    def _run(self, method, sql: str, parameters, explain_parameters):
+        if self._sql is not None:
+            self._finish()
+        started = perf_counter()
+        try:
+            method(self, sql, parameters)
+        except Exception:
+            self._sql, self._elapsed, self._rows = sql, perf_counter() - started, 0
+            self._finish(error=True)
+            raise
+        self._elapsed = perf_counter() - started
+        self._sql = sql
+        self._parameters = explain_parameters
+        if self.description is None:
+            # No result set (DML, DDL, PRAGMA without output): done already
+            self._rows = max(self.rowcount, 0)
+            self._finish()
+        else:
+            self._rows = 0
+        return self
+
+    def execute(self, sql: str, parameters: Sequence = ()):
+        return self._run(_execute, sql, parameters, parameters)
+
+    def executemany(self, sql: str, seq_of_parameters):
+        # The parameters may be a generator: EXPLAIN binds NULLs instead
+        return self._run(_executemany, sql, seq_of_parameters, None)
+
+    def fetchone(self):
+        started = perf_counter()
+        row = _fetchone(self)
+        if self._sql is not None:
+            self._elapsed += perf_counter() - started
+            if row is None:
+                self._finish()
+            else:
+                self._rows += 1
+        return row
+
+    def fetchmany(self, size: Optional[int] = None):
+        size = self.arraysize if size is None else size
+        started = perf_counter()
+        rows = _fetchmany(self, size)
+        if self._sql is not None:
+            self._elapsed += perf_counter() - started
+            self._rows += len(rows)
+            if len(rows) < size:
+                self._finish()
+        return rows
+
+    def fetchall(self):
+        started = perf_counter()
+        rows = _fetchall(self)
+        if self._sql is not None:
+            self._elapsed += perf_counter() - started
+            self._rows += len(rows)
+            self._finish()
+        return rows
+
+    def __next__(self):
+        started = perf_counter()
+        try:
+            row = _next(self)
+        except StopIteration:
+            if self._sql is not None:
+                self._elapsed += perf_counter() - started
+                self._finish()
+            raise
+        if self._sql is not None:
+            self._elapsed += perf_counter() - started
+            self._rows += 1
+        return row
+
+    def close(self):
+        self._finish()
+        super().close()
+
+    def __del__(self):
+        try:
+            self._finish()
+        except Exception:
+            pass
+
+_cursor = sqlite3.Connection.cursor
+
+class InstrumentedConnection(sqlite3.Connection):
+    """Connection whose cursors (including the execute shortcuts) are InstrumentedCursor"""
+
+    def cursor(self, factory=InstrumentedCursor):
+        return _cursor(self, factory)
+
+    def execute(self, sql: str, parameters: Sequence = ()):
+        return _cursor(self, InstrumentedCursor).execute(sql, parameters)
+
+    def executemany(self, sql: str, seq_of_parameters):
+        return _cursor(self, InstrumentedCursor).executemany(sql, seq_of_parameters)
+
+# Periodic summary in the logs
+_reporter: Optional[threading.Thread] = None
+_stop_event = threading.Event()
+
+def log_query_stats(limit: int = 15):
+    """Print the most expensive statements since startup (or the last reset)"""
+    if _stats:
+        print(f"📊 Query stats (top {limit} by total time):\n{format_query_stats(limit)}")
+
+def _report_loop(interval: float):
+    while not _stop_event.wait(interval):
+        log_query_stats()
+
+def start_query_stats_reporter():
+    """Log the query summary every DB_QUERY_STATS_LOG_MINUTES (no-op if disabled or running)"""
+    global _reporter
+    if DB_QUERY_STATS_LOG_MINUTES <= 0 or (_reporter is not None and _reporter.is_alive()):
+        return
+    _stop_event.clear()
+    _reporter = threading.Thread(target=_report_loop, args=(DB_QUERY_STATS_LOG_MINUTES * 60,),
+                                 name="query-stats", daemon=True)
+    _reporter.start()
+
+def stop_query_stats_reporter():
+    """Stop the periodic reporter and log a final summary"""
+    global _reporter
+    _stop_event.set()
+    if _reporter is not None:
+        _reporter.join(5)
+        _reporter = None
+    log_query_stats()
@@ -0,0 +1,217 @@
+import asyncio
+import hashlib
+import heapq
+import itertools
+import time
+from typing import Any, Callable, Coroutine, Dict, List, Optional, Union
+
+from telegram.error import BadRequest, RetryAfter
+from telegram.ext import BaseRateLimiter
+
+from cache import LRUCache, MISSING
+from config import (
+    TELEGRAM_GLOBAL_PER_SECOND, TELEGRAM_CHAT_PER_SECOND, TELEGRAM_CHAT_BURST,
+    TELEGRAM_GROUP_CHAT_PER_MINUTE, TELEGRAM_MAX_RETRIES
+)
+
+# Priority classes, lowest first; pass rate_limit_args={"priority": ...} to a bot call.
+# Calls without one (answers to the user's own taps) are interactive.
+PRIORITY_INTERACTIVE = 0
+PRIORITY_FANOUT = 1
+PRIORITY_DOCUMENT = 2
+
+# Chats with a bucket at once; an evicted chat simply starts again with a full bucket
+MAX_CHAT_BUCKETS = 10000
+# Messages whose last sent content is remembered; an evicted one is simply edited again
+MAX_SENT_HASHES = 20000
+
+_sequence = itertools.count()
+
+# (chat_id, message_id) -> hash of the content last sent by a call passing
+# rate_limit_args={"content_hash": ...}. Any other edit or delete of the message
+# forgets it: the message may no longer show that content.
+_sent_hashes = LRUCache(MAX_SENT_HASHES)
+# (chat_id, message_id) -> sequence number of the last call on it that started, while in flight
+_last_message_call: Dict[tuple, int] = {}
+_edit_stats = {'skipped': 0}
+_MESSAGE_ENDPOINTS = ("editMessageText", "editMessageReplyMarkup", "editMessageCaption", "editMessageMedia", "deleteMessage")
+
+def content_hash(text: str, keyboard=None, parse_mode: Optional[str] = None) -> str:
+    """Hash of a rendered message (text, parse mode and inline keyboard)"""
+    markup = keyboard.to_json() if keyboard is not None else ""
+    return hashlib.sha1(f"{parse_mode}\0{text}\0{markup}".encode()).hexdigest()
+
+def _message_call_started(key: tuple) -> int:
+    _last_message_call[key] = seq = next(_sequence)
+    _sent_hashes.pop(key)
+    return seq
+
+def _message_call_finished(key: tuple, seq: int, shown: Optional[str]):
+    """Record shown (the hash the call left on the message, None if unknown) only if no
+    later call on the message started meanwhile: calls may finish in any order"""
+    latest = _last_message_call.get(key) == seq
+    if latest:
+        del _last_message_call[key]
+    if latest and shown:
+        _sent_hashes.set(key, shown)
+    else:
+        _sent_hashes.pop(key)
+
+def is_unchanged(chat_id, message_id, digest: str) -> bool:
+    """True if the message already shows this content, so the edit can be skipped (counted)"""
+    if _sent_hashes.get((int(chat_id), int(message_id))) != digest:
+        return False
+    _edit_stats['skipped'] += 1
+    return True
+
+class TokenBucket:
+    """rate tokens per second, holding at most capacity; waiters are served by priority.
+
+    Only the most urgent waiter (lowest priority, then arrival) may take a token,
+    so a document upload never gets ahead of a queued dashboard edit. Used from the
+    event loop only.
+    """
+
+    def __init__(self, rate: float, capacity: float):
+        self.rate = rate
+        self.capacity = max(1.0, capacity)
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self._waiting: List[tuple] = []
+        self._changed = asyncio.Event()
+
+    def _delay(self) -> float:
+        """Seconds until a token is available (0 if one is)"""
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        return 0.0 if self.tokens >= 1 else (1 - self.tokens) / self.rate
+
+    def _notify(self):
+        self._changed.set()
+        self._changed = asyncio.Event()
+
+    async def acquire(self, priority: int = PRIORITY_INTERACTIVE):
+        key = (priority, next(_sequence))
+        heapq.heappush(self._waiting, key)
+        try:
+            while True:
+                if self._waiting[0] != key:
+                    await self._changed.wait()
+                    continue
+                delay = self._delay()
+                if delay <= 0:
+                    self.tokens -= 1
+                    return
+                await asyncio.sleep(delay)
+        finally:
+            self._waiting.remove(key)
+            heapq.heapify(self._waiting)
+            self._notify()
+
+class TelegramRateLimiter(BaseRateLimiter[Dict[str, Any]]):
+    """Outbound scheduler for every Bot API call (set on the ApplicationBuilder).
+
+    Each call takes a token from its group chat's bucket (negative or @username
+    chat ids: TELEGRAM_GROUP_CHAT_PER_MINUTE), its chat's bucket
+    (TELEGRAM_CHAT_PER_SECOND, bursts of TELEGRAM_CHAT_BURST) and the global one
+    (TELEGRAM_GLOBAL_PER_SECOND), most restrictive first. A 429 pauses every call
+    for its retry_after, then the call is retried (TELEGRAM_MAX_RETRIES times).
+
+    Edits passing a content_hash (see content_hash()) record it for their message,
+    so is_unchanged() can spare the round trip of an identical edit.
+
+    rate_limit_args: {"priority": PRIORITY_*, "max_retries": n, "content_hash": h}, all optional.
+    """
+
+    def __init__(self):
+        self._global = TokenBucket(TELEGRAM_GLOBAL_PER_SECOND, TELEGRAM_GLOBAL_PER_SECOND)
+        self._chats = LRUCache(MAX_CHAT_BUCKETS)
+        self._groups = LRUCache(MAX_CHAT_BUCKETS)
+        # Monotonic time before which nothing is sent (set by a 429's retry_after)
+        self._paused_until = 0.0
+        self._stats = {'requests': 0, 'waited_ms': 0.0, 'retries': 0}
+
+    async def initialize(self) -> None:
+        pass
+
+    async def shutdown(self) -> None:
+        if self._stats['requests']:
+            print(f"📤 Telegram calls: {self.stats()}")
+
+    def _bucket(self, buckets: LRUCache, chat_id, rate: float) -> TokenBucket:
+        bucket = buckets.get(chat_id)
+        if bucket is MISSING:
+            bucket = TokenBucket(rate, TELEGRAM_CHAT_BURST)
+            buckets.set(chat_id, bucket)
+        return bucket
+
+    async def _acquire(self, chat_id, priority: int):
+        while (pause := self._paused_until - time.monotonic()) > 0:
+            await asyncio.sleep(pause)
+        if chat_id is not None:
+            if isinstance(chat_id, str) or chat_id < 0:
+                await self._bucket(self._groups, chat_id, TELEGRAM_GROUP_CHAT_PER_MINUTE / 60).acquire(priority)
+            await self._bucket(self._chats, chat_id, TELEGRAM_CHAT_PER_SECOND).acquire(priority)
+        await self._global.acquire(priority)
+
+    async def process_request(
+        self,
+        callback: Callable[..., Coroutine[Any, Any, Union[bool, Dict, List[Dict]]]],
+        args: Any,
+        kwargs: Dict[str, Any],
+        endpoint: str,
+        data: Dict[str, Any],
+        rate_limit_args: Optional[Dict[str, Any]],
+    ) -> Union[bool, Dict, List[Dict]]:
+        rate_limit_args = rate_limit_args or {}
+        priority = rate_limit_args.get("priority", PRIORITY_INTERACTIVE)
+        max_retries = rate_limit_args.get("max_retries", TELEGRAM_MAX_RETRIES)
+        chat_id = data.get("chat_id")
+        try:
+            chat_id = int(chat_id)
+        except (TypeError, ValueError):
+            pass
+        message_key = seq = None
+        if endpoint in _MESSAGE_ENDPOINTS and isinstance(chat_id, int) and data.get("message_id"):
+            message_key = (chat_id, int(data["message_id"]))
+            seq = _message_call_started(message_key)
+        digest = rate_limit_args.get("content_hash")
+        # Hash of what the message shows once this call is done (None: unknown)
+        shown = None
+
+        try:
+            for attempt in range(max_retries + 1):
+                started = time.monotonic()
+                await self._acquire(chat_id, priority)
+                self._stats['requests'] += 1
+                self._stats['waited_ms'] += (time.monotonic() - started) * 1000
+                try:
+                    result = await callback(*args, **kwargs)
+                    shown = digest
+                    return result
+                except BadRequest as e:
+                    if "Message is not modified" in str(e):
+                        shown = digest
+                    raise
+                except RetryAfter as e:
+                    if attempt == max_retries:
+                        print(f"❌ Telegram rate limit on {endpoint}, giving up after {max_retries} retries")
+                        raise
+                    retry_after = e.retry_after.total_seconds() if hasattr(e.retry_after, "total_seconds") else e.retry_after
+                    print(f"⏳ Telegram rate limit on {endpoint} (chat {chat_id}): pausing {retry_after}s")
+                    self._stats['retries'] += 1
+                    # Nothing is sent until Telegram accepts requests again, this call included
+                    self._paused_until = max(self._paused_until, time.monotonic() + retry_after + 0.1)
+        finally:
+            if message_key is not None:
+                _message_call_finished(message_key, seq, shown)
+
+    def stats(self) -> Dict[str, Any]:
+        """Calls sent, total time spent waiting for tokens, 429 retries and edits skipped as unchanged since startup"""
+        return {
+            'requests': self._stats['requests'],
+            'waited_ms': round(self._stats['waited_ms'], 1),
+            'retries': self._stats['retries'],
+            'edits_skipped': _edit_stats['skipped'],
+        }
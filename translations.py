@@ -152,6 +152,17 @@ TRANSLATIONS = {
         "en": "✅ **Bottle successfully deleted!** 🗑️\n\nDeleted: {}ml at {}",
         "he": "✅ **הבקבוק נמחק בהצלחה!** 🗑️\n\nנמחק: {}מ\"ל ב-{}"
     },
+    "btn_undo_delete": {"fr": "↩️ Annuler la suppression", "en": "↩️ Undo delete", "he": "↩️ בטל מחיקה"},
+    "undo_delete_success": {
+        "fr": "↩️ **Biberon restauré !**\n\nRestauré : {}ml à {}\n\n{}",
+        "en": "↩️ **Bottle restored!**\n\nRestored: {}ml at {}\n\n{}",
+        "he": "↩️ **הבקבוק שוחזר!**\n\nשוחזר: {}מ\"ל ב-{}\n\n{}"
+    },
+    "undo_delete_nothing": {
+        "fr": "❌ Aucun biberon supprimé à restaurer.",
+        "en": "❌ No deleted bottle to restore.",
+        "he": "❌ אין בקבוק שנמחק לשחזור."
+    },
     
     # Statistics
     "stats_title": {
@@ -330,6 +341,11 @@ TRANSLATIONS = {
         "en": "❌ **Invalid name**\n\nThe name must contain 3-20 characters and can only contain letters, numbers, spaces and dashes.\nPlease try again.",
         "he": "❌ **שם לא תקין**\n\nהשם חייב להכיל 3-20 תווים ויכול להכיל רק אותיות, מספרים, רווחים ומקפים.\nאנא נסה שוב."
     },
+    "rename_group_exists": {
+        "fr": "❌ **Nom déjà utilisé**\n\nLe groupe '{}' existe déjà.\nVeuillez choisir un autre nom.",
+        "en": "❌ **Name already used**\n\nThe group '{}' already exists.\nPlease choose another name.",
+        "he": "❌ **השם כבר בשימוש**\n\nהקבוצה '{}' כבר קיימת.\nאנא בחר שם אחר."
+    },
     "rename_group_success": {
         "fr": "✅ **Groupe renommé avec succès !**\n\nLe groupe a été renommé en `{}`\n\n{}",
         "en": "✅ **Group renamed successfully!**\n\nThe group has been renamed to `{}`\n\n{}",
@@ -512,12 +528,13 @@ TRANSLATIONS = {
 
     # PDF menu
     "pdf_menu": {
-        "fr": "📄 **Téléchargement PDF - Rapport Hebdomadaire**\n\nChoisissez la période pour votre rapport :\n\n• 📊 **7 derniers jours** - Rapport complet de la semaine\n• 📈 **30 derniers jours** - Vue d'ensemble mensuelle\n\nLe PDF contiendra :\n✅ Tous les biberons avec heures et quantités\n✅ Tous les changements de couche\n✅ Statistiques détaillées\n✅ **Courbe de consommation quotidienne** 📈\n✅ Traduction automatique des notes\n✅ Liste chronologique mixte\n\n🌍 **Langues disponibles :** Français, Anglais, Hebreu",
-        "en": "📄 **PDF Report Generation** 📊\n\nChoose the period for your report :\n\n• 📊 **7 last days** - Complete weekly report\n• 📈 **30 last days** - Monthly overview\n\nThe PDF will contain :\n✅ All bottles with hours and quantities\n✅ All diaper changes\n✅ Detailed statistics\n✅ **Daily consumption chart** 📈\n✅ Automatic translation of notes\n✅ Mixed chronological list\n\n🌍 **Available languages :** French, English, Hebrew",
-        "he": "📄 **יצירת דוח PDF** 📊\n\nבחר את התקופה עבור הדוח שלך:\n\n• 📊 **7 ימים אחרונים** - דוח שבועי מלא\n• 📈 **30 ימים אחרונים** - תצוגה מצומצמת חודשית\n\nה-PDF יכיל :\n✅ כל הבקבוקים עם שעות וכמויות\n✅ כל החלפות בקבוק\n✅ סטטיסטיקה מפורטת\n✅ **גרף צריכת יומית** 📈\n✅ תרגום אוטומטי של הערות\n✅ רשימה זמנית מעורבת\n\n🌍 **שפות זמינות :** צרפתית, אנגלית, עברית"
+        "fr": "📄 **Téléchargement PDF - Rapport Hebdomadaire**\n\nChoisissez la période pour votre rapport :\n\n• 📊 **7 derniers jours** - Rapport complet de la semaine\n• 📈 **30 derniers jours** - Vue d'ensemble mensuelle\n• 🗂️ **90 derniers jours** - Historique trimestriel\n\nLe PDF contiendra :\n✅ Tous les biberons avec heures et quantités\n✅ Tous les changements de couche\n✅ Statistiques détaillées\n✅ **Courbe de consommation quotidienne** 📈\n✅ Traduction automatique des notes\n✅ Liste chronologique mixte\n\n🌍 **Langues disponibles :** Français, Anglais, Hebreu",
+        "en": "📄 **PDF Report Generation** 📊\n\nChoose the period for your report :\n\n• 📊 **7 last days** - Complete weekly report\n• 📈 **30 last days** - Monthly overview\n• 🗂️ **90 last days** - Quarterly history\n\nThe PDF will contain :\n✅ All bottles with hours and quantities\n✅ All diaper changes\n✅ Detailed statistics\n✅ **Daily consumption chart** 📈\n✅ Automatic translation of notes\n✅ Mixed chronological list\n\n🌍 **Available languages :** French, English, Hebrew",
+        "he": "📄 **יצירת דוח PDF** 📊\n\nבחר את התקופה עבור הדוח שלך:\n\n• 📊 **7 ימים אחרונים** - דוח שבועי מלא\n• 📈 **30 ימים אחרונים** - תצוגה מצומצמת חודשית\n• 🗂️ **90 ימים אחרונים** - היסטוריה רבעונית\n\nה-PDF יכיל :\n✅ כל הבקבוקים עם שעות וכמויות\n✅ כל החלפות בקבוק\n✅ סטטיסטיקה מפורטת\n✅ **גרף צריכת יומית** 📈\n✅ תרגום אוטומטי של הערות\n✅ רשימה זמנית מעורבת\n\n🌍 **שפות זמינות :** צרפתית, אנגלית, עברית"
     },
     "pdf_menu_7_days": {"fr": "📊 7 derniers jours", "en": "📊 7 last days", "he": "📊 7 ימים אחרונים"},
     "pdf_menu_30_days": {"fr": "📈 30 derniers jours", "en": "📈 30 last days", "he": "📈 30 ימים אחרונים"},
+    "pdf_menu_90_days": {"fr": "🗂️ 90 derniers jours", "en": "🗂️ 90 last days", "he": "🗂️ 90 ימים אחרונים"},
     
     "pdf_lang_selection": {
         "fr": "🌍 **Sélection de la langue pour le rapport {days} jours**\n\nChoisissez la langue dans laquelle vous souhaitez générer le PDF :\n\n🇫🇷 **Français** - version française\n🇺🇸 **English** - version anglaise\n🇮🇱 **עברית** - גרסה עברית\n\n💡 Les notes personnalisées seront traduites automatiquement par IA.",
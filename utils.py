@@ -1,14 +1,19 @@
+import asyncio
 import json
 import os
+import weakref
 from dotenv import load_dotenv
-from datetime import datetime, time, timedelta
-from config import TEST_MODE
+from datetime import time, timedelta
+from time import perf_counter
+from config import TEST_MODE, GROUP_FANOUT_CONCURRENCY, GROUP_REFRESH_DEBOUNCE_MS, GROUP_REFRESH_MAX_DELAY_MS
 from zoneinfo import ZoneInfo
 from translations import t
-import threading
-from database import (
-    get_all_groups, create_group, set_user_message_info, get_user_message_info, clear_user_message_info, cleanup_old_data, update_group,
-    get_user_group_id, get_group_data_for_user, get_group_stats_for_user, get_group_by_id
+from rate_limiter import PRIORITY_FANOUT, content_hash, is_unchanged
+from outbox import is_transient, queue_failed_edit
+from database_async import (
+    get_all_groups, create_group, set_user_message_info, get_user_message_info, clear_user_message_info, update_group_members,
+    get_user_group_id, get_group_data_for_user, get_group_stats_for_user, get_daily_rollups_for_user,
+    find_group_id_by_name, get_group_members, discard_outbox_edit, GroupNameConflict
 )
 
 load_dotenv()
@@ -16,39 +21,39 @@ load_dotenv()
 DATA_FILE = "biberons.json" 
 MESSAGE_IDS_FILE = "message_ids.json"  # New file to store message IDs
 
-# Global variable to track last cleanup
-last_cleanup_date = None
-cleanup_lock = threading.Lock()
-
 # Only check for backup variables if we're not in test mode
 if not TEST_MODE:
     print("Running in production mode with SQLite database")
 
-def load_data():
-    """Load all groups data directly from database"""
-    return get_all_groups()
+async def load_data():
+    """Load all groups data directly from database (whole-database scan: maintenance only, not for handlers)"""
+    return await get_all_groups()
 
-def load_user_data(user_id: int):
+async def load_user_data(user_id: int):
     """Load data for a specific user directly from database"""
-    data = get_group_data_for_user(user_id)
+    data = await get_group_data_for_user(user_id)
     if data:
         # Format as expected by existing code
         return {str(data['id']): data}
     return {}
 
-def load_user_stats(user_id: int, days: int = 5):
+async def load_user_stats(user_id: int, days: int = 5):
     """Load statistics data for a specific user directly from database"""
-    return get_group_stats_for_user(user_id, days)
+    return await get_group_stats_for_user(user_id, days)
+
+async def load_user_rollups(user_id: int, days: int = 5):
+    """Load per-day totals (bottles, total_ml, poops) for a specific user's group, keyed by YYYY-MM-DD"""
+    return await get_daily_rollups_for_user(user_id, days)
 
 async def save_data(data, context):
     # With SQLite, data is saved immediately when operations are performed
     # This function is kept for compatibility but does nothing
     pass
 
-def find_group_for_user(data, user_id):
+async def find_group_for_user(data, user_id):
     """Return the group_id for the group containing the user_id, or None."""
     # Try optimized database query first
-    group_id = get_user_group_id(user_id)
+    group_id = await get_user_group_id(user_id)
     if group_id:
         return str(group_id)
     
@@ -59,39 +64,30 @@ def find_group_for_user(data, user_id):
     
     return None
 
-def create_personal_group(data, user_id : int):
+async def create_personal_group(data, user_id : int):
     group_name = f"group_{user_id}"
     
-    # First check if the group exists in the provided data
-    for group_id, group_info in data.items():
-        if group_info.get("name") == group_name:
-            # Ensure users are integers
-            int_users = []
-            for user in group_info.get('users', []):
-                try:
-                    int_users.append(int(user))
-                except (ValueError, TypeError):
-                    continue
-            
-            if user_id not in int_users:
-                group_info['users'].append(int(user_id))
-                update_group(int(group_id), group_info)
-            return group_id
+    # group_<id> names are reserved for that user (see create_group), so an existing one is
+    # this user's personal group: rejoin it (e.g. after leaving a shared group), history included
+    group_id = await find_group_id_by_name(group_name)
+    if group_id:
+        if user_id not in await get_group_members(group_id):
+            await update_group_members(group_id, add=[user_id])
+        return str(group_id)
     
-    # If not found in data, check database efficiently
-    group_id = get_user_group_id(user_id)
+    # Otherwise keep the group the user already belongs to
+    group_id = await get_user_group_id(user_id)
     if group_id:
-        # Group exists, add user if not already in
-        group_data = get_group_by_id(group_id)
-        if group_data:
-            group_users = group_data.get('users', [])
-            if user_id not in group_users:
-                group_data['users'].append(user_id)
-                update_group(group_id, group_data)
         return str(group_id)
     
     # Sinon, crée le groupe
-    new_group_id = create_group(group_name, user_id)
+    try:
+        new_group_id = await create_group(group_name, user_id)
+    except GroupNameConflict:
+        # Created concurrently for this same user: use that one
+        new_group_id = await find_group_id_by_name(group_name)
+        if new_group_id and user_id not in await get_group_members(new_group_id):
+            await update_group_members(new_group_id, add=[user_id])
     if new_group_id:
         print(f"Created personal group {group_name} with ID {new_group_id}")
         return str(new_group_id)
@@ -133,22 +129,19 @@ def is_valid_time(time_str: str) -> bool:
     except (ValueError, IndexError):
         return False
 
-def should_run_cleanup():
-    """Check if daily cleanup should run"""
-    global last_cleanup_date
-    current_date = datetime.now().date()
-    
-    if last_cleanup_date != current_date:
-        return True
-    return False
+def idempotency_key(update, kind: str) -> str:
+    """Key for a write triggered by this update: a redelivered update maps to the same key.
 
-def run_daily_cleanup():
-    """Run daily cleanup tasks"""
-    with cleanup_lock:  # ← Verrou déplacé ici pour protéger toute l'opération
-        if should_run_cleanup():
-            global last_cleanup_date
-            last_cleanup_date = datetime.now().date()
-            cleanup_old_data()
+    Flows store the key of the update that showed their last prompt, so that a
+    double tap on the prompt's buttons also writes only once. Keys are unique per
+    group (see add_entry_to_group) and include the user; the callback query id is
+    used when there is one, since update ids restart at a random value after a
+    week without updates.
+    """
+    user_id = update.effective_user.id if update.effective_user else 0
+    if update.callback_query:
+        return f"{kind}:{user_id}:q{update.callback_query.id}"
+    return f"{kind}:{user_id}:u{update.update_id}"
 
 async def delete_user_message(context, chat_id, message_id):
     """Delete a user message"""
@@ -171,27 +164,32 @@ async def update_main_message(context, message_text, keyboard, parse_mode="Markd
     # For text input or other cases, try stored message ID
     if not message_id or not chat_id:
         print("No message ID or chat ID found")
-        data = load_data()
-        group = find_group_for_user(data, user_id)
-        message_id, chat_id = get_user_message_info(group, user_id)
+        group = await get_user_group_id(user_id)
+        message_id, chat_id = await get_user_message_info(group, user_id)
         if not message_id or not chat_id:
             print("No message ID or chat ID found")
             return False
     
     if message_id and chat_id:
+        digest = content_hash(message_text, keyboard, parse_mode)
+        if is_unchanged(chat_id, message_id, digest):
+            # Already shows this content: no edit sent
+            group = await get_user_group_id(user_id)
+            await set_user_message_info(group, user_id, message_id, chat_id)
+            return True
         try:
             await context.bot.edit_message_text(
                 text=message_text,
                 chat_id=chat_id,
                 message_id=message_id,
                 reply_markup=keyboard,
-                parse_mode=parse_mode
+                parse_mode=parse_mode,
+                rate_limit_args={"content_hash": digest}
             )
             
             # SECURITY: Always re-save message info after successful update
-            data = load_data()
-            group = find_group_for_user(data, user_id)
-            set_group_message_info(data, group, user_id, message_id, chat_id)
+            group = await get_user_group_id(user_id)
+            await set_user_message_info(group, user_id, message_id, chat_id)
             print(f"🔒 Re-saved message info for user {user_id}: message_id={message_id}, chat_id={chat_id}")
             
             return True
@@ -199,9 +197,8 @@ async def update_main_message(context, message_text, keyboard, parse_mode="Markd
             error_msg = str(e)
             if "Message is not modified" in error_msg:
                 # SECURITY: Still re-save message info even if content unchanged
-                data = load_data()
-                group = find_group_for_user(data, user_id)
-                set_group_message_info(data, group, user_id, message_id, chat_id)
+                group = await get_user_group_id(user_id)
+                await set_user_message_info(group, user_id, message_id, chat_id)
                 print(f"🔒 Re-saved message info for user {user_id} (unchanged): message_id={message_id}, chat_id={chat_id}")
                 return True
             elif "message to edit not found" in error_msg or "message to edit not found" in repr(e):
@@ -213,18 +210,16 @@ async def update_main_message(context, message_text, keyboard, parse_mode="Markd
                     reply_markup=keyboard,
                     parse_mode=parse_mode
                 )
-                data = load_data()
-                group = find_group_for_user(data, user_id)
-                set_group_message_info(data, group, user_id, sent_message.message_id, sent_message.chat_id)
+                group = await get_user_group_id(user_id)
+                await set_user_message_info(group, user_id, sent_message.message_id, sent_message.chat_id)
                 context.user_data['main_message_id'] = sent_message.message_id
                 context.user_data['chat_id'] = sent_message.chat_id
                 print(f"🔒 Saved new message info for user {user_id}: message_id={sent_message.message_id}, chat_id={sent_message.chat_id}")
                 return True
             else:
                 # Clear invalid message ID
-                data = load_data()
-                group = find_group_for_user(data, user_id)
-                clear_group_message_info(data, group, user_id)
+                group = await get_user_group_id(user_id)
+                await clear_user_message_info(group, user_id)
                 context.user_data.pop('main_message_id', None)
                 context.user_data.pop('chat_id', None)
     return False
@@ -255,111 +250,237 @@ async def ensure_main_message_exists(update, context, data, group):
         return
     
     # SECURITY: Always save message info after creating new message
-    set_group_message_info(data, group, user_id, sent_message.message_id, sent_message.chat_id)
+    await set_group_message_info(data, group, user_id, sent_message.message_id, sent_message.chat_id)
     context.user_data['main_message_id'] = sent_message.message_id
     context.user_data['chat_id'] = sent_message.chat_id
     
     print(f"🔒 Saved new message info for user {user_id}: message_id={sent_message.message_id}, chat_id={sent_message.chat_id}")
 
-def get_group_message_info(data, group_id, user_id):
+async def get_group_message_info(data, group_id, user_id):
     """Get message ID and chat ID for a specific user in a group (by id)"""
-    return get_user_message_info(group_id, user_id)
+    return await get_user_message_info(group_id, user_id)
 
-def set_group_message_info(data, group_id, user_id, message_id, chat_id):
+async def set_group_message_info(data, group_id, user_id, message_id, chat_id):
     """Set message ID and chat ID for a specific user in a group (by id)"""
-    set_user_message_info(group_id, user_id, message_id, chat_id)
+    await set_user_message_info(group_id, user_id, message_id, chat_id)
 
-def clear_group_message_info(data, group_id, user_id):
+async def clear_group_message_info(data, group_id, user_id):
     """Clear message ID and chat ID for a specific user in a group (by id)"""
-    clear_user_message_info(group_id, user_id)
+    await clear_user_message_info(group_id, user_id)
 
 
-async def update_all_group_messages(context, group_id: int, message_text: str, keyboard, caller_user_id: int = None, parse_mode="Markdown"):
-    """Update all messages for all users in a group after data changes"""
+# Dashboard fan-out: members' messages are edited concurrently, at most
+# GROUP_FANOUT_CONCURRENCY at once across all groups, on a task detached from
+# the handler that made the change. Fan-outs of one group run in order, so an
+# older dashboard never overwrites a newer one.
+_fanout_semaphore = None
+_fanout_loop = None
+_group_fanout_locks = weakref.WeakValueDictionary()
+# Refresh coalescing: group_id -> (refresh task, perf_counter() of the first change
+# it carries, None once its fan-out has started)
+_group_refreshes = {}
+_refresh_stats = {'requested': 0, 'superseded': 0}
+# outcome -> [recipients, total ms, max ms]
+_fanout_stats = {}
+
+def _fanout_limit() -> asyncio.Semaphore:
+    """Semaphore of the running event loop (recreated if the loop changed)"""
+    global _fanout_semaphore, _fanout_loop
+    loop = asyncio.get_running_loop()
+    if _fanout_semaphore is None or _fanout_loop is not loop:
+        _fanout_semaphore, _fanout_loop = asyncio.Semaphore(max(1, GROUP_FANOUT_CONCURRENCY)), loop
+    return _fanout_semaphore
+
+def _record_fanout(outcome: str, ms: float):
+    stat = _fanout_stats.setdefault(outcome, [0, 0.0, 0.0])
+    stat[0] += 1
+    stat[1] += ms
+    stat[2] = max(stat[2], ms)
+
+def get_fanout_stats() -> dict:
+    """Per-outcome recipient count and latency (mean/max ms) of dashboard edits since startup"""
+    return {
+        outcome: {'recipients': count, 'mean_ms': round(total / count, 1), 'max_ms': round(max_ms, 1)}
+        for outcome, (count, total, max_ms) in _fanout_stats.items()
+    }
+
+def get_refresh_stats() -> dict:
+    """Group refreshes requested since startup, and how many a newer change superseded"""
+    return dict(_refresh_stats)
+
+async def _update_member_message(context, group_id: int, user_id: int, message_text: str, keyboard, parse_mode) -> str:
+    """Edit one member's dashboard and return the outcome"""
+    # Get message info for this user
+    message_info = await get_user_message_info(group_id, user_id)
+    if not message_info or len(message_info) < 2:
+        print(f"No message info found for user {user_id} in group {group_id}")
+        return "no_message"
+        
+    message_id, chat_id = message_info
+    if not message_id or not chat_id:
+        print(f"⚠️ Invalid message info for user {user_id}: message_id={message_id}, chat_id={chat_id}")
+        return "no_message"
+    
+    outcome = await _edit_member_message(context, group_id, user_id, chat_id, message_id, message_text, keyboard, parse_mode)
+    if outcome != "queued":
+        # A retry still queued for this message is older than this dashboard
+        await discard_outbox_edit(chat_id, message_id)
+    return outcome
+
+async def _edit_member_message(context, group_id: int, user_id: int, chat_id: int, message_id: int, message_text: str, keyboard, parse_mode) -> str:
+    digest = content_hash(message_text, keyboard, parse_mode)
+    if is_unchanged(chat_id, message_id, digest):
+        # Already shows this dashboard: no round trip
+        await set_user_message_info(group_id, user_id, message_id, chat_id)
+        return "skipped"
+    
     try:
-        print(f"caller_user_id: {caller_user_id}")
-        # Get all users in the group
-        data = load_data()
-        group_data = data.get(str(group_id))
-        if not group_data:
-            print(f"❌ No group data found for group {group_id}")
-            return
+        await context.bot.edit_message_text(
+            text=message_text,
+            chat_id=chat_id,
+            message_id=message_id,
+            reply_markup=keyboard,
+            parse_mode=parse_mode,
+            rate_limit_args={"priority": PRIORITY_FANOUT, "content_hash": digest}
+        )
         
-        users = group_data.get('users', [])
-        print(f"📊 Found {len(users)} users in group {group_id}")
+        # SECURITY: Re-save message info to ensure it's always up to date
+        # Even if the IDs haven't changed, this ensures the info is fresh
+        await set_user_message_info(group_id, user_id, message_id, chat_id)
+        return "updated"
         
-        # Update messages for all users in the group
-        for user_id in users:
-            print(f"Updating message for user {user_id} in group {group_id}")
-            # Skip the user who made the change
-            if caller_user_id is not None and user_id == caller_user_id:
-                print(f"⏭️ Skipping caller user {user_id}")
-                continue
-                
-            # Get message info for this user
-            message_info = get_group_message_info(data, str(group_id), user_id)
-            if not message_info or len(message_info) < 2:
-                print(f"No message info found for user {user_id} in group {group_id}")
-                continue
+    except Exception as e:
+        error_msg = str(e)
+        if "Message is not modified" in error_msg:
+            # Message content is identical, no need to modify
+            # SECURITY: Still re-save message info even if content unchanged
+            await set_user_message_info(group_id, user_id, message_id, chat_id)
+            return "unchanged"
+            
+        elif "message to edit not found" in error_msg:
+            # Message was deleted, clear the stored info
+            print(f"⚠️ Message not found for user {user_id} in group {group_id}, clearing stored info")
+            await clear_user_message_info(group_id, user_id)
+            return "cleared"
+        elif "Unsupported parse_mode" in error_msg:
+            # Try without parse_mode
+            try:
+                await context.bot.edit_message_text(
+                    text=message_text,
+                    chat_id=chat_id,
+                    message_id=message_id,
+                    reply_markup=keyboard,
+                    rate_limit_args={"priority": PRIORITY_FANOUT, "content_hash": content_hash(message_text, keyboard)}
+                )
+                # SECURITY: Re-save message info after successful update without parse_mode
+                await set_user_message_info(group_id, user_id, message_id, chat_id)
+                return "updated"
                 
-            message_id, chat_id = message_info
-            print(f"message_id: {message_id}, chat_id: {chat_id}")
+            except Exception as e2:
+                print(f"❌ Error updating message for user {user_id} in group {group_id} (without parse_mode): {e2}")
+                return "failed"
+        elif is_transient(e):
+            # Retried by the outbox worker, off this fan-out
+            print(f"❌ Error updating message for user {user_id} in group {group_id}: {e}")
+            await queue_failed_edit(group_id, user_id, chat_id, message_id, message_text, keyboard, parse_mode, e)
+            return "queued"
+        else:
+            print(f"❌ Error updating message for user {user_id} in group {group_id}: {e}")
+            return "failed"
+
+async def _timed_member_update(context, group_id: int, user_id: int, message_text: str, keyboard, parse_mode):
+    """One recipient of a fan-out: bounded, timed, and never raising"""
+    async with _fanout_limit():
+        started = perf_counter()
+        try:
+            outcome = await _update_member_message(context, group_id, user_id, message_text, keyboard, parse_mode)
+        except Exception as e:
+            print(f"❌ Error updating message for user {user_id} in group {group_id}: {e}")
+            outcome = "failed"
+        ms = (perf_counter() - started) * 1000
+    _record_fanout(outcome, ms)
+    print(f"{'✅' if outcome in ('updated', 'unchanged', 'skipped') else '⚠️'} Dashboard of user {user_id} in group {group_id}: "
+          f"{outcome} ({ms:.0f} ms)")
+    return outcome, ms
+
+def group_fanout_lock(group_id: int) -> asyncio.Lock:
+    """Lock held while a group's dashboards are edited (fan-outs and outbox retries)"""
+    lock = _group_fanout_locks.get(int(group_id))
+    if lock is None:
+        lock = _group_fanout_locks[int(group_id)] = asyncio.Lock()
+    return lock
+
+async def _fan_out_group_update(context, group_id: int, message_text: str, keyboard, caller_user_id: int, parse_mode):
+    try:
+        async with group_fanout_lock(group_id):
+            # Get all users in the group (indexed lookup, no group payload)
+            users = await get_group_members(int(group_id))
+            if not users:
+                print(f"❌ No group data found for group {group_id}")
+                return
             
-            if message_id and chat_id:
-                try:
-                    print(f"Updating message for user {user_id} in group {group_id} step 2")
-                    await context.bot.edit_message_text(
-                        text=message_text,
-                        chat_id=chat_id,
-                        message_id=message_id,
-                        reply_markup=keyboard,
-                        parse_mode=parse_mode
-                    )
-                    print(f"✅ Updated message for user {user_id} in group {group_id}")
-                    
-                    # SECURITY: Re-save message info to ensure it's always up to date
-                    # Even if the IDs haven't changed, this ensures the info is fresh
-                    set_group_message_info(data, str(group_id), user_id, message_id, chat_id)
-                    print(f"🔒 Re-saved message info for user {user_id}: message_id={message_id}, chat_id={chat_id}")
-                    
-                except Exception as e:
-                    error_msg = str(e)
-                    if "Message is not modified" in error_msg:
-                        # Message content is identical, no need to modify
-                        print(f"ℹ️ Message unchanged for user {user_id} in group {group_id}")
-                        
-                        # SECURITY: Still re-save message info even if content unchanged
-                        set_group_message_info(data, str(group_id), user_id, message_id, chat_id)
-                        print(f"🔒 Re-saved message info for user {user_id} (unchanged): message_id={message_id}, chat_id={chat_id}")
-                        
-                    elif "message to edit not found" in error_msg:
-                        # Message was deleted, clear the stored info
-                        print(f"⚠️ Message not found for user {user_id} in group {group_id}, clearing stored info")
-                        clear_group_message_info(data, str(group_id), user_id)
-                    elif "Unsupported parse_mode" in error_msg:
-                        # Try without parse_mode
-                        try:
-                            await context.bot.edit_message_text(
-                                text=message_text,
-                                chat_id=chat_id,
-                                message_id=message_id,
-                                reply_markup=keyboard
-                            )
-                            print(f"✅ Updated message for user {user_id} in group {group_id} (without parse_mode)")
-                            
-                            # SECURITY: Re-save message info after successful update without parse_mode
-                            set_group_message_info(data, str(group_id), user_id, message_id, chat_id)
-                            print(f"🔒 Re-saved message info for user {user_id} (no parse_mode): message_id={message_id}, chat_id={chat_id}")
-                            
-                        except Exception as e2:
-                            print(f"❌ Error updating message for user {user_id} in group {group_id} (without parse_mode): {e2}")
-                    else:
-                        print(f"❌ Error updating message for user {user_id} in group {group_id}: {e}")
-            else:
-                print(f"⚠️ Invalid message info for user {user_id}: message_id={message_id}, chat_id={chat_id}")
-        
-        print(f"💾 Updated all message info for group {group_id}")
-        
+            # Skip the user who made the change
+            recipients = [user_id for user_id in users if caller_user_id is None or user_id != caller_user_id]
+            if not recipients:
+                return
+            started = perf_counter()
+            results = await asyncio.gather(*[
+                _timed_member_update(context, group_id, user_id, message_text, keyboard, parse_mode)
+                for user_id in recipients
+            ])
+            updated = sum(1 for outcome, _ in results if outcome in ("updated", "unchanged", "skipped"))
+            slowest = max((ms for _, ms in results), default=0)
+            print(f"💾 Updated {updated}/{len(recipients)} dashboards of group {group_id} in "
+                  f"{(perf_counter() - started) * 1000:.0f} ms (slowest {slowest:.0f} ms)")
     except Exception as e:
         print(f"❌ Error in update_all_group_messages: {e}")
 
+async def _refresh_group_later(context, group_id: int, delay: float, message_text: str, keyboard, caller_user_id: int, parse_mode):
+    """Wait out the debounce window, then fan out (cancelled if a newer change comes first)"""
+    task = asyncio.current_task()
+    try:
+        if delay > 0:
+            await asyncio.sleep(delay)
+        if _group_refreshes.get(group_id, (None,))[0] is task:
+            # In flight: a change from now on opens a new window
+            _group_refreshes[group_id] = (task, None)
+        await _fan_out_group_update(context, group_id, message_text, keyboard, caller_user_id, parse_mode)
+    finally:
+        if _group_refreshes.get(group_id, (None,))[0] is task:
+            del _group_refreshes[group_id]
+
+async def update_all_group_messages(context, group_id: int, message_text: str, keyboard, caller_user_id: int = None, parse_mode="Markdown"):
+    """Update all messages for all users in a group after data changes.
+
+    Returns once the refresh is scheduled: the edits run on a task of the application,
+    after GROUP_REFRESH_DEBOUNCE_MS without a newer change to the group (at most
+    GROUP_REFRESH_MAX_DELAY_MS after the first one). A newer change cancels the
+    pending or running refresh and takes its place, so a burst of changes costs
+    one edit per member, with the latest dashboard.
+    """
+    group_id = int(group_id)
+    application = getattr(context, 'application', None)
+    if application is None or GROUP_REFRESH_DEBOUNCE_MS <= 0:
+        fan_out = _fan_out_group_update(context, group_id, message_text, keyboard, caller_user_id, parse_mode)
+        if application is None:
+            await fan_out
+        else:
+            application.create_task(fan_out, name=f"group-fanout-{group_id}")
+        return
+
+    _refresh_stats['requested'] += 1
+    now = perf_counter()
+    dirty_since = now
+    previous = _group_refreshes.get(group_id)
+    if previous is not None and not previous[0].done():
+        # Superseded: its members get this (newer) dashboard instead. Only this
+        # caller is skipped, earlier callers' own messages are older than it.
+        previous[0].cancel()
+        _refresh_stats['superseded'] += 1
+        if previous[1] is not None:
+            dirty_since = previous[1]
+    waited_ms = (now - dirty_since) * 1000
+    delay = max(0.0, min(GROUP_REFRESH_DEBOUNCE_MS, GROUP_REFRESH_MAX_DELAY_MS - waited_ms)) / 1000
+    refresh = _refresh_group_later(context, group_id, delay, message_text, keyboard, caller_user_id, parse_mode)
+    task = application.create_task(refresh, name=f"group-fanout-{group_id}")
+    _group_refreshes[group_id] = (task, dirty_since)